@@ -1,5 +1,6 @@
 import argparse
 import server.app as app
+from server.tasks.itask import ITask
 
 import logging
 import os
@@ -19,6 +20,13 @@ def get_ip():
     return ip
 
 
+def workers(value: str) -> int:
+    count = int(value)
+    if count < 1:
+        raise argparse.ArgumentTypeError("at least one worker is needed")
+    return count
+
+
 if __name__ == "__main__":
 
     # Formatter does not follow pep8
@@ -111,6 +119,36 @@ if __name__ == "__main__":
         help="bootstrap file if it does not exist it will be created.",
         default="bootstrap.txt",
     )
+    parser.add_argument(
+        "-s",
+        "--spool",
+        type=str,
+        help="directory of the harvest spool (default=spool next to the bootstrap file).",
+        default=None,
+    )
+
+    # worker threads of the scheduler lanes
+    parser.add_argument(
+        "-lw",
+        "--local_workers",
+        type=workers,
+        default=app.DEFAULT_LANE_WORKERS[ITask.LANE_LOCAL],
+        help=f"workers for local tasks (default={app.DEFAULT_LANE_WORKERS[ITask.LANE_LOCAL]}).",
+    )
+    parser.add_argument(
+        "-dw",
+        "--device_workers",
+        type=workers,
+        default=app.DEFAULT_LANE_WORKERS[ITask.LANE_DEVICE],
+        help=f"workers for device reads, e.g. the number of devices read at the same time (default={app.DEFAULT_LANE_WORKERS[ITask.LANE_DEVICE]}).",
+    )
+    parser.add_argument(
+        "-cw",
+        "--cloud_workers",
+        type=workers,
+        default=app.DEFAULT_LANE_WORKERS[ITask.LANE_CLOUD],
+        help=f"workers for uploads and other backend calls (default={app.DEFAULT_LANE_WORKERS[ITask.LANE_CLOUD]}).",
+    )
 
     args = parser.parse_args()
 
@@ -123,6 +161,9 @@ if __name__ == "__main__":
         args.host_port = args.web_port
     
 
+    if args.spool is None:
+        args.spool = os.path.join(os.path.dirname(os.path.abspath(args.bootstrap)), "spool")
+
     log.info("Running server service with the following configuration: %s", args)
 
     inverter = None
@@ -134,4 +175,9 @@ if __name__ == "__main__":
             args.inverter_type,
             args.inverter_address,
         )
-    app.main((args.host_ip, args.host_port), (args.web_host, args.web_port), inverter, args.bootstrap)
+    lane_workers = {
+        ITask.LANE_LOCAL: args.local_workers,
+        ITask.LANE_DEVICE: args.device_workers,
+        ITask.LANE_CLOUD: args.cloud_workers,
+    }
+    app.main((args.host_ip, args.host_port), (args.web_host, args.web_port), inverter, args.bootstrap, args.spool, lane_workers)
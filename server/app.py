@@ -1,7 +1,13 @@
+import asyncio
+import collections
+import heapq
+import inspect
+import itertools
 import queue
 import sys
 import logging
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
 from server.inverters.IComFactory import IComFactory
 from server.tasks.checkForWebRequestTask import CheckForWebRequest
@@ -17,6 +23,8 @@ from server.settings import DebouncedMonitorBase, ChangeSource
 from server.tasks.getSettingsTask import GetSettingsTask
 from server.tasks.saveSettingsTask import SaveSettingsTask
 from server.bootstrap import Bootstrap
+from server.spool import Spool
+from server.tasks.spoolDrainTask import SpoolDrainTask
 from server.web.socket.settings_subscription import GraphQLSubscriptionClient
 
 
@@ -25,86 +33,402 @@ from server.blackboard import BlackBoard
 logger = logging.getLogger(__name__)
 
 
-class TaskScheduler:
+class TaskHandle:
+    """Handle to a task queued in the TaskScheduler. Use it to cancel or reschedule the task while it is pending."""
+
+    def __init__(self, task: ITask, scheduler: "TaskScheduler"):
+        self.task = task
+        self.key = task.get_coalesce_key()
+        self._scheduler = scheduler
+        self._entry = None  # the heap entry [time, sequence, handle] while the task is pending
+
+    @property
+    def pending(self) -> bool:
+        return self._entry is not None
+
+    def cancel(self) -> bool:
+        """Remove the task from the scheduler, returns False if the task is no longer pending"""
+        return self._scheduler.cancel(self)
+
+    def reschedule(self, new_time: int) -> bool:
+        """Move the task to a new time, returns False if the task is no longer pending"""
+        return self._scheduler.reschedule(self, new_time)
+
+
+class Lane:
+    """A worker budget for one kind of task, e.g. device I/O. Due tasks wait in the ready queue until the lane has a free worker."""
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"lane-{name}")
+        self.active = 0
+        self.ready = collections.deque()
 
-    def __init__(self, max_workers, initial_tasks, bb):
+    def state(self) -> dict:
+        return {"workers": self.max_workers, "active": self.active, "queued": len(self.ready)}
+
+
+class RunningTask:
+    """A task that is executing on a lane worker, deadline is None if the task has no time budget"""
+
+    def __init__(self, task: ITask, lane: Lane, due_time: int, start_time: int):
+        self.task = task
+        self.lane = lane
+        self.due_time = due_time
+        budget = task.get_time_budget()
+        self.deadline = start_time + budget if budget is not None else None
+        self.abandoned = False
+
+
+class TaskScheduler:
+    """Runs tasks on per lane thread pools when they are due.
+    Each task declares a lane (see ITask.get_lane) and each lane has its own worker budget, so slow uploads in
+    the cloud lane can not delay device reads. Tasks in lanes that are not configured run in the local lane,
+    which gets max_workers workers unless configured otherwise.
+    Tasks where execute is a coroutine function are run on an event loop owned by the scheduler instead, so tasks
+    that mostly wait for I/O can overlap without holding a worker thread.
+    Pending tasks are kept in a heap of [time, sequence, handle] entries, the sequence number makes tasks due
+    at the same time run in the order they were added. Cancelled entries are left in the heap and skipped when
+    they reach the top, the heap is compacted when they make up more than half of it.
+    Tasks with a time budget (see ITask.get_time_budget) that overrun it are abandoned, the worker slot is handed to
+    a new thread, whatever the task returns when it eventually finishes is dropped and the tasks returned by
+    ITask.on_time_budget_exceeded are scheduled instead.
+    Tasks with a coalescing key (see ITask.get_coalesce_key) replace the pending task with the same key, the new
+    task takes the earlier of the two times so a steady stream of replacements can not postpone it forever. A task
+    that was created before the pending task, e.g. one that is retried, is dropped instead (see ITask.get_creation)."""
+
+    def __init__(self, max_workers, initial_tasks, bb, lanes: dict[str, int] | None = None):
         self.bb = bb
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
-        self.tasks = queue.PriorityQueue()
-        self.active_threads = 0
+        lane_workers = {ITask.LANE_LOCAL: max_workers}
+        lane_workers.update(lanes or {})
+        self.lanes = {name: Lane(name, workers) for name, workers in lane_workers.items()}
+        self.tasks = []  # heap of [time, sequence, handle]
+        self.pending = {}  # id(task) -> handle, for the tasks that are in the heap
+        self.coalesced = {}  # coalescing key -> handle of the pending task with that key
+        self.sequence = itertools.count()
+        self.removed = 0
+        self.active_coroutines = 0
+        self.running: list[RunningTask] = []
+        self.loop = None  # event loop for tasks with a coroutine execute, started on first use
+        self.loop_thread = None
         self.new_tasks_condition = threading.Condition()
         self.stop_event = threading.Event()
 
+        bb.scheduler_metrics.set_state_provider(self.state)
+        bb.set_task_listener(self._on_inbox_task)
+
         while initial_tasks.qsize() > 0:
-            self.tasks.put(initial_tasks.get())
+            self.add_task(initial_tasks.get())
 
-    
-    def add_task(self, task: ITask):
+    def add_task(self, task: ITask) -> TaskHandle:
+        """Queue a task, adding a task that is already pending moves it to its current time instead of queuing it twice"""
         with self.new_tasks_condition:
 
             if task.get_time() <= self.bb.time_ms():
                 logger.warning("Task (%s) is in the past by %d ms, adjusting time to now", task, self.bb.time_ms() - task.get_time())
                 task.adjust_time(self.bb.time_ms() + 100)
 
-            self.tasks.put(task)
+            handle = self.pending.get(id(task))
+            if handle is not None:
+                self._remove_entry(handle)
+            else:
+                handle = TaskHandle(task, self)
+                kept = self._coalesce(handle)
+                if kept is not handle:
+                    self.new_tasks_condition.notify()
+                    return kept
+            self._push(handle)
             self.new_tasks_condition.notify()
+            return handle
+
+    def cancel(self, handle: TaskHandle) -> bool:
+        with self.new_tasks_condition:
+            if not handle.pending:
+                return False
+            self._remove_entry(handle)
+            self._forget(handle)
+            self.new_tasks_condition.notify()
+            return True
+
+    def reschedule(self, handle: TaskHandle, new_time: int) -> bool:
+        with self.new_tasks_condition:
+            if not handle.pending:
+                return False
+            self._remove_entry(handle)
+            handle.task.adjust_time(new_time)
+            self._push(handle)
+            self.new_tasks_condition.notify()
+            return True
+
+    def _coalesce(self, handle: TaskHandle) -> TaskHandle:
+        """Keeps the latest created of the new task and the pending task with the same key, at the earlier of their
+        times. Returns the handle of the kept task, the new task is only pushed if it is kept"""
+        if handle.key is None:
+            return handle
+        pending = self.coalesced.get(handle.key)
+        if pending is None:
+            self.coalesced[handle.key] = handle
+            return handle
+        earliest = min(pending.task.get_time(), handle.task.get_time())
+        if pending.task.get_creation() > handle.task.get_creation():
+            # the new task is older, e.g. a retry of a task that a newer one with the key has since replaced
+            logger.debug("Dropping task (%s), pending task (%s) with key %s is newer", handle.task, pending.task,
+                         handle.key)
+            if earliest < pending.task.get_time():
+                self._remove_entry(pending)
+                pending.task.adjust_time(earliest)
+                self._push(pending)
+            return pending
+        logger.debug("Task (%s) replaces pending task (%s) with key %s", handle.task, pending.task, handle.key)
+        if earliest < handle.task.get_time():
+            handle.task.adjust_time(earliest)
+        self._remove_entry(pending)
+        self._forget(pending)
+        self.coalesced[handle.key] = handle
+        return handle
+
+    def _forget(self, handle: TaskHandle):
+        del self.pending[id(handle.task)]
+        if handle.key is not None and self.coalesced.get(handle.key) is handle:
+            del self.coalesced[handle.key]
+
+    def _push(self, handle: TaskHandle):
+        entry = [handle.task.get_time(), next(self.sequence), handle]
+        handle._entry = entry
+        self.pending[id(handle.task)] = handle
+        heapq.heappush(self.tasks, entry)
+
+    def _remove_entry(self, handle: TaskHandle):
+        handle._entry[2] = None
+        handle._entry = None
+        self.removed += 1
+        if self.removed > len(self.tasks) // 2:
+            self.tasks = [entry for entry in self.tasks if entry[2] is not None]
+            heapq.heapify(self.tasks)
+            self.removed = 0
+
+    def _peek(self) -> list | None:
+        """Returns the first live heap entry, dropping cancelled entries on the way"""
+        while self.tasks and self.tasks[0][2] is None:
+            heapq.heappop(self.tasks)
+            self.removed -= 1
+        return self.tasks[0] if self.tasks else None
+
+    def _pop(self) -> ITask:
+        handle = heapq.heappop(self.tasks)[2]
+        handle._entry = None
+        self._forget(handle)
+        return handle.task
 
     def stop(self):
         self.stop_event.set()
+        with self.new_tasks_condition:
+            self.new_tasks_condition.notify()
+
+    def _lane(self, task: ITask) -> Lane:
+        return self.lanes.get(task.get_lane(), self.lanes[ITask.LANE_LOCAL])
+
+    def lane_state(self) -> dict:
+        with self.new_tasks_condition:
+            return {name: lane.state() for name, lane in self.lanes.items()}
 
-    def worker(self, task: ITask):
+    def state(self) -> dict:
+        """Current load of the scheduler, reported with the scheduler metrics"""
+        with self.new_tasks_condition:
+            lanes = {name: lane.state() for name, lane in self.lanes.items()}
+            return {
+                "lanes": lanes,
+                "pending": len(self.pending),
+                "queued": sum(lane["queued"] for lane in lanes.values()),
+                "active_workers": sum(lane["active"] for lane in lanes.values()),
+                "active_coroutines": self.active_coroutines,
+            }
+
+    def worker(self, run: RunningTask):
+        task = run.task
+        start_time = self.bb.time_ms()
+        start_ns = time.monotonic_ns()
+        new_tasks = None
+        failed = False
+        stop = False
         try:
-            new_tasks = task.execute(self.bb.time_ms())
+            new_tasks = task.execute(start_time)
             if new_tasks is None:
                 new_tasks = []
         except StopIteration:
+            stop = True
+        except Exception as e:
+            logging.error(f"Failed to execute task {task}: {e}")
+            failed = True
+
+        self._record_execution(task, run.due_time, start_time, start_ns, failed)
+        if stop:
             logger.info("StopIteration received, stopping TaskScheduler")
             self.stop()
-            new_tasks = None
+
+        with self.new_tasks_condition:
+            if run.abandoned:
+                logger.warning("Abandoned task (%s) finished after %d ms, dropping its result", task, (time.monotonic_ns() - start_ns) // 1_000_000)
+                return
+            self.running.remove(run)
+            run.lane.active -= 1
+            self._add_new_tasks(new_tasks)
+            self.new_tasks_condition.notify()
+
+    async def async_worker(self, task: ITask, due_time: int):
+        """Runs a task with a coroutine execute on the event loop, it does not occupy a worker thread while it awaits.
+        A task that overruns its time budget is cancelled. A StopIteration raised in a coroutine turns into a
+        RuntimeError (PEP 479), so only tasks with a plain execute can stop the scheduler."""
+        start_time = self.bb.time_ms()
+        start_ns = time.monotonic_ns()
+        new_tasks = None
+        failed = False
+        budget = task.get_time_budget()
+        try:
+            new_tasks = await asyncio.wait_for(task.execute(start_time), budget / 1000 if budget is not None else None)
+            if new_tasks is None:
+                new_tasks = []
+        except asyncio.TimeoutError:
+            logger.warning("Task (%s) exceeded its time budget of %d ms and was cancelled", task, budget)
+            self.bb.scheduler_metrics.add_overrun(type(task).__name__)
+            new_tasks = self._on_time_budget_exceeded(task)
+            failed = True
         except Exception as e:
             logging.error(f"Failed to execute task {task}: {e}")
-            new_tasks = None
-            
+            failed = True
+
+        self._record_execution(task, due_time, start_time, start_ns, failed)
+        self._add_new_tasks(new_tasks)
+
+        with self.new_tasks_condition:
+            self.active_coroutines -= 1
+            self.new_tasks_condition.notify()
+
+    def _on_time_budget_exceeded(self, task: ITask):
+        try:
+            return task.on_time_budget_exceeded(self.bb.time_ms())
+        except Exception as e:
+            logging.error(f"Failed to handle exceeded time budget of task {task}: {e}")
+            return None
+
+    def _abandon(self, run: RunningTask):
+        """Give up on a task that overran its time budget. The lane gets a new executor so the hung thread no longer
+        counts against the lane's workers, the hung thread is left to finish on its own."""
+        logger.error("Task (%s) exceeded its time budget in lane %s, abandoning it", run.task, run.lane.name)
+        run.abandoned = True
+        self.running.remove(run)
+        self.bb.scheduler_metrics.add_overrun(type(run.task).__name__)
+
+        lane = run.lane
+        lane.executor.shutdown(wait=False)
+        lane.executor = ThreadPoolExecutor(max_workers=lane.max_workers, thread_name_prefix=f"lane-{lane.name}")
+        lane.active -= 1
+
+        # the handler may block on the device that hung, so it gets its own thread
+        def handle():
+            self._add_new_tasks(self._on_time_budget_exceeded(run.task))
+
+        threading.Thread(target=handle, name="TaskSchedulerWatchdog", daemon=True).start()
+
+    def _check_time_budgets(self, now: int) -> int | None:
+        """Abandon the running tasks that are past their deadline, returns the next deadline"""
+        next_deadline = None
+        for run in list(self.running):
+            if run.deadline is None:
+                continue
+            if run.deadline <= now:
+                self._abandon(run)
+            elif next_deadline is None or run.deadline < next_deadline:
+                next_deadline = run.deadline
+        return next_deadline
+
+    def _record_execution(self, task: ITask, due_time: int, start_time: int, start_ns: int, failed: bool):
+        duration_ms = (time.monotonic_ns() - start_ns) / 1_000_000
+        self.bb.scheduler_metrics.add_execution(type(task).__name__, start_time - due_time, duration_ms, failed)
+
+    def _add_new_tasks(self, new_tasks):
         if new_tasks is not None:
             if not isinstance(new_tasks, list):
                 new_tasks = [new_tasks]
-            new_tasks = new_tasks + self.bb.purge_tasks()
             for new_task in new_tasks:
                 self.add_task(new_task)
-        
+
+    def _on_inbox_task(self):
+        """Called by the blackboard when a task is added from any thread, wakes the main loop that moves it to the heap"""
         with self.new_tasks_condition:
-            self.active_threads -= 1
             self.new_tasks_condition.notify()
 
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.loop_thread = threading.Thread(target=self.loop.run_forever, name="TaskSchedulerLoop", daemon=True)
+            self.loop_thread.start()
+        return self.loop
+
+    def _release_due_tasks(self, now: int) -> list | None:
+        """Move the due tasks from the heap to their lane, coroutine tasks are started directly as they need no worker.
+        Returns the next pending heap entry."""
+        entry = self._peek()
+        while entry is not None and entry[0] <= now:
+            due_time = entry[0]
+            task = self._pop()
+            if inspect.iscoroutinefunction(task.execute):
+                asyncio.run_coroutine_threadsafe(self.async_worker(task, due_time), self._get_loop())
+                self.active_coroutines += 1
+            else:
+                self._lane(task).ready.append((task, due_time))
+            entry = self._peek()
+        return entry
+
+    def _dispatch_ready_tasks(self, now: int):
+        for lane in self.lanes.values():
+            while lane.ready and lane.active < lane.max_workers:
+                task, due_time = lane.ready.popleft()
+                run = RunningTask(task, lane, due_time, now)
+                self.running.append(run)
+                lane.executor.submit(self.worker, run)
+                lane.active += 1
+
+    def _close_loop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+            self.loop.close()
+            self.loop = None
+
     def main_loop(self):
-        while not self.stop_event.is_set():
-            with self.new_tasks_condition:
-                while (self.active_threads >= self.executor._max_workers) or self.tasks.empty() or self.tasks.queue[0].get_time() > self.bb.time_ms():
-                    if self.stop_event.is_set():
-                        break
-
-                    if not self.tasks.empty():
-                        # wake the loop up gain when the next task is due (note that it may wake up before that if a new task is added)
-                        delay = max(0, (self.tasks.queue[0].get_time() - self.bb.time_ms()) / 1000)
-                        self.new_tasks_condition.wait(delay)
-                    else:
-                        self.new_tasks_condition.wait()
-
-                if self.stop_event.is_set():
-                    break
-                
-                if not self.tasks.empty() and self.tasks.queue[0].get_time() <= self.bb.time_ms():
-                    task = self.tasks.get()
-                    self.executor.submit(self.worker, task)
-                    self.active_threads += 1
-
-
-def main_loop(tasks: queue.PriorityQueue, bb: BlackBoard):
-    scheduler = TaskScheduler(4, tasks, bb)
+        with self.new_tasks_condition:
+            while not self.stop_event.is_set():
+                for task in self.bb.purge_tasks():
+                    self.add_task(task)
+
+                now = self.bb.time_ms()
+                entry = self._release_due_tasks(now)
+                self._dispatch_ready_tasks(now)
+                deadline = self._check_time_budgets(now)
+                if entry is not None and (deadline is None or entry[0] < deadline):
+                    deadline = entry[0]
+
+                # wake up when the next task is due or a time budget runs out, a new task or a finishing worker wakes the loop up earlier
+                busy = len(self.running) > 0 or self.active_coroutines > 0
+                self.bb.clock.wait(self.new_tasks_condition, None if deadline is None else max(deadline - now, 0), busy)
+
+        self.bb.set_task_listener(None)
+        self._close_loop()
+
+
+# number of workers per lane, can be set from the command line
+DEFAULT_LANE_WORKERS = {ITask.LANE_LOCAL: 2, ITask.LANE_DEVICE: 4, ITask.LANE_CLOUD: 2}
+
+
+def main_loop(tasks: queue.PriorityQueue, bb: BlackBoard, lane_workers: dict[str, int] | None = None):
+    lanes = {**DEFAULT_LANE_WORKERS, **(lane_workers or {})}
+    scheduler = TaskScheduler(lanes[ITask.LANE_LOCAL], tasks, bb, lanes)
     scheduler.main_loop()
 
 
-def main(server_host: tuple[str, int], web_host: tuple[str, int], inverter: ModbusTCP.Setup | None = None, bootstrap_file: str | None = None): 
+def main(server_host: tuple[str, int], web_host: tuple[str, int], inverter: ModbusTCP.Setup | None = None, bootstrap_file: str | None = None, spool_dir: str | None = None, lane_workers: dict[str, int] | None = None): 
 
     from server.web.handler.get.crypto import Handler as CryptoHandler
     try:
@@ -114,6 +438,12 @@ def main(server_host: tuple[str, int], web_host: tuple[str, int], inverter: Modb
         crypto_state = {'error': 'no crypto key or chip'}
     bb = BlackBoard(crypto_state)
 
+    if spool_dir is not None:
+        try:
+            bb.spool = Spool(spool_dir)
+        except OSError as e:
+            logger.error("Failed to open the harvest spool in %s: %s", spool_dir, e)
+
     HarvestFactory(bb)  # this is what creates the harvest tasks when inverters are added
 
     logger.info("eGW version: %s", bb.get_version())
@@ -175,10 +505,12 @@ def main(server_host: tuple[str, int], web_host: tuple[str, int], inverter: Modb
 
     tasks.put(CheckForWebRequest(bb.time_ms() + 1000, bb, web_server))
     tasks.put(ScanWiFiTask(bb.time_ms() + 45000, bb))
+    if bb.spool is not None:
+        tasks.put(SpoolDrainTask(bb.time_ms() + 30000, bb))
     # tasks.put(CryptoReviveTask(bb.time_ms() + 7000, bb))
 
     try:
-        main_loop(tasks, bb)
+        main_loop(tasks, bb, lane_workers)
     except KeyboardInterrupt:
         pass
     except Exception as e:
@@ -190,6 +522,8 @@ def main(server_host: tuple[str, int], web_host: tuple[str, int], inverter: Modb
         web_server.close()
         graphql_client.stop()
         graphql_client.join()
+        if bb.spool is not None:
+            bb.spool.close()
         logger.info("Server stopped.")
 
 
@@ -1,10 +1,14 @@
 import random
-import time
+import threading
 import server.crypto.crypto as crypto
 from server.message import Message
 from server.tasks.itask import ITask
 from server.settings import Settings, ChangeSource
+from server.metrics import SchedulerMetrics
+from server.clock import Clock
+from server.spool import Spool
 import logging
+from typing import Callable
 from server.inverters.ICom import ICom
 
 logger = logging.getLogger(__name__)
@@ -17,6 +21,7 @@ class BlackBoard:
     the observers when the state changes.
     It also acts as a repository for messages, and created tasks.
     Tasks can be added to the blackboard and will be executed by the main loop. This makes it possible for non Task objects to create tasks.
+    add_task can be called from any thread, the task listener (the scheduler) is notified so the task is picked up right away.
     """
 
     _devices: "BlackBoard.Devices"
@@ -25,30 +30,50 @@ class BlackBoard:
     _rest_server_ip: str
     _messages: list[Message]
     _tasks: list[ITask]
+    _tasks_lock: threading.Lock
+    _task_listener: Callable[[], None] | None
     _chip_death_count: int
     _settings: Settings
     _crypto_state: dict
+    _scheduler_metrics: SchedulerMetrics
+    _clock: Clock
+    _spool: Spool | None
 
-    def __init__(self, crypto_state:dict = None):
+    def __init__(self, crypto_state:dict = None, clock: Clock = None):
+        self._clock = clock if clock is not None else Clock()
         self._devices = BlackBoard.Devices()
-        self._start_time = time.monotonic_ns()
+        self._start_time = self._clock.monotonic_ms()
         self._rest_server_port = 80
         self._rest_server_ip = "localhost"
         self._messages = []
         self._tasks = []
+        self._tasks_lock = threading.Lock()
+        self._task_listener = None
         self._chip_death_count = 0
         self._settings = Settings()
         self._settings.harvest.add_endpoint("https://mainnet.srcful.dev/gw/data/", ChangeSource.LOCAL)
         self._crypto_state = crypto_state if crypto_state is not None else {}
+        self._scheduler_metrics = SchedulerMetrics()
+        self._spool = None
 
     def add_task(self, task: ITask):
-        self._tasks.append(task)
-    
+        with self._tasks_lock:
+            self._tasks.append(task)
+        # notify outside the lock, the listener takes the scheduler lock and the scheduler purges while holding it
+        listener = self._task_listener
+        if listener is not None:
+            listener()
+
     def purge_tasks(self):
-        tasks = self._tasks
-        self._tasks = []
+        with self._tasks_lock:
+            tasks = self._tasks
+            self._tasks = []
         return tasks
 
+    def set_task_listener(self, listener: Callable[[], None] | None):
+        """Set the callback that is called when a task is added, it is called in the thread adding the task"""
+        self._task_listener = listener
+
     def _save_state(self):
         from server.tasks.saveStateTask import SaveStateTask
         self.add_task(SaveStateTask(self.time_ms() + 100, self))
@@ -84,6 +109,19 @@ class BlackBoard:
     def settings(self) -> Settings:
         return self._settings
 
+    @property
+    def scheduler_metrics(self) -> SchedulerMetrics:
+        return self._scheduler_metrics
+
+    @property
+    def spool(self) -> Spool | None:
+        """On-disk spool of harvests that have not been delivered, None if harvests are not spooled"""
+        return self._spool
+
+    @spool.setter
+    def spool(self, spool: Spool | None):
+        self._spool = spool
+
     @property
     def messages(self) -> tuple[Message]:
         return tuple(self._messages)
@@ -201,7 +239,7 @@ class BlackBoard:
 
     @property
     def elapsed_time(self):
-        return (time.monotonic_ns() - self._start_time) // 1_000_000
+        return self._clock.monotonic_ms() - self._start_time
 
     def get_version(self) -> str:
         return "0.13.2"
@@ -213,11 +251,19 @@ class BlackBoard:
 
         return "device: " + device_name + " serial: " + serial_number
 
+    @property
+    def clock(self) -> Clock:
+        return self._clock
+
     def time_ms(self):
-        return time.time_ns() // 1_000_000
+        return self._clock.time_ms()
 
     class Devices:
-        """Observable list of communication objects"""
+        """Observable list of communication objects, every device in the list is harvested independently.
+        Devices are addressed by an id made from their connection, e.g. the device query parameter of the REST api.
+        The id stays the same when a device is reopened, while its index in the list does not."""
+
+        ID_KEYS = (ICom.CONNECTION_KEY, "serial", "host", "port", "address")
 
         def __init__(self):
             self.lst = []
@@ -241,4 +287,36 @@ class BlackBoard:
                 for o in self._observers:
                     o.remove_device(device)
 
+        def get(self, index: int = 0) -> ICom | None:
+            """Returns the device at index or None if there is no such device"""
+            if 0 <= index < len(self.lst):
+                return self.lst[index]
+            return None
+
+        @staticmethod
+        def device_id(device: ICom) -> str:
+            """The id of the device, e.g. TCP:192.168.1.10:502:1, the profile is not part of it"""
+            config = device.get_config()
+            return ":".join(str(config[key]) for key in BlackBoard.Devices.ID_KEYS if key in config)
+
+        def get_by_id(self, device_id: str) -> ICom | None:
+            """Returns the device with the given id or None if there is no such device"""
+            for device in self.lst:
+                if BlackBoard.Devices.device_id(device) == device_id:
+                    return device
+            return None
+
+        def find(self, config: dict) -> ICom | None:
+            """Returns the first device with the given configuration or None"""
+            for device in self.lst:
+                if device.get_config() == config:
+                    return device
+            return None
+
+        def remove_by_config(self, config: dict):
+            """Disconnects and removes all devices with the given configuration, e.g. a closed instance of a device that is reopened"""
+            for device in [d for d in self.lst if d.get_config() == config]:
+                device.disconnect()
+                self.remove(device)
+
 
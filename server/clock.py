@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class Clock:
+    """Source of time for the blackboard and the task scheduler, all times are in milliseconds.
+    wait is how the scheduler sleeps until its next deadline, busy tells if any task is executing."""
+
+    def time_ms(self) -> int:
+        return time.time_ns() // 1_000_000
+
+    def monotonic_ms(self) -> int:
+        return time.monotonic_ns() // 1_000_000
+
+    def wait(self, condition: threading.Condition, timeout_ms: int | None, busy: bool) -> None:
+        """Wait on the condition (which must be held) for at most timeout_ms, None waits until notified"""
+        condition.wait(None if timeout_ms is None else timeout_ms / 1000)
+
+
+class VirtualClock(Clock):
+    """Simulated time that only moves when the scheduler has nothing to do.
+    When no task is executing the scheduler's wait advances the clock straight to the next deadline, so hours of
+    operation can be replayed in seconds. While tasks execute time stands still and the scheduler waits for them.
+    Tasks added from other threads use real time to get to the scheduler, so a simulation should only use tasks."""
+
+    def __init__(self, start_ms: int = 0):
+        self._lock = threading.Lock()
+        self._start_ms = start_ms
+        self._now_ms = start_ms
+
+    def time_ms(self) -> int:
+        with self._lock:
+            return self._now_ms
+
+    def monotonic_ms(self) -> int:
+        with self._lock:
+            return self._now_ms - self._start_ms
+
+    def advance(self, ms: int) -> None:
+        with self._lock:
+            self._now_ms += int(ms)
+
+    def wait(self, condition: threading.Condition, timeout_ms: int | None, busy: bool) -> None:
+        if busy or timeout_ms is None:
+            # a finishing task or a new task notifies the condition
+            condition.wait()
+        else:
+            self.advance(timeout_ms)
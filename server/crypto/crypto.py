@@ -235,11 +235,18 @@ class Chip:
         self._throw_on_error(code, "Failed to sign message")
         return signature
 
-    def build_jwt(self, data_2_sign, inverter_model:str, retries:int=0):
+    def build_jwt(self, data_2_sign, inverter_model:str, retries:int=0, header_fields:dict=None):
         self.ensure_chip_initialized()
-        header_base64 = jwtlify(self.build_header(inverter_model))
-
-        payload_base64 = jwtlify(data_2_sign)
+        header = self.build_header(inverter_model)
+        if header_fields is not None:
+            header.update(header_fields)
+        header_base64 = jwtlify(header)
+
+        # bytes are an already encoded (e.g. compressed) payload
+        if isinstance(data_2_sign, bytes):
+            payload_base64 = base64_url_encode(data_2_sign).decode("utf-8")
+        else:
+            payload_base64 = jwtlify(data_2_sign)
         header_and_payload = header_base64 + "." + payload_base64
 
         signature = self.get_signature(header_and_payload, retries)
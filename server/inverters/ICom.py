@@ -47,6 +47,28 @@ class ICom(ABC):
     def read_harvest_data(self, DER_TYPE, force_verbose) -> dict:
         pass
     
+    def set_verbose_refresh_cycles(self, cycles: int) -> bool:
+        """Spread the reading of the verbose registers over cycles harvests instead of reading them all at once,
+        0 only reads them when verbose is forced. Returns False if the device does not read them incrementally."""
+        return False
+
+    def get_static_registers(self) -> dict:
+        """The last values read of the static registers, e.g. model and serial number. They are only read once per
+        connection, so the harvest adds them to the first harvest of every barn."""
+        return {}
+
+    def supports_async(self) -> bool:
+        """True if the device implements read_harvest_data_async"""
+        return False
+
+    async def read_harvest_data_async(self, force_verbose) -> dict:
+        """Reads the harvest without blocking, awaited on the scheduler's event loop"""
+        raise NotImplementedError("Device does not support asynchronous reads")
+
+    def get_bus_stats(self) -> dict | None:
+        """Statistics of the bus the device shares with other devices, None if it has no shared bus"""
+        return None
+
     @abstractmethod
     def get_harvest_data_type(self) -> str:
         pass
@@ -1,5 +1,6 @@
 from .ModbusRTU import ModbusRTU
 from .ModbusTCP import ModbusTCP
+from .ModbusTCPAsync import ModbusTCPAsync
 from .ModbusSolarman import ModbusSolarman
 from .ModbusSunspec import ModbusSunspec
 from .ICom import ICom
@@ -22,6 +23,8 @@ class IComFactory:
         match config[0]:
             case ModbusTCP.CONNECTION:
                 return ModbusTCP.list_to_tuple(config)
+            case ModbusTCPAsync.CONNECTION:
+                return ModbusTCPAsync.list_to_tuple(config)
             case ModbusRTU.CONNECTION:
                 return ModbusRTU.list_to_tuple(config)
             case ModbusSolarman.CONNECTION:
@@ -38,6 +41,8 @@ class IComFactory:
         match config[ICom.CONNECTION_KEY]:
             case ModbusTCP.CONNECTION:
                 return ModbusTCP.dict_to_tuple(config)
+            case ModbusTCPAsync.CONNECTION:
+                return ModbusTCPAsync.dict_to_tuple(config)
             case ModbusRTU.CONNECTION:
                 return ModbusRTU.dict_to_tuple(config)
             case ModbusSolarman.CONNECTION:
@@ -67,6 +72,7 @@ class IComFactory:
         Args:
             config (tuple): Connection-specific arguments as a tuple:
                 ('TCP', host, port, inverter_type, slave_id)
+                ('TCP_ASYNC', host, port, inverter_type, slave_id)
                 ('RTU', port, baudrate, bytesize, parity, stopbits, inverter_type, slave_id)
                 ('SOLARMAN', host, serial, port, inverter_type, slave_id)
                 ('SUNSPEC', host, port, slave_id)
@@ -89,6 +95,8 @@ class IComFactory:
         match connection:
             case ModbusTCP.CONNECTION:
                 return ModbusTCP(connection_config)
+            case ModbusTCPAsync.CONNECTION:
+                return ModbusTCPAsync(connection_config)
             case ModbusRTU.CONNECTION:
                 return ModbusRTU(connection_config)
             case ModbusSolarman.CONNECTION:
@@ -1,10 +1,13 @@
-from .modbus import Modbus
+from .modbus import Modbus, ExceptionResponseError
 from .ICom import ICom
+from .busArbiter import BusArbiter
+from .connectionRegistry import ConnectionRegistry, SharedConnection
 from pymodbus.client import ModbusSerialClient as ModbusClient
 from pymodbus.pdu import ExceptionResponse
 from pymodbus.exceptions import ModbusIOException
 from pymodbus import pymodbus_apply_logging_config
 from typing_extensions import TypeAlias
+import contextlib
 import logging
 
 log = logging.getLogger(__name__)
@@ -29,6 +32,9 @@ class ModbusRTU(Modbus):
 
     CONNECTION = "RTU"
 
+    # the devices on the same serial port share one client through the arbiter of the bus
+    BUSES = ConnectionRegistry()
+
     def list_to_tuple(config: list) -> tuple:
         assert config[ICom.CONNECTION_IX] == ModbusRTU.CONNECTION, "Invalid connection type"
         port = config[1]
@@ -58,21 +64,37 @@ class ModbusRTU(Modbus):
         log.info("Creating with: %s" % str(setup))
         self.setup = setup
         self.client = None
+        self._bus: SharedConnection | None = None
         super().__init__()
 
     def _open(self, **kwargs) -> bool:
-        self._create_client(**kwargs)
-        if not self.client.connect():
-            log.error("FAILED to open inverter: %s", self._get_type())
+        if self._bus is None:
+            self._create_client(**kwargs)
+        with self._bus_request(BusArbiter.PRIORITY_WRITE):
+            # connect does nothing if another device on the bus already opened the port
+            if not self.client.connect():
+                log.error("FAILED to open inverter: %s", self._get_type())
             return bool(self.client.socket)
-        else:
-            return False
 
     def _is_open(self) -> bool:
-        return bool(self.client.socket)
+        return bool(self.client) and bool(self.client.socket)
     
     def _close(self) -> None:
-        self.client.close()
+        if self._bus is not None:
+            bus = self._bus
+            self._bus = None
+            self.client = None
+            arbiter: BusArbiter = bus.client
+            if arbiter.holder is self:
+                # a request of this device is still running, e.g. a read that hangs and is abandoned by the
+                # scheduler. It holds the bus, so the port is closed without waiting for the bus, which makes the
+                # request fail. The other devices open the port again with their next request.
+                log.warning("Closing bus %s under a running request", self._get_host())
+                arbiter.client.close()
+            # the port is closed when the last device on the bus lets go
+            ModbusRTU.BUSES.release(bus)
+        elif self.client is not None:
+            self.client.close()
 
     def _terminate(self) -> None:
         self._close()
@@ -136,30 +158,55 @@ class ModbusRTU(Modbus):
     
     def _get_backend_type(self) -> str:
         return self._get_type().lower()
+
+    def get_bus_stats(self) -> dict | None:
+        if self._bus is None:
+            return None
+        return self._bus.client.stats()
     
     def _create_client(self, **kwargs) -> None:
-        self.client = ModbusClient(
-            method="rtu",
-            port=self._get_host(),
-            baudrate=self._get_baudrate(),
-            bytesize=self._get_bytesize(),
-            parity=self._get_parity(),
-            stopbits=self._get_stopbits(),
-            **kwargs
-        )
+        def create_arbiter() -> BusArbiter:
+            client = ModbusClient(
+                method="rtu",
+                port=self._get_host(),
+                baudrate=self._get_baudrate(),
+                bytesize=self._get_bytesize(),
+                parity=self._get_parity(),
+                stopbits=self._get_stopbits(),
+                **kwargs
+            )
+            return BusArbiter(self._get_host(), client, self._get_baudrate(), self._get_bytesize(),
+                              self._get_parity(), self._get_stopbits())
+
+        self._bus = ModbusRTU.BUSES.acquire(self._get_host(), create_arbiter)
+        arbiter: BusArbiter = self._bus.client
+        if arbiter.baudrate != self._get_baudrate():
+            log.warning("Bus %s runs at %d baud, not at the %d baud of this device", self._get_host(),
+                        arbiter.baudrate, self._get_baudrate())
+        self.client = arbiter.client
+
+    def _bus_request(self, priority: int = BusArbiter.PRIORITY_READ):
+        """Holds the bus while talking to the device, so the frames of the devices on the bus do not collide"""
+        if self._bus is None:
+            return contextlib.nullcontext()
+        return self._bus.client.request(priority, self)
 
     def _read_registers(self, operation, scan_start, scan_range) -> list:
         resp = None
         
-        if operation == 0x04:
-            resp = self.client.read_input_registers(scan_start, scan_range, slave=self._get_address())
-        elif operation == 0x03:
-            resp = self.client.read_holding_registers(scan_start, scan_range, slave=self._get_address())
+        with self._bus_request():
+            if operation == 0x04:
+                resp = self.client.read_input_registers(scan_start, scan_range, slave=self._get_address())
+            elif operation == 0x03:
+                resp = self.client.read_holding_registers(scan_start, scan_range, slave=self._get_address())
 
         # Not sure why read_input_registers dose not raise an ModbusIOException but rather returns it
         # We solve this by raising the exception manually
         if isinstance(resp, ModbusIOException):
             raise ModbusIOException("Exception occurred while reading registers")
+
+        if isinstance(resp, ExceptionResponse):
+            raise ExceptionResponseError(str(resp))
         
         return resp.registers
     
@@ -167,9 +214,10 @@ class ModbusRTU(Modbus):
         """
         Write a range of holding registers from a start address
         """
-        resp = self.client.write_registers(
-            starting_register, values, slave=self._get_address()
-        )
+        with self._bus_request(BusArbiter.PRIORITY_WRITE):
+            resp = self.client.write_registers(
+                starting_register, values, slave=self._get_address()
+            )
         log.debug("OK - Writing Holdings: %s - %s", str(starting_register),  str(values))
         
         if isinstance(resp, ExceptionResponse):
@@ -1,11 +1,16 @@
-from .modbus import Modbus
+from .modbus import Modbus, ExceptionResponseError
 from .ICom import ICom
+from .readPlanner import ReadBlock
+from .connectionRegistry import ConnectionRegistry, SharedConnection
 from pymodbus.client import ModbusTcpClient as ModbusClient
 from pymodbus.pdu import ExceptionResponse
-from pymodbus.exceptions import ModbusIOException
+from pymodbus.exceptions import ConnectionException, ModbusIOException
 from pymodbus import pymodbus_apply_logging_config
 from typing_extensions import TypeAlias
+import contextlib
+import itertools
 import logging
+import struct
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
@@ -19,11 +24,23 @@ class ModbusTCP(Modbus):
     ip: string, IP address of the inverter,
     port: int, Port of the inverter,
     type: string, solaredge, huawei or fronius etc...,
-    address: int, Modbus address of the inverter
+    address: int, Modbus address of the inverter,
+    pipelined: bool, optional, send the reads of a harvest back to back without waiting for each reply
     """
 
 
     CONNECTION = "TCP"
+    PIPELINED_KEY = "pipelined"
+
+    MBAP_HEADER = struct.Struct(">HHHB")  # transaction id, protocol id, length, unit id
+    READ_REQUEST = struct.Struct(">HHHBBHH")  # MBAP header, function code, start register, number of registers
+    MAX_IN_FLIGHT = 8  # max number of outstanding requests
+    PIPELINE_TIMEOUT = 3.0  # seconds to wait for a reply before falling back to one read at a time
+    MAX_PIPELINE_FAILURES = 3  # pipelined harvests in a row that fail on the connection before pipelining is paused
+
+    # devices with different unit ids behind the same gateway share one connection, many gateways accept only
+    # one or two clients
+    CONNECTIONS = ConnectionRegistry()
 
     @staticmethod
     def list_to_tuple(config: list) -> tuple:
@@ -41,22 +58,34 @@ class ModbusTCP(Modbus):
         port = int(config["port"])
         inverter_type = config["type"]
         slave_id = int(config["address"])
+        if config.get(ModbusTCP.PIPELINED_KEY, False):
+            return (config[ICom.CONNECTION_KEY], ip, port, inverter_type, slave_id, True)
         return (config[ICom.CONNECTION_KEY], ip, port, inverter_type, slave_id)
         
-    Setup: TypeAlias = tuple[str | bytes | bytearray, int, str, int]
+    # Address, Port, type, Slave_ID, optionally pipelined
+    Setup: TypeAlias = tuple[str | bytes | bytearray, int, str, int] | tuple[str | bytes | bytearray, int, str, int, bool]
 
     def __init__(self, setup: Setup) -> None:
         log.info("Creating with: %s" % str(setup))
         self.setup = setup
         self.client = None
+        self._connection: SharedConnection | None = None
+        self._pipeline_supported = True  # cleared when the replies show the device does not handle pipelined reads
+        self._pipeline_failures = 0  # pipelined harvests in a row that failed on the connection
+        self._transaction_ids = itertools.count(1)
         super().__init__()
 
     def _open(self, **kwargs) -> bool:
         if not self._is_terminated():
-            self._create_client(**kwargs)
-            if not self.client.connect():
-                log.error("FAILED to open inverter: %s", self._get_type())
-            return bool(self.client.socket)
+            # a new connection, pipelining is tried again unless the device has shown it does not support it
+            self._pipeline_failures = 0
+            if self._connection is None:
+                self._create_client(**kwargs)
+            with self._connection_lock():
+                # connect does nothing if another device already opened the shared connection
+                if not self.client.connect():
+                    log.error("FAILED to open inverter: %s", self._get_type())
+                return bool(self.client.socket)
         else:
             return False
 
@@ -65,7 +94,20 @@ class ModbusTCP(Modbus):
 
     def _close(self) -> None:
         log.info("Closing client ModbusTCP")
-        self.client.close()
+        if self._connection is not None:
+            connection = self._connection
+            self._connection = None
+            self.client = None
+            if connection.holder is self:
+                # a request of this device is still running, e.g. a read that hangs and is abandoned by the scheduler.
+                # It holds the connection lock, so the socket is closed without the lock, which makes the request
+                # fail. The other devices connect again with their next request.
+                log.warning("Closing the connection to %s:%s under a running request", self._get_host(), self._get_port())
+                connection.client.close()
+            # the connection is closed when the last device on it lets go
+            ModbusTCP.CONNECTIONS.release(connection)
+        elif self.client is not None:
+            self.client.close()
 
     def _terminate(self) -> None:
         self._close()
@@ -78,8 +120,8 @@ class ModbusTCP(Modbus):
         if host is None:
             host = self._get_host()
 
-        return ModbusTCP((host, self._get_port(),
-                            self._get_type(), self._get_address()))
+        return type(self)((host, self._get_port(),
+                            self._get_type(), self._get_address()) + tuple(self.setup[4:]))
 
     def _get_host(self) -> str:
         return self.setup[0]
@@ -93,9 +135,12 @@ class ModbusTCP(Modbus):
     def _get_address(self) -> int:
         return self.setup[3]
 
+    def _is_pipelined(self) -> bool:
+        return len(self.setup) > 4 and bool(self.setup[4])
+
     def _get_config(self) -> tuple[str, str, int, str, int]:
         return (
-            ModbusTCP.CONNECTION,
+            self.CONNECTION,
             self._get_host(),
             self._get_port(),
             self._get_type(),
@@ -103,46 +148,168 @@ class ModbusTCP(Modbus):
         )
 
     def _get_config_dict(self) -> dict:
-        return {
-            ICom.CONNECTION_KEY: ModbusTCP.CONNECTION,
+        config = {
+            ICom.CONNECTION_KEY: self.CONNECTION,
             "type": self._get_type(),
             "address": self._get_address(),
             "host": self._get_host(),
             "port": self._get_port(),
         }
+        if self._is_pipelined():
+            config[ModbusTCP.PIPELINED_KEY] = True
+        return config
 
     def _get_backend_type(self) -> str:
         return self._get_type().lower()
 
     def _create_client(self, **kwargs) -> None:
-        self.client =  ModbusClient(host=self._get_host(), 
-                                    port=self._get_port(), 
-                                    unit_id=self._get_address(),
-                                    **kwargs
+        # the unit id is given with every request, so the client can be shared with the other unit ids
+        self._connection = ModbusTCP.CONNECTIONS.acquire(
+            (self._get_host(), self._get_port()),
+            lambda: ModbusClient(host=self._get_host(), port=self._get_port(), **kwargs)
         )
+        self.client = self._connection.client
+
+    def _connection_lock(self):
+        """Held while talking to the device, so the requests of the devices on a shared connection do not mix"""
+        if self._connection is None:
+            return contextlib.nullcontext()
+        return self._connection.use(self)
+
+    def _reopen_client(self) -> None:
+        """Replaces the socket after a request failed on it, a late reply to the failed request would otherwise be
+        taken for the reply of the next one. The other devices on a shared connection may be in the middle of a
+        harvest, so the client is connected again right away. Called with the connection lock held."""
+        if self.client is None:
+            # the device was disconnected while the request ran
+            return
+        log.warning("Reopening the connection to %s:%s", self._get_host(), self._get_port())
+        self.client.close()
+        self.client.connect()
 
     def _read_registers(self, operation, scan_start, scan_range) -> list:
         resp = None
         
-        if operation == 0x04:
-            resp = self.client.read_input_registers(scan_start, scan_range, slave=self._get_address())
-        elif operation == 0x03:
-            resp = self.client.read_holding_registers(scan_start, scan_range, slave=self._get_address())
-
-        # Not sure why read_input_registers dose not raise an ModbusIOException but rather returns it
-        # We solve this by raising the exception manually
-        if isinstance(resp, ModbusIOException):
-            raise ModbusIOException("Exception occurred while reading registers")
+        with self._connection_lock():
+            try:
+                if operation == 0x04:
+                    resp = self.client.read_input_registers(scan_start, scan_range, slave=self._get_address())
+                elif operation == 0x03:
+                    resp = self.client.read_holding_registers(scan_start, scan_range, slave=self._get_address())
+            except (ConnectionException, OSError):
+                self._reopen_client()
+                raise
+
+            # Not sure why read_input_registers dose not raise an ModbusIOException but rather returns it
+            # We solve this by raising the exception manually
+            if isinstance(resp, ModbusIOException):
+                self._reopen_client()
+                raise ModbusIOException("Exception occurred while reading registers")
+
+        if isinstance(resp, ExceptionResponse):
+            raise ExceptionResponseError(str(resp))
         
         return resp.registers
+
+    def _use_pipeline(self) -> bool:
+        return (
+            self._is_pipelined()
+            and self._pipeline_supported
+            and self._pipeline_failures < ModbusTCP.MAX_PIPELINE_FAILURES
+        )
+
+    def _read_blocks(self, blocks: list[ReadBlock]) -> list[list | None]:
+        if not (self._use_pipeline() and len(blocks) > 1 and self._is_open()):
+            return super()._read_blocks(blocks)
+
+        with self._connection_lock():
+            try:
+                values = self._read_blocks_pipelined(blocks)
+                self._pipeline_failures = 0
+                return values
+            except ValueError as e:
+                # a reply that does not belong to a request, the device mixes up pipelined requests
+                log.warning("Pipelined reads failed, reading one block at a time from now on: %s", e)
+                self._pipeline_supported = False
+            except OSError as e:
+                # a timeout or a dropped connection may just be the network, pipelining is tried again with the
+                # next harvest unless it keeps failing
+                self._pipeline_failures += 1
+                log.warning("Pipelined reads failed (%d in a row): %s", self._pipeline_failures, e)
+            # the connection may hold replies that were not read, so the socket is replaced
+            self._reopen_client()
+        return super()._read_blocks(blocks)
+
+    def _read_blocks_pipelined(self, blocks: list[ReadBlock]) -> list[list | None]:
+        """Sends up to MAX_IN_FLIGHT read requests back to back and matches the replies by transaction id,
+        so the reads of a harvest take about one round trip instead of one per block"""
+        sock = self.client.socket
+        timeout = sock.gettimeout()
+        sock.settimeout(ModbusTCP.PIPELINE_TIMEOUT)
+        results: list[list | None] = [None] * len(blocks)
+        try:
+            for first in range(0, len(blocks), ModbusTCP.MAX_IN_FLIGHT):
+                pending = {}
+                requests = bytearray()
+                for i in range(first, min(first + ModbusTCP.MAX_IN_FLIGHT, len(blocks))):
+                    block = blocks[i]
+                    transaction_id = next(self._transaction_ids) % 0x10000
+                    pending[transaction_id] = i
+                    requests += ModbusTCP.READ_REQUEST.pack(
+                        transaction_id, 0, 6, self._get_address(), block.operation, block.start_register, block.size
+                    )
+                sock.sendall(requests)
+
+                while pending:
+                    transaction_id, pdu = self._receive_frame(sock)
+                    if transaction_id not in pending:
+                        raise ValueError("unexpected transaction id %d" % transaction_id)
+                    i = pending.pop(transaction_id)
+                    try:
+                        results[i] = self._parse_read_response(pdu, blocks[i])
+                    except ExceptionResponseError as e:
+                        self._on_exception_response(blocks[i], e)
+        finally:
+            sock.settimeout(timeout)
+        log.debug("OK - Pipelined reading of %d blocks", len(blocks))
+        return results
+
+    @staticmethod
+    def _receive_exactly(sock, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by the device")
+            data += chunk
+        return bytes(data)
+
+    @staticmethod
+    def _receive_frame(sock) -> tuple[int, bytes]:
+        """Returns the transaction id and the PDU of the next reply"""
+        transaction_id, protocol_id, length, _ = ModbusTCP.MBAP_HEADER.unpack(
+            ModbusTCP._receive_exactly(sock, ModbusTCP.MBAP_HEADER.size)
+        )
+        if protocol_id != 0 or length < 2:
+            raise ValueError("invalid MBAP header")
+        return transaction_id, ModbusTCP._receive_exactly(sock, length - 1)
+
+    @staticmethod
+    def _parse_read_response(pdu: bytes, block: ReadBlock) -> list:
+        if pdu[0] & 0x80:
+            raise ExceptionResponseError("exception code %d" % pdu[1])
+        if pdu[0] != block.operation or pdu[1] != 2 * block.size or len(pdu) < 2 + 2 * block.size:
+            raise ValueError("reply does not match the read of %d - %d" % (block.start_register, block.size))
+        return list(struct.unpack_from(">%dH" % block.size, pdu, 2))
     
     def write_registers(self, starting_register, values) -> None:
         """
         Write a range of holding registers from a start address
         """
-        resp = self.client.write_registers(
-            starting_register, values, slave=self._get_address()
-        )
+        with self._connection_lock():
+            resp = self.client.write_registers(
+                starting_register, values, slave=self._get_address()
+            )
         log.debug("OK - Writing Holdings: %s - %s", str(starting_register),  str(values))
         
         if isinstance(resp, ExceptionResponse):
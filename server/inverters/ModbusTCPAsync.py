@@ -0,0 +1,143 @@
+from .ModbusTCP import ModbusTCP
+from .ICom import ICom
+from .readPlanner import ReadBlock
+from .connectionRegistry import AsyncConnectionRegistry, SharedConnection
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+import asyncio
+import contextlib
+import logging
+
+log = logging.getLogger(__name__)
+log.setLevel(logging.INFO)
+
+
+class ModbusTCPAsync(ModbusTCP):
+
+    """
+    Modbus TCP on the asyncio client of pymodbus, so the harvests of many devices can be read concurrently from the
+    event loop of the scheduler without holding a thread per read. The configuration is the same as ModbusTCP.
+
+    connect and the other ICom methods use the blocking client like ModbusTCP does. The first
+    read_harvest_data_async closes it and connects the asyncio client on the running loop, a device has only one
+    connection, so after that the device is read through read_harvest_data_async only.
+    Like the blocking clients, the asyncio clients of the devices behind one gateway share a connection and take
+    turns on it in the order they asked for it.
+    Every request has its own timeout, a request that times out only fails its block. When the device is pipelined
+    the blocks of a harvest are requested concurrently.
+    """
+
+    CONNECTION = "TCP_ASYNC"
+
+    REQUEST_TIMEOUT = 5.0  # seconds
+
+    ASYNC_CONNECTIONS = AsyncConnectionRegistry()
+
+    @staticmethod
+    def list_to_tuple(config: list) -> tuple:
+        assert config[ICom.CONNECTION_IX] == ModbusTCPAsync.CONNECTION, "Invalid connection type"
+        return (ModbusTCPAsync.CONNECTION,) + ModbusTCP.list_to_tuple([ModbusTCP.CONNECTION] + list(config[1:]))[1:]
+
+    @staticmethod
+    def dict_to_tuple(config: dict) -> tuple:
+        assert config[ICom.CONNECTION_KEY] == ModbusTCPAsync.CONNECTION, "Invalid connection type"
+        return (ModbusTCPAsync.CONNECTION,) + ModbusTCP.dict_to_tuple({**config, ICom.CONNECTION_KEY: ModbusTCP.CONNECTION})[1:]
+
+    def __init__(self, setup: ModbusTCP.Setup) -> None:
+        self.async_client = None
+        self._async_connection: SharedConnection | None = None
+        super().__init__(setup)
+
+    def _is_open(self) -> bool:
+        if self.async_client is not None:
+            return self.async_client.connected
+        return super()._is_open()
+
+    def _close(self) -> None:
+        if self._async_connection is not None:
+            log.info("Closing async client ModbusTCP")
+            # the connection is closed when the last device on it lets go
+            ModbusTCPAsync.ASYNC_CONNECTIONS.release(self._async_connection)
+            self._async_connection = None
+            self.async_client = None
+        elif self.async_client is not None:
+            self.async_client.close()
+            self.async_client = None
+        if self.client is not None:
+            super()._close()
+
+    async def _open_async(self) -> bool:
+        if self._is_terminated():
+            return False
+        if self.client is not None:
+            # the blocking connection is let go, the device is read through the asyncio connection from now on
+            super()._close()
+        if self._async_connection is None:
+            self._async_connection = ModbusTCPAsync.ASYNC_CONNECTIONS.acquire(
+                (self._get_host(), self._get_port()),
+                lambda: AsyncModbusTcpClient(
+                    self._get_host(), port=self._get_port(), timeout=ModbusTCPAsync.REQUEST_TIMEOUT, reconnect_delay=0
+                )
+            )
+            self.async_client = self._async_connection.client
+        async with self._async_lock():
+            # another device on the connection may have connected it already
+            if not self.async_client.connected:
+                await self.async_client.connect()
+        # a new connection, so the static registers are read again
+        self._static_blocks.clear()
+        if not self.async_client.connected:
+            log.error("FAILED to open async inverter: %s", self._get_type())
+        return self.async_client.connected
+
+    def _async_lock(self):
+        """Held while talking to the device, so the requests of the devices on a shared connection do not mix"""
+        if self._async_connection is None:
+            return contextlib.nullcontext()
+        return self._async_connection.lock
+
+    async def _read_block_async(self, block: ReadBlock) -> list | None:
+        if block.operation == 0x04:
+            request = self.async_client.read_input_registers(block.start_register, block.size, slave=self._get_address())
+        elif block.operation == 0x03:
+            request = self.async_client.read_holding_registers(block.start_register, block.size, slave=self._get_address())
+        else:
+            return None
+
+        try:
+            resp = await asyncio.wait_for(request, ModbusTCPAsync.REQUEST_TIMEOUT)
+        except (ModbusException, asyncio.TimeoutError) as e:
+            log.error("Exception occurred reading: %s - %s: %s", str(block.start_register), str(block.size), repr(e))
+            return None
+
+        if resp.isError():
+            self._on_exception_response(block, resp)
+            return None
+        return resp.registers
+
+    async def _read_blocks_async(self, blocks: list[ReadBlock]) -> list[list | None]:
+        if self._is_pipelined():
+            # the requests of the harvest are sent together, so the connection is held for the whole batch
+            async with self._async_lock():
+                return list(await asyncio.gather(*(self._read_block_async(block) for block in blocks)))
+        values = []
+        for block in blocks:
+            async with self._async_lock():
+                values.append(await self._read_block_async(block))
+        return values
+
+    # ICom methods
+
+    def supports_async(self) -> bool:
+        return True
+
+    async def read_harvest_data_async(self, force_verbose) -> dict:
+        if self._is_terminated():
+            raise Exception("readHarvestData() - inverter is terminated")
+        if self.async_client is None or not self.async_client.connected:
+            if not await self._open_async():
+                raise ConnectionError("readHarvestData() - could not connect")
+
+        layout = self._plan_harvest(force_verbose)
+        blocks = self._blocks_to_read(layout)
+        return self._scatter_harvest(layout, blocks, await self._read_blocks_async(blocks))
@@ -0,0 +1,108 @@
+# arbitration of the requests of the devices on one RS485 bus
+
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+
+
+class BusArbiter:
+    """Owns the serial client of one RS485 bus and lets one request at a time use it. Waiting requests are served by
+    priority and in arrival order within a priority, so a write is not stuck behind the harvests of the other
+    devices and no device is starved. Before a request the bus is kept silent for the Modbus RTU inter-frame gap of
+    3.5 characters after the previous frame, the gap is fixed at 1.75 ms above 19200 baud as the specification says.
+    The utilisation is the share of the time the bus was in use over about the last WINDOW_S seconds."""
+
+    PRIORITY_WRITE = 0
+    PRIORITY_READ = 1
+
+    FAST_BAUDRATE = 19200
+    FAST_FRAME_GAP_S = 0.00175
+    WINDOW_S = 60.0
+
+    @staticmethod
+    def frame_gap(baudrate: int, bytesize: int, parity: str, stopbits: float) -> float:
+        """The inter-frame gap in seconds"""
+        if baudrate > BusArbiter.FAST_BAUDRATE:
+            return BusArbiter.FAST_FRAME_GAP_S
+        bits = 1 + bytesize + (0 if parity == "N" else 1) + stopbits
+        return 3.5 * bits / baudrate
+
+    def __init__(self, port: str, client, baudrate: int, bytesize: int = 8, parity: str = "N", stopbits: float = 1,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.port = port
+        self.client = client
+        self.baudrate = baudrate
+        self.frame_gap_s = BusArbiter.frame_gap(baudrate, bytesize, parity, stopbits)
+        self.requests = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._condition = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []  # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._busy = False
+        self.holder = None  # the device whose request holds the bus
+        self._last_frame_end = None
+        self._window_start = clock()
+        self._window_busy_s = 0.0
+        self._previous_window = (0.0, 0.0)  # busy and elapsed seconds of the previous window
+
+    @contextlib.contextmanager
+    def request(self, priority: int = PRIORITY_READ, holder=None):
+        """Waits for the turn of the request and holds the bus while the block runs, yields the client"""
+        entry = (priority, next(self._tickets))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            while self._busy or self._waiting[0] != entry:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._busy = True
+            self.holder = holder
+
+        start = None
+        try:
+            if self._last_frame_end is not None:
+                silence = self._last_frame_end + self.frame_gap_s - self._clock()
+                if silence > 0:
+                    self._sleep(silence)
+            start = self._clock()
+            yield self.client
+        finally:
+            end = self._clock()
+            with self._condition:
+                if start is not None:
+                    self._add_busy(start, end)
+                    self._last_frame_end = end
+                    self.requests += 1
+                self._busy = False
+                self.holder = None
+                self._condition.notify_all()
+
+    def _add_busy(self, start: float, end: float):
+        self._window_busy_s += end - start
+        elapsed = end - self._window_start
+        if elapsed >= BusArbiter.WINDOW_S:
+            self._previous_window = (self._window_busy_s, elapsed)
+            self._window_start = end
+            self._window_busy_s = 0.0
+
+    def utilisation(self) -> float:
+        with self._condition:
+            busy = self._previous_window[0] + self._window_busy_s
+            elapsed = self._previous_window[1] + self._clock() - self._window_start
+        return min(busy / elapsed, 1.0) if elapsed > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "port": self.port,
+            "baudrate": self.baudrate,
+            "frame_gap_ms": self.frame_gap_s * 1000,
+            "utilisation": self.utilisation(),
+            "requests": self.requests,
+            "queued": len(self._waiting),
+        }
+
+    def close(self):
+        """Closes the port without waiting for the bus, a request that hangs holds the bus until its port is closed"""
+        self.client.close()
@@ -0,0 +1,108 @@
+# connections that are shared by the devices behind the same gateway or bus
+
+import asyncio
+import contextlib
+import logging
+import threading
+from typing import Callable, Hashable
+
+log = logging.getLogger(__name__)
+
+
+class FairLock:
+    """A lock that is handed to the waiting threads in the order they asked for it, so a device that reads often
+    can not starve the other devices on the same connection"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+
+    def acquire(self):
+        with self._condition:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while self._serving != ticket:
+                self._condition.wait()
+
+    def release(self):
+        with self._condition:
+            self._serving += 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class SharedConnection:
+    """A client that is shared by the devices that use the same connection, a device holds lock while it talks to
+    its unit id"""
+
+    def __init__(self, key: Hashable, client, lock=None):
+        self.key = key
+        self.client = client
+        self.lock = lock if lock is not None else FairLock()
+        self.references = 0
+        self.holder = None  # the device that holds lock
+
+    @contextlib.contextmanager
+    def use(self, holder):
+        """Holds lock while holder talks over the connection, yields the client"""
+        with self.lock:
+            self.holder = holder
+            try:
+                yield self.client
+            finally:
+                self.holder = None
+
+
+class ConnectionRegistry:
+    """Hands out one shared connection per key, e.g. (host, port). The connection is created for the first device
+    that acquires it and closed when the last device releases it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connections: dict[Hashable, SharedConnection] = {}
+
+    def _create_lock(self):
+        return FairLock()
+
+    def _close(self, connection: SharedConnection):
+        # not under the lock, a request that hangs holds it and closing the client is what makes the request fail
+        connection.client.close()
+
+    def acquire(self, key: Hashable, create_client: Callable) -> SharedConnection:
+        with self._lock:
+            connection = self._connections.get(key)
+            if connection is None:
+                connection = SharedConnection(key, create_client(), self._create_lock())
+                self._connections[key] = connection
+            elif connection.references > 0:
+                log.info("Sharing connection %s with %d devices", str(key), connection.references)
+            connection.references += 1
+            return connection
+
+    def release(self, connection: SharedConnection):
+        with self._lock:
+            connection.references -= 1
+            if connection.references > 0:
+                return
+            if self._connections.get(connection.key) is connection:
+                del self._connections[connection.key]
+        self._close(connection)
+
+    def get(self, key: Hashable) -> SharedConnection | None:
+        with self._lock:
+            return self._connections.get(key)
+
+
+class AsyncConnectionRegistry(ConnectionRegistry):
+    """A registry of asyncio clients, the lock of a connection is an asyncio.Lock that hands the connection to the
+    waiting coroutines in the order they asked for it. acquire is called on the event loop the clients run on."""
+
+    def _create_lock(self):
+        return asyncio.Lock()
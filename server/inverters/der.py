@@ -27,6 +27,21 @@ class DER:
     def read_harvest_data(self, force_verbose=False) -> dict:
         return self.com.read_harvest_data(force_verbose)
 
+    def get_static_registers(self) -> dict:
+        return self.com.get_static_registers()
+
+    def supports_async(self) -> bool:
+        return self.com.supports_async()
+
+    async def read_harvest_data_async(self, force_verbose=False) -> dict:
+        return await self.com.read_harvest_data_async(force_verbose)
+
+    def set_verbose_refresh_cycles(self, cycles: int) -> bool:
+        return self.com.set_verbose_refresh_cycles(cycles)
+
+    def get_bus_stats(self) -> dict | None:
+        return self.com.get_bus_stats()
+
     def get_harvest_data_type(self) -> str:
         return self.com.get_harvest_data_type()
     
@@ -11,6 +11,7 @@ class ProfileKey(Enum):
     DESCRIPTION = 'description'
     REGISTERS_VERBOSE = 'registers_verbose'
     REGISTERS = 'registers'
+    MAX_GAP = 'max_gap'
 
 
 class ProtocolKey(Enum):
@@ -21,6 +22,7 @@ class RegistersKey(Enum):
     FCODE = 'fcode'
     START_REGISTER = 'start_register'
     NUM_OF_REGISTERS = 'num_of_registers'
+    STATIC = 'static'
 
 
 class OperationKey(Enum):
@@ -1,18 +1,31 @@
 import logging
 from pymodbus.exceptions import ConnectionException, ModbusException, ModbusIOException
-from .supported_inverters.profiles import InverterProfiles, InverterProfile
+from .supported_inverters.profiles import InverterProfiles, InverterProfile, RegisterInterval
 from .ICom import ICom
+from .readPlanner import ReadPlanner, ReadBlock, HarvestLayout
 
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
 
+class ExceptionResponseError(ModbusException):
+    """The device answered a read with a Modbus exception response, e.g. illegal data address"""
+
+
 class Modbus(ICom):
     """Base class for all inverters."""
 
     def __init__(self):
         self._isTerminated = False  # this means the inverter is marked for removal it will not react to any requests
         self.profile: InverterProfile = InverterProfiles().get(self._get_type())
+        self.verbose_refresh_cycles = 0  # 0 reads the verbose registers only when verbose is forced
+        self._verbose_cycle = 0
+        self._static_blocks = set()  # static blocks read on this connection, (operation, start register, size)
+        self._static_registers = {}  # register -> last value read of the static registers
+        if self.profile is not None and self.profile.max_gap is not None:
+            self.read_planner = ReadPlanner(max_gap=self.profile.max_gap)
+        else:
+            self.read_planner = ReadPlanner()
         
     def _get_type(self) -> str:
         """Returns the inverter's type."""
@@ -68,30 +81,51 @@ class Modbus(ICom):
         if self._is_terminated():
             raise Exception("readHarvestData() - inverter is terminated")
 
-        regs = []
-        vals = []
+        layout = self._plan_harvest(force_verbose)
+        blocks = self._blocks_to_read(layout)
+        return self._scatter_harvest(layout, blocks, self._read_blocks(blocks))
 
+    def _plan_harvest(self, force_verbose) -> HarvestLayout:
+        """The reads and the layout of the next harvest"""
         registers = []
 
         if force_verbose or self.profile.verbose_always:
             registers = self.profile.get_registers_verbose()
+        elif self.verbose_refresh_cycles > 0:
+            # the normal registers are read every cycle
+            registers = self._verbose_blocks_for_cycle() + self.profile.get_registers()
+            self._verbose_cycle = (self._verbose_cycle + 1) % self.verbose_refresh_cycles
         else:
             registers = self.profile.get_registers()
-        
-        for entry in registers:
-            operation = entry.operation
-            scan_start = entry.start_register
-            scan_range = entry.offset
 
-            r = self._populate_registers(scan_start, scan_range)
-            # log.debug("OK - Populating Registers: %s", str(r))
-            v = self.read_registers(operation, scan_start, scan_range)
+        return self.read_planner.layout(registers)
+
+    def _blocks_to_read(self, layout: HarvestLayout) -> list[ReadBlock]:
+        # static registers are read and sent once per connection
+        return [b for b in layout.blocks if not (b.static and b.key in self._static_blocks)]
+
+    def _scatter_harvest(self, layout: HarvestLayout, blocks: list[ReadBlock], values: list[list | None]) -> dict:
+        """The harvest of the values read for the blocks, the registers of blocks that failed or were not read are
+        left out"""
+        layout.clear()
+        complete = len(blocks) == len(layout.blocks)
+
+        for block, v in zip(blocks, values):
+            if v is None or len(v) < block.size:
+                log.debug("Failed - Reading: %s - %s", str(block.start_register), str(block.size))
+                complete = False
+                continue
+
+            # Copy the values into the slots of their registers
+            block.scatter(v, layout.buffer)
 
-            regs += r
-            vals += v
+            if block.static:
+                self._static_blocks.add(block.key)
+                for slot, _, size in block.spans:
+                    for s in range(slot, slot + size):
+                        self._static_registers[layout.addresses[s]] = layout.buffer[s]
 
-        # Zip the registers and values together convert them into a dictionary
-        res = dict(zip(regs, vals))
+        res = layout.harvest(complete)
 
         log.debug("OK - Reading Harvest Data: %s", str(res))
 
@@ -100,12 +134,32 @@ class Modbus(ICom):
         else:
             raise Exception("readHarvestData() - res is empty")
 
-    def _populate_registers(self, scan_start, scan_range) -> list:
-        """
-        Populate a list of registers from a start address and a range
-        """
-        return [x for x in range(scan_start, scan_start + scan_range, 1)]
-    
+    def _verbose_blocks_for_cycle(self) -> list[RegisterInterval]:
+        """The verbose register blocks to read in this cycle, the blocks are spread evenly over the refresh cycles
+        so that every cycle takes about the same time and all blocks are read once per refresh"""
+        blocks = self.profile.get_registers_verbose()
+        cycle = self._verbose_cycle % self.verbose_refresh_cycles
+        return [block for i, block in enumerate(blocks) if (i * self.verbose_refresh_cycles) // len(blocks) == cycle]
+
+    def _read_blocks(self, blocks: list[ReadBlock]) -> list[list | None]:
+        """Reads the blocks one at a time, returns the values of each block, None or a short list if its read failed"""
+        values = []
+        for block in blocks:
+            try:
+                values.append(self.read_registers(block.operation, block.start_register, block.size))
+            except ExceptionResponseError as e:
+                self._on_exception_response(block, e)
+                values.append(None)
+        return values
+
+    def _on_exception_response(self, block: ReadBlock, error) -> None:
+        """A read of the block was answered with an exception, a merged read is split into its intervals so the
+        intervals the device has are read from the next harvest on"""
+        log.error("Exception response reading: %s - %s: %s", str(block.start_register), str(block.size), str(error))
+        if self.read_planner.split(block):
+            log.warning("Reading the %d intervals of %s - %s one at a time", len(block.intervals),
+                        str(block.start_register), str(block.size))
+
     def _read_registers(self) -> list:
         """Reads a range of registers from a start address."""
         raise NotImplementedError("Subclass must implement abstract method")
@@ -120,6 +174,10 @@ class Modbus(ICom):
             resp = self._read_registers(operation, scan_start, scan_range)
             log.debug("OK - Reading: %s - %s", str(scan_start), str(scan_range))
 
+        except ExceptionResponseError:
+            # the device answered, but rejected the read, the caller decides what to do about it
+            raise
+
         except ModbusException as me:
             # Decide whether to break or continue based on the type of ModbusException
             if isinstance(me, ConnectionException):
@@ -137,12 +195,14 @@ class Modbus(ICom):
     # ICom methods
     
     def connect(self) -> bool:
+        self._static_blocks.clear()
         return self._open()
     
     def disconnect(self) -> None:
         return self._terminate()
     
     def reconnect(self) -> bool:
+        self._static_blocks.clear()
         return self._close() and self._open()
     
     def is_open(self) -> bool:
@@ -151,6 +211,13 @@ class Modbus(ICom):
     def read_harvest_data(self, force_verbose) -> dict:
         return self._read_harvest_data(force_verbose)
     
+    def set_verbose_refresh_cycles(self, cycles: int) -> bool:
+        self.verbose_refresh_cycles = cycles
+        return cycles > 0
+
+    def get_static_registers(self) -> dict:
+        return dict(self._static_registers)
+
     def get_harvest_data_type(self) -> str:
         return self.data_type
     
@@ -0,0 +1,135 @@
+# compiles the register intervals of a profile into as few Modbus reads as possible
+
+from .supported_inverters.profiles import RegisterInterval
+
+
+class ReadBlock:
+    """One Modbus read and the register intervals of the profile it covers"""
+
+    def __init__(self, operation: int, start_register: int, size: int, static: bool):
+        self.operation = operation
+        self.start_register = start_register
+        self.size = size
+        self.static = static
+        self.intervals: list[RegisterInterval] = []
+        self.spans: list[tuple[int, int, int]] = []  # (slot in the layout, offset in the read, number of registers)
+
+    @property
+    def end_register(self) -> int:
+        return self.start_register + self.size
+
+    @property
+    def key(self) -> tuple:
+        return (self.operation, self.start_register, self.size)
+
+    def scatter(self, values: list, buffer: list) -> None:
+        """Copies the values of the read into their slots of the layout buffer, the gap registers are dropped"""
+        for slot, offset, size in self.spans:
+            if offset == 0 and size == len(values):
+                buffer[slot : slot + size] = values
+            else:
+                buffer[slot : slot + size] = values[offset : offset + size]
+
+
+class HarvestLayout:
+    """The reads of a list of intervals and the address of every register of the harvest. A harvest is built by
+    copying the values of each read into its slots of buffer, slots of blocks that were not read stay MISSING, so a
+    failed read leaves a hole instead of shifting the values of the following blocks."""
+
+    MISSING = None
+
+    def __init__(self, blocks: list[ReadBlock]):
+        self.blocks = blocks
+        slots: dict[int, int] = {}
+        for block in blocks:
+            registers = sorted({r for i in block.intervals for r in range(i.start_register, i.start_register + i.offset)})
+            for register in registers:
+                slot = slots.setdefault(register, len(slots))
+                offset = register - block.start_register
+                last = block.spans[-1] if block.spans else None
+                if last is not None and last[0] + last[2] == slot and last[1] + last[2] == offset:
+                    block.spans[-1] = (last[0], last[1], last[2] + 1)
+                else:
+                    block.spans.append((slot, offset, 1))
+        self.addresses = tuple(slots)
+        self.buffer = [HarvestLayout.MISSING] * len(self.addresses)
+        self._missing = (HarvestLayout.MISSING,) * len(self.addresses)
+
+    def clear(self):
+        """Marks every slot of the buffer as missing"""
+        self.buffer[:] = self._missing
+
+    def harvest(self, complete: bool) -> dict:
+        """The harvest in the buffer, without the missing registers unless every block was read"""
+        if complete:
+            return dict(zip(self.addresses, self.buffer))
+        return {a: v for a, v in zip(self.addresses, self.buffer) if v is not HarvestLayout.MISSING}
+
+
+class ReadPlanner:
+    """Merges register intervals that use the same function code into one read when they overlap, are adjacent or
+    are at most max_gap registers apart, as long as the read stays within max_registers. The registers in a gap are
+    read but not returned. Static intervals are only merged with other static intervals, so they can be skipped as a
+    whole once they are cached. Some devices answer a read that covers registers they do not have with an exception,
+    such a merged read is split back into its intervals and stays split."""
+
+    MAX_REGISTERS = 125  # max number of registers in one read holding/input registers request
+    MAX_GAP = 16
+
+    def __init__(self, max_gap: int = MAX_GAP, max_registers: int = MAX_REGISTERS):
+        self.max_gap = max_gap
+        self.max_registers = max_registers
+        self._layouts: dict[tuple, HarvestLayout] = {}
+        self._split: set[tuple] = set()  # keys of the merged reads the device rejected
+
+    def layout(self, intervals: list[RegisterInterval]) -> HarvestLayout:
+        """The reads and the harvest layout for the intervals, cached per list of intervals"""
+        key = tuple((i.operation, i.start_register, i.offset, i.static) for i in intervals)
+        layout = self._layouts.get(key)
+        if layout is None:
+            layout = HarvestLayout(self._compile(intervals))
+            self._layouts[key] = layout
+        return layout
+
+    def plan(self, intervals: list[RegisterInterval]) -> list[ReadBlock]:
+        """The reads for the intervals in address order"""
+        return self.layout(intervals).blocks
+
+    def split(self, block: ReadBlock) -> bool:
+        """Reads the intervals of the block one at a time from now on, returns False if there is nothing to split.
+        The layouts are compiled again when they are used next."""
+        if len(block.intervals) < 2 or block.key in self._split:
+            return False
+        self._split.add(block.key)
+        self._layouts.clear()
+        return True
+
+    def _compile(self, intervals: list[RegisterInterval]) -> list[ReadBlock]:
+        blocks: list[ReadBlock] = []
+        open_blocks: dict[tuple, ReadBlock] = {}
+        for interval in sorted(intervals, key=lambda i: (i.start_register, -i.offset)):
+            group = (interval.operation, interval.static)
+            block = open_blocks.get(group)
+            end = interval.start_register + interval.offset
+            if (
+                block is None
+                or interval.start_register - block.end_register > self.max_gap
+                or max(end, block.end_register) - block.start_register > self.max_registers
+            ):
+                block = ReadBlock(interval.operation, interval.start_register, interval.offset, interval.static)
+                open_blocks[group] = block
+                blocks.append(block)
+            else:
+                block.size = max(end, block.end_register) - block.start_register
+            block.intervals.append(interval)
+        return [part for block in blocks for part in self._split_block(block)]
+
+    def _split_block(self, block: ReadBlock) -> list[ReadBlock]:
+        if block.key not in self._split:
+            return [block]
+        parts = []
+        for interval in block.intervals:
+            part = ReadBlock(interval.operation, interval.start_register, interval.offset, interval.static)
+            part.intervals.append(interval)
+            parts.append(part)
+        return parts
@@ -14,10 +14,11 @@ with open("server/inverters/supported_inverters/inverters/inverters.json") as f:
 
 
 class RegisterInterval:
-    def __init__(self, operation, start_register, offset):
+    def __init__(self, operation, start_register, offset, static=False):
         self.operation = operation
         self.start_register = start_register
         self.offset = offset
+        self.static = static  # the registers never change, e.g. model, serial number and firmware version
 
 
 class InverterProfile:
@@ -31,6 +32,8 @@ class InverterProfile:
         self.display_name: str = inverter_profile[ProfileKey.DISPLAY_NAME.value]
         self.protocol: str = inverter_profile[ProfileKey.PROTOCOL.value]
         self.description: str = inverter_profile[ProfileKey.DESCRIPTION.value]
+        # max number of unused registers read to merge two intervals into one read, None for the default
+        self.max_gap: int | None = inverter_profile.get(ProfileKey.MAX_GAP.value)
 
         self.registers_verbose = []
         self.registers = []
@@ -40,7 +43,8 @@ class InverterProfile:
                 RegisterInterval(
                     register_interval[RegistersKey.FCODE.value],
                     register_interval[RegistersKey.START_REGISTER.value],
-                    register_interval[RegistersKey.NUM_OF_REGISTERS.value]
+                    register_interval[RegistersKey.NUM_OF_REGISTERS.value],
+                    register_interval.get(RegistersKey.STATIC.value, False)
                 )
             )
 
@@ -48,7 +52,8 @@ class InverterProfile:
             self.registers.append(
                 RegisterInterval(register_interval[RegistersKey.FCODE.value],
                                  register_interval[RegistersKey.START_REGISTER.value],
-                                 register_interval[RegistersKey.NUM_OF_REGISTERS.value])
+                                 register_interval[RegistersKey.NUM_OF_REGISTERS.value],
+                                 register_interval.get(RegistersKey.STATIC.value, False))
             )
 
     def get_registers_verbose(self) -> typing.List[RegisterInterval]:
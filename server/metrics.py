@@ -0,0 +1,99 @@
+import threading
+from bisect import bisect_left
+from typing import Callable, Optional
+
+
+class Histogram:
+    """Counts values in fixed buckets, a value is counted in the first bucket with an upper bound >= the value"""
+
+    BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+    def __init__(self, bounds: tuple = BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket counts everything above the last bound
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        buckets = {str(bound): count for bound, count in zip(self.bounds, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count > 0 else 0,
+            "max": self.max,
+            "buckets": buckets,
+        }
+
+
+class SchedulerMetrics:
+    """Collects per task class statistics from the TaskScheduler, all times are in milliseconds.
+    lateness is how long after the scheduled time a task was started, duration is how long execute took and
+    overruns is the number of times a task exceeded its time budget.
+    The scheduler registers a state provider that returns the current per lane worker and queue state.
+    Harvests report the achieved sample rate and jitter of their device as cadence and the utilisation of the
+    RS485 bus of their device as buses."""
+
+    class TaskMetrics:
+        def __init__(self):
+            self.lateness = Histogram()
+            self.duration = Histogram()
+            self.exceptions = 0
+            self.overruns = 0
+
+        def to_dict(self) -> dict:
+            return {
+                "lateness": self.lateness.to_dict(),
+                "duration": self.duration.to_dict(),
+                "exceptions": self.exceptions,
+                "overruns": self.overruns,
+            }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: dict[str, SchedulerMetrics.TaskMetrics] = {}
+        self._state_provider: Optional[Callable[[], dict]] = None
+        self._cadence: dict[str, dict] = {}
+        self._buses: dict[str, dict] = {}
+
+    def set_state_provider(self, provider: Callable[[], dict]):
+        self._state_provider = provider
+
+    def _task_metrics(self, task_name: str) -> "SchedulerMetrics.TaskMetrics":
+        if task_name not in self._tasks:
+            self._tasks[task_name] = SchedulerMetrics.TaskMetrics()
+        return self._tasks[task_name]
+
+    def add_execution(self, task_name: str, lateness_ms: float, duration_ms: float, failed: bool):
+        with self._lock:
+            metrics = self._task_metrics(task_name)
+            metrics.lateness.add(max(lateness_ms, 0))
+            metrics.duration.add(duration_ms)
+            if failed:
+                metrics.exceptions += 1
+
+    def add_overrun(self, task_name: str):
+        with self._lock:
+            self._task_metrics(task_name).overruns += 1
+
+    def set_harvest_cadence(self, device: str, stats: dict):
+        with self._lock:
+            self._cadence[device] = stats
+
+    def set_bus_stats(self, port: str, stats: dict):
+        with self._lock:
+            self._buses[port] = stats
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            tasks = {name: metrics.to_dict() for name, metrics in self._tasks.items()}
+            cadence = dict(self._cadence)
+            buses = dict(self._buses)
+        state = self._state_provider() if self._state_provider is not None else {}
+        return {"tasks": tasks, "cadence": cadence, "buses": buses, **state}
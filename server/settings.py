@@ -159,9 +159,23 @@ class Settings(Observable):
     
 
     class Harvest(Observable):
+        DEFAULT_SAMPLE_PERIOD_MS = 1000
+        DEFAULT_FLUSH_MAX_AGE_MS = 10000
+        DEFAULT_FLUSH_MAX_BYTES = 64 * 1024
+        DEFAULT_COMPRESSION_LEVEL = 6
+        COMPRESSION_LEVELS = {"deflate": (-1, 9), "zstd": (1, 22)}  # algorithm -> lowest and highest level
+        DEFAULT_VERBOSE_REFRESH_CYCLES = 10
+        MIN_SAMPLE_PERIOD_MS = 100
+
         def __init__(self, parent: Optional[Observable] = None):
             super().__init__(parent)
             self._endpoints = []
+            self._sample_period_ms = None  # None means the default, only set values are saved
+            self._delta_encoding = None
+            self._aligned_sampling = None
+            self._verbose_refresh_cycles = None
+            self._flush = {}  # endpoint -> {max_age_ms, max_bytes}, endpoints without an entry use the defaults
+            self._compression = {}  # endpoint -> {algorithm, level}, endpoints without an entry are not compressed
 
         @property
         def HARVEST(self):
@@ -171,20 +185,180 @@ class Settings(Observable):
         def ENDPOINTS(self):
             return "endpoints"
 
+        @property
+        def SAMPLE_PERIOD_MS(self):
+            return "sample_period_ms"
+
+        @property
+        def DELTA_ENCODING(self):
+            return "delta_encoding"
+
+        @property
+        def ALIGNED_SAMPLING(self):
+            return "aligned_sampling"
+
+        @property
+        def VERBOSE_REFRESH_CYCLES(self):
+            return "verbose_refresh_cycles"
+
+        @property
+        def FLUSH(self):
+            return "flush"
+
+        @property
+        def COMPRESSION(self):
+            return "compression"
+
+        @property
+        def ALGORITHM(self):
+            return "algorithm"
+
+        @property
+        def LEVEL(self):
+            return "level"
+
+        @property
+        def MAX_AGE_MS(self):
+            return "max_age_ms"
+
+        @property
+        def MAX_BYTES(self):
+            return "max_bytes"
+
         def update_from_dict(self, data: dict, source: ChangeSource ):
+            changed = False
             if self.ENDPOINTS in data:
                 self._endpoints = data[self.ENDPOINTS]
+                changed = True
+            if self.SAMPLE_PERIOD_MS in data:
+                self._sample_period_ms = data[self.SAMPLE_PERIOD_MS]
+                changed = True
+            if self.DELTA_ENCODING in data:
+                self._delta_encoding = data[self.DELTA_ENCODING]
+                changed = True
+            if self.ALIGNED_SAMPLING in data:
+                self._aligned_sampling = data[self.ALIGNED_SAMPLING]
+                changed = True
+            if self.VERBOSE_REFRESH_CYCLES in data:
+                self._verbose_refresh_cycles = data[self.VERBOSE_REFRESH_CYCLES]
+                changed = True
+            if self.FLUSH in data:
+                self._flush = data[self.FLUSH]
+                changed = True
+            if self.COMPRESSION in data:
+                self._compression = data[self.COMPRESSION]
+                changed = True
+            if changed:
                 self.notify_listeners(source)
                 
         def to_dict(self) -> dict:
-            return {
+            ret = {
                 self.ENDPOINTS: self._endpoints
             }
+            if self._sample_period_ms is not None:
+                ret[self.SAMPLE_PERIOD_MS] = self._sample_period_ms
+            if self._delta_encoding is not None:
+                ret[self.DELTA_ENCODING] = self._delta_encoding
+            if self._aligned_sampling is not None:
+                ret[self.ALIGNED_SAMPLING] = self._aligned_sampling
+            if self._verbose_refresh_cycles is not None:
+                ret[self.VERBOSE_REFRESH_CYCLES] = self._verbose_refresh_cycles
+            if len(self._flush) > 0:
+                ret[self.FLUSH] = self._flush
+            if len(self._compression) > 0:
+                ret[self.COMPRESSION] = self._compression
+            return ret
 
         @property
         def endpoints(self):
             return self._endpoints.copy()
 
+        @staticmethod
+        def _int_setting(value, default: int, minimum: int) -> int:
+            """The value raised to minimum, the default when it is not set or not an int, e.g. from the backend"""
+            if value is None:
+                return default
+            if isinstance(value, bool) or not isinstance(value, int):
+                logger.warning("Ignoring invalid harvest setting %s, using %s", repr(value), default)
+                return default
+            if value < minimum:
+                logger.warning("Harvest setting %s is below %s, using %s", value, minimum, minimum)
+                return minimum
+            return value
+
+        @property
+        def sample_period_ms(self) -> int:
+            """Target time between two harvests of a device in milliseconds, at least MIN_SAMPLE_PERIOD_MS"""
+            return self._int_setting(self._sample_period_ms, self.DEFAULT_SAMPLE_PERIOD_MS, self.MIN_SAMPLE_PERIOD_MS)
+
+        def set_sample_period_ms(self, period_ms: int | None, source: ChangeSource):
+            if period_ms != self._sample_period_ms:
+                self._sample_period_ms = period_ms
+                self.notify_listeners(source)
+
+        @property
+        def delta_encoding(self) -> bool:
+            """Send harvests as keyframes and the registers that changed in between, see tasks/harvestDelta.py"""
+            return bool(self._delta_encoding)
+
+        def set_delta_encoding(self, enabled: bool | None, source: ChangeSource):
+            if enabled != self._delta_encoding:
+                self._delta_encoding = enabled
+                self.notify_listeners(source)
+
+        @property
+        def aligned_sampling(self) -> bool:
+            """Harvest on the wall clock boundaries of the sample period, each harvest has its read start and end"""
+            return bool(self._aligned_sampling)
+
+        def set_aligned_sampling(self, enabled: bool | None, source: ChangeSource):
+            if enabled != self._aligned_sampling:
+                self._aligned_sampling = enabled
+                self.notify_listeners(source)
+
+        @property
+        def verbose_refresh_cycles(self) -> int:
+            """Number of harvests the verbose registers are spread over, 0 reads them all at the start of each barn"""
+            return self._int_setting(self._verbose_refresh_cycles, self.DEFAULT_VERBOSE_REFRESH_CYCLES, 0)
+
+        def set_verbose_refresh_cycles(self, cycles: int | None, source: ChangeSource):
+            if cycles != self._verbose_refresh_cycles:
+                self._verbose_refresh_cycles = cycles
+                self.notify_listeners(source)
+
+        def flush_policy(self, endpoint: str) -> tuple[int, int]:
+            """Max age in milliseconds of the oldest harvest and max estimated size in bytes of the harvests that
+            are kept before they are sent to the endpoint"""
+            policy = self._flush.get(endpoint, {})
+            return (self._int_setting(policy.get(self.MAX_AGE_MS), self.DEFAULT_FLUSH_MAX_AGE_MS, 0),
+                    self._int_setting(policy.get(self.MAX_BYTES), self.DEFAULT_FLUSH_MAX_BYTES, 0))
+
+        def set_flush_policy(self, endpoint: str, max_age_ms: int, max_bytes: int, source: ChangeSource):
+            policy = {self.MAX_AGE_MS: max_age_ms, self.MAX_BYTES: max_bytes}
+            if self._flush.get(endpoint) != policy:
+                self._flush = {**self._flush, endpoint: policy}
+                self.notify_listeners(source)
+
+        def compression(self, endpoint: str) -> tuple[str | None, int]:
+            """The compression algorithm (deflate or zstd, None for no compression) and level for the endpoint"""
+            policy = self._compression.get(endpoint, {})
+            algorithm = policy.get(self.ALGORITHM)
+            level = policy.get(self.LEVEL)
+            if level is None or algorithm not in self.COMPRESSION_LEVELS:
+                return algorithm, self.DEFAULT_COMPRESSION_LEVEL
+            lowest, highest = self.COMPRESSION_LEVELS[algorithm]
+            if isinstance(level, bool) or not isinstance(level, int) or not lowest <= level <= highest:
+                logger.warning("Ignoring invalid %s compression level %s, using %s", algorithm, repr(level),
+                               self.DEFAULT_COMPRESSION_LEVEL)
+                return algorithm, self.DEFAULT_COMPRESSION_LEVEL
+            return algorithm, level
+
+        def set_compression(self, endpoint: str, algorithm: str | None, level: int, source: ChangeSource):
+            policy = {self.ALGORITHM: algorithm, self.LEVEL: level}
+            if self._compression.get(endpoint) != policy:
+                self._compression = {**self._compression, endpoint: policy}
+                self.notify_listeners(source)
+
         def add_endpoint(self, endpoint: str, source: ChangeSource):
             if endpoint not in self._endpoints:
                 self._endpoints.append(endpoint)
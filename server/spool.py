@@ -0,0 +1,221 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+log = logging.getLogger(__name__)
+
+
+class Spool:
+    """Append-only on-disk queue of records, used to keep harvests until they have been delivered.
+    Records are stored in segment files named after the sequence number of their first record. A record is a fixed
+    little-endian header (payload length, crc32 of the payload, sequence number) followed by the payload, so a
+    segment can be walked in place through mmap. Appends are flushed and fsynced; a torn record at the end of the
+    last segment, e.g. after a power loss, is cut off when the spool is opened.
+    Delivered records are acked. The sequence number below which everything has been delivered is kept in the cursor
+    file and segments that are fully delivered are removed. Acks above the cursor are only kept in memory, so after a
+    restart those records are delivered again. Records appended by this process are claimed by the transport that
+    delivers them and are not returned by read until they are released, records from a previous run are free.
+    When the spool grows beyond max_bytes the oldest segments are dropped.
+    Records that can never be delivered, e.g. rejected by the endpoint, are moved to the dead letter file, in the same
+    record format, so the spool can move on and the records can still be looked at. The dead letter file is rotated
+    to one previous file when it grows beyond DEAD_LETTER_BYTES."""
+
+    HEADER = struct.Struct("<IIQ")
+    SEGMENT_SUFFIX = ".seg"
+    CURSOR_FILE = "cursor"
+    DEAD_LETTER_FILE = "dead_letter"
+    DEAD_LETTER_BYTES = 1024 * 1024
+    SEGMENT_BYTES = 1024 * 1024
+    MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, directory: str, max_bytes: int = MAX_BYTES, segment_bytes: int = SEGMENT_BYTES, fsync: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._segments: list[list] = []  # [first sequence number, path, size] oldest first
+        self._cursor = 0
+        self._acked: set[int] = set()
+        self._claimed: set[int] = set()
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    # recovery
+
+    def _recover(self):
+        self._cursor = self._read_cursor()
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(Spool.SEGMENT_SUFFIX))
+        next_seq = self._cursor
+        for name in names:
+            path = os.path.join(self.directory, name)
+            first_seq = int(name[: -len(Spool.SEGMENT_SUFFIX)])
+            size, last_seq = self._valid_size(path)
+            if size < os.path.getsize(path):
+                log.warning("Truncating torn spool segment %s at %d", path, size)
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+            if size == 0:
+                os.remove(path)
+                continue
+            self._segments.append([first_seq, path, size])
+            next_seq = max(next_seq, last_seq + 1)
+        self._next_seq = next_seq
+        self._remove_delivered_segments()
+        if self.pending() > 0:
+            log.info("Spool has %d undelivered records", self.pending())
+
+    def _valid_size(self, path: str) -> tuple[int, int]:
+        """The size of the segment up to the last valid record and the sequence number of that record"""
+        last_seq = -1
+        offset = 0
+        for offset, seq, _ in Spool._walk(path):
+            last_seq = seq
+        return offset, last_seq
+
+    @staticmethod
+    def _walk(path: str):
+        """Yields (end offset, sequence number, payload) for each valid record in a segment"""
+        if os.path.getsize(path) == 0:
+            return
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            offset = 0
+            while offset + Spool.HEADER.size <= len(data):
+                length, crc, seq = Spool.HEADER.unpack_from(data, offset)
+                start = offset + Spool.HEADER.size
+                if start + length > len(data):
+                    return
+                payload = data[start : start + length]
+                if zlib.crc32(payload) != crc:
+                    return
+                offset = start + length
+                yield offset, seq, payload
+
+    def _read_cursor(self) -> int:
+        try:
+            with open(os.path.join(self.directory, Spool.CURSOR_FILE)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_cursor(self):
+        path = os.path.join(self.directory, Spool.CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            f.write(str(self._cursor))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    # writing
+
+    def append(self, payload: bytes) -> int:
+        """Append a record, returns its sequence number. The record is claimed until it is acked or released."""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            record = Spool.HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload
+
+            if len(self._segments) == 0 or self._segments[-1][2] + len(record) > self.segment_bytes:
+                self._start_segment(seq)
+            elif self._file is None:
+                # continue the last segment from a previous run
+                self._file = open(self._segments[-1][1], "ab")
+            self._file.write(record)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._segments[-1][2] += len(record)
+            self._claimed.add(seq)
+            self._enforce_max_bytes()
+            return seq
+
+    def _start_segment(self, first_seq: int):
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, f"{first_seq:016d}{Spool.SEGMENT_SUFFIX}")
+        self._file = open(path, "ab")
+        self._segments.append([first_seq, path, 0])
+
+    def _enforce_max_bytes(self):
+        while len(self._segments) > 1 and sum(segment[2] for segment in self._segments) > self.max_bytes:
+            first_seq, path, _ = self._segments.pop(0)
+            log.warning("Spool is full, dropping records %d to %d", first_seq, self._segments[0][0] - 1)
+            os.remove(path)
+            self._advance_cursor(self._segments[0][0])
+
+    # reading and delivery
+
+    def read(self, max_records: int) -> list[tuple[int, bytes]]:
+        """Claims and returns up to max_records undelivered records as (sequence number, payload), oldest first"""
+        ret = []
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            for first_seq, path, _ in list(self._segments):
+                if len(ret) >= max_records:
+                    break
+                for _, seq, payload in Spool._walk(path):
+                    if seq < self._cursor or seq in self._acked or seq in self._claimed:
+                        continue
+                    self._claimed.add(seq)
+                    ret.append((seq, payload))
+                    if len(ret) >= max_records:
+                        break
+        return ret
+
+    def ack(self, seq: int):
+        """The record has been delivered"""
+        with self._lock:
+            self._claimed.discard(seq)
+            if seq < self._cursor:
+                return
+            self._acked.add(seq)
+            cursor = self._cursor
+            while cursor in self._acked:
+                self._acked.discard(cursor)
+                cursor += 1
+            if cursor != self._cursor:
+                self._advance_cursor(cursor)
+
+    def dead_letter(self, seq: int, payload: bytes):
+        """The record will never be delivered, it is moved to the dead letter file and acked"""
+        path = os.path.join(self.directory, Spool.DEAD_LETTER_FILE)
+        with self._lock:
+            if os.path.exists(path) and os.path.getsize(path) + Spool.HEADER.size + len(payload) > Spool.DEAD_LETTER_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "ab") as f:
+                f.write(Spool.HEADER.pack(len(payload), zlib.crc32(payload), seq) + payload)
+        self.ack(seq)
+
+    def release(self, seq: int):
+        """The record could not be delivered, it will be returned by read"""
+        with self._lock:
+            self._claimed.discard(seq)
+
+    def _advance_cursor(self, cursor: int):
+        self._cursor = max(self._cursor, cursor)
+        self._acked = {seq for seq in self._acked if seq >= self._cursor}
+        self._claimed = {seq for seq in self._claimed if seq >= self._cursor}
+        self._write_cursor()
+        self._remove_delivered_segments()
+
+    def _remove_delivered_segments(self):
+        # a segment is delivered when the next segment starts at or below the cursor, the last segment is kept open
+        while len(self._segments) > 1 and self._segments[1][0] <= self._cursor:
+            _, path, _ = self._segments.pop(0)
+            os.remove(path)
+
+    def pending(self) -> int:
+        """Number of records that have not been delivered"""
+        return max(self._next_seq - self._cursor - len(self._acked), 0)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
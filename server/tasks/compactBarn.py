@@ -0,0 +1,101 @@
+from array import array
+from collections.abc import MutableMapping
+
+
+class CompactBarn(MutableMapping):
+    """A barn, {harvest time: {register: value}}, that keeps harvests of 16-bit register values as array('H') rows.
+    Harvests with the same registers share one address index entry, so a row is only the values in the order of its
+    index entry. The times are kept in an array column. Harvests that are not 16-bit registers, e.g. SunSpec
+    dictionaries, are kept as they are. Reading a harvest or dict(barn) builds the {register: value} dicts on demand,
+    so the barn serialises to the same JSON as a plain dict barn.
+    A harvest can have the times its read started and ended, they are kept in columns and added to the harvest as
+    READ_START and READ_END when it is read.
+    The row of a time is looked up in a dict, so adding to a large barn does not scan the time column."""
+
+    READ_START = "read_start"
+    READ_END = "read_end"
+    NO_TIME = -1
+
+    def __init__(self):
+        self._times = array("q")
+        self._layouts = array("H")  # index of the address tuple of each row
+        self._read_starts = array("q")
+        self._read_ends = array("q")
+        self._rows: list[array | dict] = []
+        self._row_ids: dict[int, int] = {}  # time -> row
+        self._index: list[tuple] = []
+        self._index_ids: dict[tuple, int] = {}
+
+    def _layout(self, addresses: tuple) -> int:
+        layout = self._index_ids.get(addresses)
+        if layout is None:
+            layout = len(self._index)
+            self._index.append(addresses)
+            self._index_ids[addresses] = layout
+        return layout
+
+    def __setitem__(self, timestamp: int, harvest: dict):
+        try:
+            row = array("H", harvest.values())
+            layout = self._layout(tuple(harvest))
+        except (TypeError, OverflowError):
+            row = harvest
+            layout = 0
+
+        i = self._row_ids.get(timestamp)
+        if i is not None:
+            self._layouts[i] = layout
+            self._rows[i] = row
+            self._read_starts[i] = CompactBarn.NO_TIME
+            self._read_ends[i] = CompactBarn.NO_TIME
+        else:
+            self._times.append(timestamp)
+            self._row_ids[timestamp] = len(self._times) - 1
+            self._layouts.append(layout)
+            self._rows.append(row)
+            self._read_starts.append(CompactBarn.NO_TIME)
+            self._read_ends.append(CompactBarn.NO_TIME)
+
+    def _row(self, timestamp: int) -> int:
+        try:
+            return self._row_ids[timestamp]
+        except (KeyError, TypeError):
+            raise KeyError(timestamp) from None
+
+    def set_read_time(self, timestamp: int, start: int, end: int):
+        i = self._row(timestamp)
+        self._read_starts[i] = start
+        self._read_ends[i] = end
+
+    def __getitem__(self, timestamp: int) -> dict:
+        i = self._row(timestamp)
+        row = self._rows[i]
+        if isinstance(row, dict):
+            harvest = dict(row) if self._read_starts[i] != CompactBarn.NO_TIME else row
+        else:
+            harvest = dict(zip(self._index[self._layouts[i]], row))
+        if self._read_starts[i] != CompactBarn.NO_TIME:
+            harvest[CompactBarn.READ_START] = self._read_starts[i]
+            harvest[CompactBarn.READ_END] = self._read_ends[i]
+        return harvest
+
+    def __delitem__(self, timestamp: int):
+        i = self._row(timestamp)
+        del self._row_ids[timestamp]
+        del self._times[i]
+        del self._layouts[i]
+        del self._rows[i]
+        del self._read_starts[i]
+        del self._read_ends[i]
+        # the rows after the deleted one move up
+        for t in self._times[i:]:
+            self._row_ids[t] -= 1
+
+    def __iter__(self):
+        return iter(self._times)
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def __repr__(self) -> str:
+        return f"CompactBarn({dict(self)})"
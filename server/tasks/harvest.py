@@ -1,86 +1,199 @@
 
+import asyncio
 import logging
 from typing import List
 from server.tasks.openDevicePerpetualTask import DevicePerpetualTask
 from server.blackboard import BlackBoard
 from .task import Task
+from .itask import ITask
 from .harvestTransport import ITransportFactory
+from .harvestCadence import HarvestCadence
+from .harvestFlush import EndpointBarn
 from server.inverters.ICom import ICom
 
 log = logging.getLogger(__name__)
 
 
 class Harvest(Task):
+    TIME_BUDGET_MS = 60000  # a read that takes longer than this is considered hung
+
     def __init__(self, event_time: int, bb: BlackBoard, device: ICom, transport_factory: ITransportFactory):
         super().__init__(event_time, bb)
         self.device = device
-        self.barn = {}
-        
-        # incremental backoff stuff
-        self.min_backoff_time = 1000
-        self.backoff_time = self.min_backoff_time  # start with a 1-second backoff
-        self.max_backoff_time = 256000 # max ~4.3-minute backoff
+        self.barns: dict[str, EndpointBarn] = {}
+        self._update_endpoints()
+        self.cadence = HarvestCadence(bb.settings.harvest.sample_period_ms)
         self.transport_factory = transport_factory
 
-    def execute(self, event_time) -> Task | list[Task]:
+    def get_lane(self) -> str:
+        return ITask.LANE_DEVICE
+
+    def get_time_budget(self) -> int:
+        return Harvest.TIME_BUDGET_MS
 
-        start_time = event_time
-        elapsed_time_ms = 1000
+    def on_time_budget_exceeded(self, event_time) -> list[Task]:
+        log.error("Harvest is hanging, terminating inverter and issuing new reopen in 30 sec")
+        self.device.disconnect()
+        open_inverter = DevicePerpetualTask(event_time + 30000, self.bb, self.device.clone())
+        return [open_inverter] + self._create_transports(event_time, True)
 
+    def execute(self, event_time) -> Task | list[Task]:
         if not self.device.is_open():
             log.info("Inverter is terminated make the final transport if there is anything in the barn")
-            return self._create_transport(1, event_time, self.bb.settings.harvest._endpoints)
+            return self._create_transports(event_time, True)
+
+        force_verbose = self._prepare_read()
+        start_time = self.bb.time_ms()
         try:
-            harvest = self.device.read_harvest_data(force_verbose=len(self.barn) == 0)
-            end_time = self.bb.time_ms()
+            harvest = self.device.read_harvest_data(force_verbose=force_verbose)
+        except Exception as e:
+            return self._on_read_error(event_time, start_time, e)
+        return self._on_read(event_time, start_time, harvest)
+
+    def _prepare_read(self) -> bool:
+        """Picks up changes in the settings, returns whether the next read is verbose"""
+        # the period is read on every harvest so a change in the settings is picked up by running harvests
+        self.cadence.period_ms = self.bb.settings.harvest.sample_period_ms
+        self.cadence.aligned = self.bb.settings.harvest.aligned_sampling
+        self._update_endpoints()
+        if self.device.set_verbose_refresh_cycles(self.bb.settings.harvest.verbose_refresh_cycles) is True:
+            # the device reads the verbose registers a few at a time, only the first harvest reads all of them
+            return self.cadence.samples == 0
+        # every barn that is sent starts with a verbose harvest
+        return any(len(barn.barn) == 0 for barn in self.barns.values())
+
+    def _on_read(self, event_time: int, start_time: int, harvest: dict) -> Task | list[Task]:
+        scheduled_time = self.time
+        end_time = self.bb.time_ms()
+
+        elapsed_time_ms = end_time - start_time
+        log.debug("Harvest took %s ms", elapsed_time_ms)
+
+        if self.cadence.aligned:
+            timestamp = self.cadence.sample_time(start_time)
+            read_time = (start_time, end_time)
+        else:
+            timestamp = event_time
+            read_time = None
+        static = None
+        for barn in self.barns.values():
+            if len(barn.barn) == 0:
+                # the static registers are only read once per connection, every barn that is sent starts with them
+                if static is None:
+                    registers = self.device.get_static_registers()
+                    static = {**registers, **harvest} if isinstance(registers, dict) and registers else harvest
+                barn.add(timestamp, static, read_time)
+            else:
+                barn.add(timestamp, harvest, read_time)
+        self.time = self.cadence.on_success(scheduled_time, start_time, end_time)
 
-            elapsed_time_ms = end_time - start_time
-            log.debug("Harvest took %s ms", elapsed_time_ms)
+        return self._after_read(event_time, elapsed_time_ms)
 
-            self.min_backoff_time = max(elapsed_time_ms * 2, 1000)
+    def _on_read_error(self, event_time: int, start_time: int, e: Exception) -> Task | list[Task]:
 
-            self.barn[event_time] = harvest
+        # To-Do: Solarmanv5 can raise ConnectionResetError, so handle it!
 
-            self.backoff_time = max(self.backoff_time - self.backoff_time * 0.1, self.min_backoff_time)
-            self.backoff_time = min(self.backoff_time, self.max_backoff_time)
+        log.debug("Handling exeption reading harvest: %s", str(e))
 
-        except Exception as e:
-            
-            # To-Do: Solarmanv5 can raise ConnectionResetError, so handle it!
+        end_time = self.bb.time_ms()
 
-            log.debug("Handling exeption reading harvest: %s", str(e))
-            
-            end_time = self.bb.time_ms()
+        elapsed_time_ms = end_time - start_time
 
-            elapsed_time_ms = end_time - start_time
+        if self.cadence.at_max_backoff:
+            log.debug("Max timeout reached terminating inverter and issuing new reopen in 30 sec")
+            self.device.disconnect()
+            open_inverter = DevicePerpetualTask(event_time + 30000, self.bb, self.device.clone())
+            self.time = event_time + 10000
 
-            if self.backoff_time >= self.max_backoff_time:
-                log.debug("Max timeout reached terminating inverter and issuing new reopen in 30 sec")
-                self.device.disconnect()
-                open_inverter = DevicePerpetualTask(event_time + 30000, self.bb, self.device.clone())
-                self.time = event_time + 10000
+            # we return self so that in the next execute the last harvest will be transported
+            return [self, open_inverter]
 
-                # we return self so that in the next execute the last harvest will be transported
-                return [self, open_inverter]
-            else:
-                log.info("Incrementing backoff time to: %s", self.backoff_time)
-                self.backoff_time = min(self.backoff_time * 2, self.max_backoff_time)
-            
-        self.time = event_time + self.backoff_time
+        self.time = self.cadence.on_error(end_time)
+        log.info("Incrementing backoff time to: %s", self.cadence.backoff_ms)
+        return self._after_read(event_time, elapsed_time_ms)
+
+    def _after_read(self, event_time: int, elapsed_time_ms: int) -> Task | list[Task]:
+        self.bb.scheduler_metrics.set_harvest_cadence(self._device_key(), self.cadence.stats())
+        bus = self.device.get_bus_stats()
+        if isinstance(bus, dict):
+            self.bb.scheduler_metrics.set_bus_stats(bus["port"], bus)
 
         # check if it is time to transport the harvest
-        transport = self._create_transport(10, event_time + elapsed_time_ms * 2, self.bb.settings.harvest._endpoints)
+        transport = self._create_transports(event_time + elapsed_time_ms * 2, False, event_time)
         if len(transport) > 0:
             return [self] + transport
         return self
 
-    def _create_transport(self, limit: int, event_time: int, endpoints: list[str]) -> List[Task]:
+    def _device_key(self) -> str:
+        return str(self.device.get_config())
+
+    def _update_endpoints(self):
+        endpoints = self.bb.settings.harvest.endpoints
+        for endpoint in endpoints:
+            if endpoint not in self.barns:
+                self.barns[endpoint] = EndpointBarn(endpoint)
+        for endpoint in list(self.barns):
+            if endpoint not in endpoints:
+                log.info("Endpoint %s removed, dropping %d harvests", endpoint, len(self.barns[endpoint].barn))
+                del self.barns[endpoint]
+
+    def _create_transports(self, event_time: int, flush_all: bool, now: int = 0) -> List[Task]:
+        """Creates transports for the barns that are due, or for all barns with harvests if flush_all"""
         ret = []
-        if (len(self.barn) > 0 and len(self.barn) % limit == 0):
-            for endpoint in endpoints:
+        for endpoint, barn in self.barns.items():
+            max_age_ms, max_bytes = self.bb.settings.harvest.flush_policy(endpoint)
+            if len(barn.barn) > 0 and (flush_all or barn.should_flush(now, max_age_ms, max_bytes)):
                 log.info("Creating transport for %s", endpoint)
-                transport = self.transport_factory(event_time + 100, self.bb, self.barn, self.device)
+                transport = self.transport_factory(event_time + 100, self.bb, barn.take(), self.device)
                 transport.post_url = endpoint
-            self.barn = {}
-            ret.append(transport)
-        return ret
\ No newline at end of file
+                transport.on_latency = barn.add_latency
+                self._spool(transport)
+                ret.append(transport)
+        return ret
+
+    def _spool(self, transport: Task):
+        transport.spool(self._device_key())
+
+
+class HarvestAsync(Harvest):
+    """Harvest of a device that reads without blocking, the read is awaited on the scheduler's event loop so it
+    does not hold a worker thread and many devices can be read concurrently.
+    Spooling a barn waits for the disk, so the transports created on the event loop are spooled on a thread of the
+    loop's executor before execute returns them."""
+
+    def __init__(self, event_time: int, bb: BlackBoard, device: ICom, transport_factory: ITransportFactory):
+        super().__init__(event_time, bb, device, transport_factory)
+        self._unspooled: list[Task] = []
+
+    async def execute(self, event_time) -> Task | list[Task]:
+        ret = await self._execute(event_time)
+        if len(self._unspooled) > 0:
+            transports, self._unspooled = self._unspooled, []
+            await asyncio.get_running_loop().run_in_executor(None, self._spool_all, transports)
+        return ret
+
+    async def _execute(self, event_time) -> Task | list[Task]:
+        if not self.device.is_open():
+            log.info("Inverter is terminated make the final transport if there is anything in the barn")
+            return self._create_transports(event_time, True)
+
+        force_verbose = self._prepare_read()
+        start_time = self.bb.time_ms()
+        try:
+            harvest = await self.device.read_harvest_data_async(force_verbose=force_verbose)
+        except Exception as e:
+            return self._on_read_error(event_time, start_time, e)
+        return self._on_read(event_time, start_time, harvest)
+
+    def _spool(self, transport: Task):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # not on the event loop, e.g. the final transports of on_time_budget_exceeded
+            super()._spool(transport)
+            return
+        self._unspooled.append(transport)
+
+    def _spool_all(self, transports: list[Task]):
+        for transport in transports:
+            super()._spool(transport)
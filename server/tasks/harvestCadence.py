@@ -0,0 +1,86 @@
+import collections
+import math
+
+
+class HarvestCadence:
+    """Paces the harvest of a device at a target sample period.
+    Samples follow an ideal timeline of scheduled time + period, so the time a read takes does not push the next
+    sample later. If a read overruns one or more periods the missed slots are skipped instead of being read in a burst.
+    Failed reads use an exponential backoff that is kept apart from the timeline, after a successful read the
+    timeline starts over from that read. The achieved rate and jitter are calculated over the last samples.
+    When aligned, the timeline is the wall clock boundaries of the period, e.g. every full 10 seconds, so samples
+    from different devices and gateways are taken at the same time. The offset of the read start from the scheduled
+    time and the read duration are tracked as well."""
+
+    MIN_BACKOFF_MS = 1000
+    MAX_BACKOFF_MS = 256000  # max ~4.3-minute backoff
+    WINDOW = 100  # number of sample intervals used for the statistics
+
+    def __init__(self, period_ms: int, aligned: bool = False):
+        self.period_ms = period_ms
+        self.aligned = aligned
+        self.backoff_ms = 0  # 0 when the last read succeeded
+        self.max_backoff_ms = HarvestCadence.MAX_BACKOFF_MS
+        self.samples = 0
+        self._last_start = None
+        self._intervals = collections.deque(maxlen=HarvestCadence.WINDOW)
+        self._offsets = collections.deque(maxlen=HarvestCadence.WINDOW)
+        self._durations = collections.deque(maxlen=HarvestCadence.WINDOW)
+
+    @property
+    def at_max_backoff(self) -> bool:
+        return self.backoff_ms >= self.max_backoff_ms
+
+    def on_success(self, scheduled_time: int, start_time: int, end_time: int) -> int:
+        """Register a successful read, returns the time of the next read"""
+        if self._last_start is not None and self.backoff_ms == 0:
+            self._intervals.append(start_time - self._last_start)
+        self._last_start = start_time
+        self._offsets.append(start_time - scheduled_time)
+        self._durations.append(end_time - start_time)
+        self.samples += 1
+        self.backoff_ms = 0
+
+        if self.aligned:
+            # the next boundary after the read
+            return (end_time // self.period_ms + 1) * self.period_ms
+
+        # the next slot on the timeline that is not already in the past
+        periods = max(1, -(-(end_time - scheduled_time) // self.period_ms))
+        return scheduled_time + periods * self.period_ms
+
+    def sample_time(self, start_time: int) -> int:
+        """The time a sample is stored under, the boundary the read belongs to when aligned"""
+        if self.aligned:
+            return start_time - start_time % self.period_ms
+        return start_time
+
+    def on_error(self, end_time: int) -> int:
+        """Register a failed read, returns the time of the next attempt"""
+        self.backoff_ms = min(max(self.backoff_ms * 2, HarvestCadence.MIN_BACKOFF_MS), self.max_backoff_ms)
+        return end_time + self.backoff_ms
+
+    @staticmethod
+    def _mean_and_deviation(values) -> tuple[float, float]:
+        if len(values) == 0:
+            return 0, 0
+        mean = sum(values) / len(values)
+        return mean, math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+    def stats(self) -> dict:
+        """Achieved rate in Hz and jitter as the standard deviation of the sample interval in ms.
+        offset is how late a read started compared to the scheduled time and read is the read duration."""
+        mean, jitter = HarvestCadence._mean_and_deviation(self._intervals)
+        offset, offset_jitter = HarvestCadence._mean_and_deviation(self._offsets)
+        read, _ = HarvestCadence._mean_and_deviation(self._durations)
+        return {
+            "period_ms": self.period_ms,
+            "aligned": self.aligned,
+            "rate_hz": 1000 / mean if mean > 0 else 0,
+            "jitter_ms": jitter,
+            "offset_ms": offset,
+            "offset_jitter_ms": offset_jitter,
+            "read_ms": read,
+            "backoff_ms": self.backoff_ms,
+            "samples": self.samples,
+        }
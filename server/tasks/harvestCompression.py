@@ -0,0 +1,46 @@
+"""Compression of harvest payloads.
+The JSON payload is compressed before it is base64 encoded and signed, the JWT header has a zip field telling how
+(as in JWE: DEF is raw deflate). zstd needs the zstandard package, without it payloads are sent uncompressed."""
+import logging
+import zlib
+
+log = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFLATE = "deflate"
+ZSTD = "zstd"
+
+_ZIP = {DEFLATE: "DEF", ZSTD: "ZSTD"}
+
+
+def available(algorithm: str) -> bool:
+    if algorithm == DEFLATE:
+        return True
+    if algorithm == ZSTD:
+        return zstandard is not None
+    return False
+
+
+def compress(data: bytes, algorithm: str, level: int) -> bytes:
+    if algorithm == DEFLATE:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+    if algorithm == ZSTD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unknown compression: {algorithm}")
+
+
+def decompress(data: bytes, algorithm: str) -> bytes:
+    if algorithm == DEFLATE:
+        return zlib.decompress(data, -15)
+    if algorithm == ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression: {algorithm}")
+
+
+def header_fields(algorithm: str) -> dict:
+    return {"zip": _ZIP[algorithm]}
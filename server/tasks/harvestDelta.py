@@ -0,0 +1,50 @@
+"""Delta encoding of a harvest barn.
+The barn maps the time of each harvest to a {register: value} dict. In the encoded barn keyframes are full harvests,
+every other harvest only has the registers that changed since the previous harvest and registers that were not read
+have the value None. The first harvest and every keyframe_interval:th harvest after it is a keyframe, so every
+encoded barn can be decoded on its own."""
+
+ENCODING = "delta"
+VERSION = 1
+KEYFRAME_INTERVAL = 10
+
+
+def header_fields(keyframe_interval: int = KEYFRAME_INTERVAL) -> dict:
+    """The fields that mark a JWT payload as a delta encoded barn"""
+    return {"barn": f"{ENCODING}/{VERSION}", "keyframe_interval": keyframe_interval}
+
+
+def encode(barn: dict, keyframe_interval: int = KEYFRAME_INTERVAL) -> dict:
+    ret = {}
+    previous = None
+    for i, timestamp in enumerate(sorted(barn)):
+        harvest = barn[timestamp]
+        if previous is None or i % keyframe_interval == 0:
+            ret[timestamp] = harvest
+        else:
+            delta = {register: value for register, value in harvest.items()
+                     if register not in previous or previous[register] != value}
+            for register in previous:
+                if register not in harvest:
+                    delta[register] = None
+            ret[timestamp] = delta
+        previous = harvest
+    return ret
+
+
+def decode(encoded: dict, keyframe_interval: int = KEYFRAME_INTERVAL) -> dict:
+    ret = {}
+    previous = None
+    for i, timestamp in enumerate(sorted(encoded, key=int)):
+        if previous is None or i % keyframe_interval == 0:
+            harvest = dict(encoded[timestamp])
+        else:
+            harvest = dict(previous)
+            for register, value in encoded[timestamp].items():
+                if value is None:
+                    harvest.pop(register, None)
+                else:
+                    harvest[register] = value
+        ret[timestamp] = harvest
+        previous = harvest
+    return ret
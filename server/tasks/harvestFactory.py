@@ -1,20 +1,29 @@
 from server.blackboard import BlackBoard
-from .harvest import Harvest
+from .harvest import Harvest, HarvestAsync
 from .harvestTransport import DefaultHarvestTransportFactory
 from server.settings import ChangeSource
 
 
 class HarvestFactory:
-    """This class is responsible for creating harvest tasks when inverters are added to the blackboard."""
+    """This class is responsible for creating harvest tasks when inverters are added to the blackboard.
+    Each device gets its own harvest task, the start times are staggered so the devices are not read at the same time."""
+
+    STAGGER_SLOTS = 4
+    STAGGER_MS = 250
 
     def __init__(self, bb: BlackBoard):
         self.bb = bb
+        self._slot = 0
         bb.devices.add_listener(self)
 
     def add_device(self, com):
         # now we have an open device, lets create a harvest task and save it to the settings
         if com.is_open():
-            self.bb.add_task(Harvest(self.bb.time_ms() + 1000, self.bb, com,  DefaultHarvestTransportFactory()))
+            offset = self._slot * HarvestFactory.STAGGER_MS
+            self._slot = (self._slot + 1) % HarvestFactory.STAGGER_SLOTS
+            # devices that read without blocking are harvested on the scheduler's event loop
+            harvest = HarvestAsync if com.supports_async() is True else Harvest
+            self.bb.add_task(harvest(self.bb.time_ms() + 1000 + offset, self.bb, com,  DefaultHarvestTransportFactory()))
             self.bb.settings.devices.add_connection(com, ChangeSource.LOCAL)    
     
     def remove_device(self, inverter):
@@ -0,0 +1,54 @@
+from .compactBarn import CompactBarn
+
+
+class EndpointBarn:
+    """The harvests that have not yet been sent to one endpoint and when they should be sent.
+    The barn is flushed when its oldest harvest reaches the flush age or its estimated payload size reaches max bytes.
+    The flush age adapts to the measured upload latency: it is the latency divided by UPLOAD_SHARE, so a slow upload
+    (including signing) carries more harvests and a fast one keeps the data fresh, and it never exceeds max age.
+    It is at least MIN_AGE_MS, so an endpoint that answers within a few milliseconds still gets harvests in batches
+    instead of one upload per harvest, unless max age is set lower than that."""
+
+    UPLOAD_SHARE = 0.1  # target share of the flush interval spent uploading
+    MIN_AGE_MS = 2000  # lower bound of the adaptive flush age
+    LATENCY_WEIGHT = 0.2  # weight of a new measurement in the smoothed latency
+    BYTES_PER_HARVEST = 20  # estimated JSON size of the timestamp of a harvest
+    BYTES_PER_REGISTER = 16  # estimated JSON size of a register and its value
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.barn = CompactBarn()
+        self.bytes = 0
+        self.latency_ms = None  # smoothed upload latency, None until the first upload
+
+    def add(self, timestamp: int, harvest: dict, read_time: tuple[int, int] | None = None):
+        """read_time is the time the read started and ended, it is sent with the harvest"""
+        self.barn[timestamp] = harvest
+        self.bytes += EndpointBarn.BYTES_PER_HARVEST + EndpointBarn.BYTES_PER_REGISTER * len(harvest)
+        if read_time is not None:
+            self.barn.set_read_time(timestamp, *read_time)
+            self.bytes += 2 * EndpointBarn.BYTES_PER_REGISTER
+
+    def add_latency(self, latency_ms: int):
+        """Called by the transport, possibly in another thread, after a successful upload"""
+        if self.latency_ms is None:
+            self.latency_ms = latency_ms
+        else:
+            self.latency_ms += EndpointBarn.LATENCY_WEIGHT * (latency_ms - self.latency_ms)
+
+    def flush_age_ms(self, max_age_ms: int) -> int:
+        if self.latency_ms is None:
+            return max_age_ms
+        return min(max(int(self.latency_ms / EndpointBarn.UPLOAD_SHARE), EndpointBarn.MIN_AGE_MS), max_age_ms)
+
+    def should_flush(self, now: int, max_age_ms: int, max_bytes: int) -> bool:
+        if len(self.barn) == 0:
+            return False
+        oldest = next(iter(self.barn))
+        return now - oldest >= self.flush_age_ms(max_age_ms) or self.bytes >= max_bytes
+
+    def take(self) -> CompactBarn:
+        barn = self.barn
+        self.barn = CompactBarn()
+        self.bytes = 0
+        return barn
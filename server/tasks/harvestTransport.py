@@ -1,4 +1,6 @@
+import json
 import logging
+import threading
 import requests
 from server.inverters.supported_inverters.profiles import InverterProfile
 from server.inverters.der import DER
@@ -6,6 +8,8 @@ from server.inverters.modbus import Modbus
 from server.blackboard import BlackBoard
 import server.crypto.crypto as crypto
 import server.crypto.revive_run as revive_run
+from . import harvestDelta
+from . import harvestCompression
 
 from .srcfulAPICallTask import SrcfulAPICallTask
 
@@ -13,7 +17,20 @@ log = logging.getLogger(__name__)
 
 
 class IHarvestTransport(SrcfulAPICallTask):
-    pass
+    def spool(self, source: str = ""):
+        """Keep the barn on disk until it has been delivered, called by the harvest after post_url is set.
+        source identifies the device so that only barns of the same device are merged when they are replayed."""
+        pass
+
+
+def spool_record(endpoint: str, barn: dict, source: str = "") -> bytes:
+    return json.dumps({"endpoint": endpoint, "source": source, "barn": dict(barn)}).encode("utf-8")
+
+
+def parse_spool_record(payload: bytes) -> tuple[str, str, dict]:
+    """Returns the endpoint, the source and the barn of a spooled barn"""
+    record = json.loads(payload)
+    return record["endpoint"], record.get("source", ""), record["barn"]
 
 
 class ITransportFactory:
@@ -28,12 +45,60 @@ class HarvestTransport(IHarvestTransport):
         super().__init__(event_time, bb)
         self.barn = barn
         self.der_profile = der_profile
-
-    def _create_jwt(self):
+        self.spool_seqs = []  # sequence numbers of the barns in the spool of the blackboard
+        self.on_latency = None  # called with the time in ms a successful upload took, including signing
+
+    def spool(self, source: str = ""):
+        """Write the barn to the spool of the blackboard, the spooled barn is replayed if this transport fails.
+        Call after post_url is set."""
+        if self.bb.spool is not None:
+            self.spool_seqs = [self.bb.spool.append(spool_record(self.post_url, self.barn, source))]
+
+    def _delta_encoding(self) -> bool:
+        return self.bb.settings.harvest.delta_encoding
+
+    def _compression(self) -> str | None:
+        algorithm, _ = self.bb.settings.harvest.compression(self.post_url)
+        if algorithm is not None and not harvestCompression.available(algorithm):
+            log.warning("Compression %s is not available, sending uncompressed", algorithm)
+            return None
+        return algorithm
+
+    def _encoding(self) -> tuple[bool, str | None, int]:
+        """Delta encoding, compression algorithm and level, read once per JWT so the header and the payload agree
+        even if the settings change in between"""
+        _, level = self.bb.settings.harvest.compression(self.post_url)
+        return self._delta_encoding(), self._compression(), level
+
+    def _payload(self, encoding: tuple[bool, str | None, int] | None = None) -> dict | bytes:
+        delta, algorithm, level = encoding if encoding is not None else self._encoding()
+        if delta:
+            payload = harvestDelta.encode(self.barn)
+        else:
+            # the barn can be a CompactBarn, this gives the plain dict that is serialised
+            payload = dict(self.barn)
+        if algorithm is not None:
+            return harvestCompression.compress(json.dumps(payload).encode("utf-8"), algorithm, level)
+        return payload
+
+    def _header_fields(self, encoding: tuple[bool, str | None, int] | None = None) -> dict:
+        """The JWT header fields that tell how the payload is encoded"""
+        delta, algorithm, _ = encoding if encoding is not None else self._encoding()
+        fields = {}
+        if delta:
+            fields.update(harvestDelta.header_fields())
+        if algorithm is not None:
+            fields.update(harvestCompression.header_fields(algorithm))
+        return fields
+
+    def _create_jwt(self, payload: dict | bytes, header_fields: dict):
         with crypto.Chip() as chip:
             try:
                 name = ""
-                jwt = chip.build_jwt(self.barn, name, 5)
+                if len(header_fields) > 0:
+                    jwt = chip.build_jwt(payload, name, 5, header_fields)
+                else:
+                    jwt = chip.build_jwt(payload, name, 5)
                 HarvestTransport.do_increase_chip_death_count = True
             except crypto.Chip.Error as e:
                 log.error("Error creating JWT: %s", e)
@@ -44,10 +109,15 @@ class HarvestTransport(IHarvestTransport):
     def _data(self):
         retries = 5
         exception = None
-        
+
+        # encoded once before signing, an encoding error is not helped by reviving the chip and is raised as is
+        encoding = self._encoding()
+        header_fields = self._header_fields(encoding)
+        payload = self._payload(encoding)
+
         while retries > 0:
             try:
-                jwt = self._create_jwt()
+                jwt = self._create_jwt(payload, header_fields)
                 return jwt
             except crypto.Chip.Error as e:
                 exception = e
@@ -57,6 +127,7 @@ class HarvestTransport(IHarvestTransport):
                 
             except Exception as e:
                 exception = e
+                retries -= 1
                 log.error("Error creating JWT: %s", e)
 
         # if we end up here the chip has not been revived        
@@ -66,54 +137,85 @@ class HarvestTransport(IHarvestTransport):
         log.info("Incrementing chip death count to: %i ", self.bb.chip_death_count)
         raise exception
 
+    def execute(self, event_time):
+        start_time = self.bb.time_ms()
+        ret = super().execute(event_time)
+        if self.on_latency is not None and self.reply is not None and self.reply.status_code == 200:
+            self.on_latency(self.bb.time_ms() - start_time)
+        return ret
+
     def _on_200(self, reply):
         log.info("Response: %s", reply)
+        for seq in self.spool_seqs:
+            self.bb.spool.ack(seq)
 
     def _on_error(self, reply: requests.Response):
         log.warning("Error in harvest transport: %s", str(reply))
+        # the spool drain task replays the barns
+        for seq in self.spool_seqs:
+            self.bb.spool.release(seq)
         return 0
     
 
 class HarvestTransportTimedSignature(HarvestTransport):
 
-    # header and signature are class variables
-    _header = None
-    _signature_base64 = None
+    # Signed headers are shared by all transports. A header tells how the payload is encoded, so there is one per
+    # model and set of encoding fields: {key: (header, signature)}. The lock makes renewing a header and reading the
+    # header with its signature atomic for the cloud workers.
+    _headers: dict[tuple, tuple[dict, str]] = {}
+    _headers_lock = threading.Lock()
 
     def __init__(self, event_time: int, bb: BlackBoard, barn: dict, der_profile: InverterProfile):
         super().__init__(event_time, bb, barn, der_profile)
 
-    def _create_header(self):
+    def _create_header(self, header_fields: dict) -> tuple[dict, str]:
         with crypto.Chip() as chip:
-            HarvestTransportTimedSignature._header = chip.build_header(self.der_profile.name.lower())
-            HarvestTransportTimedSignature._header["valid_until"] = self.bb.time_ms() + 60000 * 45  # 45 minutes from now is the time to live
+            header = chip.build_header(self.der_profile.name.lower())
+            header["valid_until"] = self.bb.time_ms() + 60000 * 45  # 45 minutes from now is the time to live
+            header.update(header_fields)
+
+            signature = chip.get_signature(crypto.jwtlify(header))
+            return header, crypto.base64_url_encode(signature).decode("utf-8")
+
+    def _signed_header(self, header_fields: dict) -> tuple[dict, str]:
+        """The header for the encoding and its signature, renewed when it is about to expire"""
+        key = (self.der_profile.name.lower(), tuple(sorted(header_fields.items())))
+        with HarvestTransportTimedSignature._headers_lock:
+            signed = HarvestTransportTimedSignature._headers.get(key)
+            if signed is None or self._time_to_renew_header(signed[0]):
+                signed = self._create_header(header_fields)
+                HarvestTransportTimedSignature._headers[key] = signed
+            return signed
 
-            HarvestTransportTimedSignature._signature_base64 = chip.get_signature(crypto.Chip.jwtlify(HarvestTransportTimedSignature._header))
-            HarvestTransportTimedSignature._signature_base64 = crypto.Chip.base64_url_encode(HarvestTransportTimedSignature._signature_base64).decode("utf-8")
-            
     def _data(self):
-        if self._time_to_renew_header():
-            self._create_header()
+        encoding = self._encoding()
+        header, signature_base64 = self._signed_header(self._header_fields(encoding))
 
-        jwt = crypto.Chip.jwtlify(HarvestTransportTimedSignature._header) + "." + crypto.Chip.jwtlify(self.barn) + "." + HarvestTransportTimedSignature._signature_base64
+        payload = self._payload(encoding)
+        if isinstance(payload, bytes):
+            payload_base64 = crypto.base64_url_encode(payload).decode("utf-8")
+        else:
+            payload_base64 = crypto.jwtlify(payload)
+        jwt = crypto.jwtlify(header) + "." + payload_base64 + "." + signature_base64
 
         # log.debug("JWT: %s", jwt)
 
         return jwt
     
-    def _time_to_renew_header(self):
-        return HarvestTransportTimedSignature._header is None or self._header["valid_until"] < self.bb.time_ms() + 60000 * 15   # 15 minutes before the header expires
+    def _time_to_renew_header(self, header: dict) -> bool:
+        return header["valid_until"] < self.bb.time_ms() + 60000 * 15   # 15 minutes before the header expires
     
 class LocalHarvestTransportTimedSignature(HarvestTransportTimedSignature):
 
     def __init__(self, event_time: int, bb: BlackBoard, barn: dict, der_profile: InverterProfile):
         super().__init__(event_time, bb, barn, der_profile)
     
-    def _create_header(self):
+    def _create_header(self, header_fields: dict) -> tuple[dict, str]:
         log.info("Creating New Header...")
-        super()._create_header()
-        log.debug("Created New Header: %s", HarvestTransportTimedSignature._header)
-        log.debug("Created New Signature: %s", HarvestTransportTimedSignature._signature_base64)
+        header, signature_base64 = super()._create_header(header_fields)
+        log.debug("Created New Header: %s", header)
+        log.debug("Created New Signature: %s", signature_base64)
+        return header, signature_base64
 
     def execute(self, event_time):
         try:
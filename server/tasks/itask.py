@@ -1,4 +1,5 @@
 from __future__ import annotations
+import itertools
 from typing import List, Union
 
 
@@ -6,10 +7,18 @@ class ITask:
     """Interface for a task. A task is a unit of work that can be scheduled for execution at a given time.
     Tasks are executed synchronously, so they should not block.
     Blocking operations should be performed in a separate thread. Results should
-    then be collected and processed in the task's execute method."""
+    then be collected and processed in the task's execute method.
+    A task that mostly waits for I/O can define execute as a coroutine (async def), it is then awaited on the
+    scheduler's event loop and does not hold a worker thread. A coroutine execute must not make blocking calls."""
+
+    LANE_DEVICE = "device"  # device I/O e.g. modbus reads and writes
+    LANE_CLOUD = "cloud"  # requests to the backend
+    LANE_LOCAL = "local"  # housekeeping on the gateway itself
+
+    _creations = itertools.count()
 
     def __init__(self):
-        pass
+        self._creation = next(ITask._creations)
 
     def __eq__(self, other):
         """Override the default Equals behavior. Should return True if the time of the task is equal to the other task or time"""
@@ -33,7 +42,31 @@ class ITask:
         """Adjust the time of the task to the new time"""
         raise NotImplementedError("Subclass must implement abstract method")
 
+    def get_lane(self) -> str:
+        """Return the executor lane of the task, the scheduler gives each lane its own workers"""
+        return ITask.LANE_LOCAL
+
+    def get_coalesce_key(self) -> str | None:
+        """Return a key to keep only the latest pending task with the key, None means the task is never replaced"""
+        return None
+
+    def get_creation(self) -> int:
+        """Return the creation order of the task, of the pending tasks with a coalescing key the latest created is kept"""
+        return self._creation
+
+    def get_time_budget(self) -> int | None:
+        """Return the maximum time in milliseconds execute may take, None means no limit.
+        A task that overruns its budget is abandoned by the scheduler, see on_time_budget_exceeded"""
+        return None
+
+    def on_time_budget_exceeded(self, event_time) -> Union[List[ITask], ITask, None]:
+        """Called from a separate thread when execute has overrun the time budget, execute may still be running.
+        Use it to release what execute is blocked on, e.g. close the device connection.
+        Return None, a single Task or a list of tasks to be added to the scheduler instead of the result of execute"""
+        return None
+
     def execute(self, event_time) -> Union[List[ITask], ITask, None]:
-        """execute the task, return None a single Task or a list of tasks to be added to the scheduler"""
+        """execute the task, return None a single Task or a list of tasks to be added to the scheduler
+        may be overridden with an async def, the scheduler then awaits it on its event loop"""
         # throw a not implemented exception
         raise NotImplementedError("Subclass must implement abstract method")
\ No newline at end of file
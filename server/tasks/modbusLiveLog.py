@@ -1,5 +1,6 @@
 from server.blackboard import BlackBoard
 from .task import Task
+from .itask import ITask
 
 
 class ModbusLiveLogTask(Task):
@@ -12,6 +13,9 @@ class ModbusLiveLogTask(Task):
         self._current_ix = 0
         self.buffer = [[None] * len(registers)] * size
 
+    def get_lane(self) -> str:
+        return ITask.LANE_DEVICE
+
     def execute(self, event_time):
         if self.inverter.isTerminated():
             return None
@@ -2,6 +2,7 @@ import logging
 from server.inverters.modbus import Modbus
 from server.blackboard import BlackBoard
 from .task import Task
+from .itask import ITask
 
 log = logging.getLogger(__name__)
 
@@ -28,6 +29,9 @@ class ModbusWriteTask(Task):
         self.current_command = 0
         self.commands = commands
 
+    def get_lane(self) -> str:
+        return ITask.LANE_DEVICE
+
     def execute(self, event_time) -> None | Task | list[Task]:
         if self.current_command >= len(self.commands):
             return None
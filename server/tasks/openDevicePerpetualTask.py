@@ -2,32 +2,45 @@ import logging
 from server.blackboard import BlackBoard
 from server.web.handler.get.network import ModbusScanHandler
 from .task import Task
+from .itask import ITask
 from server.inverters.ICom import ICom
 
 logger = logging.getLogger(__name__)
 
 class DevicePerpetualTask(Task):
+    TIME_BUDGET_MS = 60000  # opening and scanning for the device should never take longer than this
+
     def __init__(self, event_time: int, bb: BlackBoard, device: ICom):
         super().__init__(event_time, bb)
         self.device = device
         self.scanner = ModbusScanHandler()
 
+    def get_lane(self) -> str:
+        return ITask.LANE_DEVICE
+
+    def get_time_budget(self) -> int:
+        return DevicePerpetualTask.TIME_BUDGET_MS
+
+    def on_time_budget_exceeded(self, event_time):
+        logger.error("Opening the device is hanging, retry in 5 minutes: %s", self.device.get_config())
+        self.device.disconnect()
+        return DevicePerpetualTask(event_time + 60000 * 5, self.bb, self.device.clone())
+
     def execute(self, event_time):
         
-        # has a device been opened? This is needed as some other task may open a device before this task is executed
-        if len(self.bb.devices.lst) > 0 and self.bb.devices.lst[0].is_open():
-            logger.debug("A device is already open, removing self.device from the blackboard")
+        # has this device been opened? This is needed as some other task may open the device before this task is executed
+        opened = self.bb.devices.find(self.device.get_config())
+        if opened is not None and opened is not self.device and opened.is_open():
+            logger.debug("The device is already open, removing self.device from the blackboard")
             self.bb.devices.remove(self.device)
             if self.device.is_open():
                 self.device.disconnect()
             return
         try:
             if self.device.connect():
-                # terminate and remove all devices from the blackboard
-                logger.debug("Removing all devices from the blackboard after opening a new device")
-                for i in self.bb.devices.lst:
-                    i.disconnect()
-                    self.bb.devices.remove(i)
+                # terminate and remove the previous instance of the device, other devices keep running
+                logger.debug("Removing the previous instance of the device from the blackboard after opening it")
+                self.bb.devices.remove_by_config(self.device.get_config())
 
                 self.bb.devices.add(self.device)
                 self.bb.add_info("Inverter opened: " + str(self.device.get_config()))
@@ -3,6 +3,7 @@ import logging
 from server.blackboard import BlackBoard
 from server.inverters.modbus import Modbus
 from .task import Task
+from .itask import ITask
 from ..inverters.ICom import ICom
 
 logger = logging.getLogger(__name__)
@@ -13,6 +14,9 @@ class OpenDeviceTask(Task):
         super().__init__(event_time, bb)
         self.device = device
 
+    def get_lane(self) -> str:
+        return ITask.LANE_DEVICE
+
     def execute(self, event_time):
         logger.info("##########################################################")
         logger.info("#################### OpenDeviceTask ####################")
@@ -26,10 +30,8 @@ class OpenDeviceTask(Task):
             if self.device.connect():
                 logger.info("Opening: %s", self.device.get_config())
                 
-                # terminate and remove all inverters from the blackboard
-                for i in self.bb.devices.lst:
-                    i.disconnect()
-                    self.bb.devices.remove(i)
+                # terminate and remove any previous instance of this device, other devices keep running
+                self.bb.devices.remove_by_config(self.device.get_config())
                 
                 logger.info("Device opened: %s", self.device.get_config())
 
@@ -7,6 +7,9 @@ class SaveSettingsTask(ConfigurationMutationTask):
         self.settings = settings if settings is not None else bb.settings
         super().__init__(event_time, bb, bb.settings.API_SUBKEY, self.settings.to_dict())
 
+    def get_coalesce_key(self) -> str | None:
+        return "save-settings"
+
     def _on_200(self, reply):
         super()._on_200(reply)
 
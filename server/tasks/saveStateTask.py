@@ -13,6 +13,9 @@ class SaveStateTask(ConfigurationMutationTask):
         self.state = state if state is not None else bb.state
         super().__init__(event_time, bb, self.SUBKEY, self.state)
 
+    def get_coalesce_key(self) -> str | None:
+        return "save-state"
+
     def _on_200(self, reply):
         super()._on_200(reply)
 
@@ -26,6 +29,9 @@ class SaveStatePerpetualTask(SaveStateTask  ):
     def __init__(self, event_time: int, bb: BlackBoard, state: dict = None):
         super().__init__(event_time, bb, state)
 
+    def get_coalesce_key(self) -> str | None:
+        return None
+
     def _on_200(self, reply):
         super()._on_200(reply)
         self.time = self.time + 1000 * 60 * 5 # 5 minutes
@@ -0,0 +1,145 @@
+import logging
+import random
+from server.blackboard import BlackBoard
+from .task import Task
+from .itask import ITask
+from .harvestTransport import HarvestTransport, parse_spool_record
+
+log = logging.getLogger(__name__)
+
+
+class SpoolDrainTask(Task):
+    """Uploads the harvests in the spool of the blackboard that have not been delivered, e.g. after an uplink outage
+    or a restart. Spooled barns of the same device and endpoint are merged into one signed upload of at most
+    BYTE_BUDGET bytes, uploads are sent one at a time in the order they were harvested.
+    While there is a backlog a batch is sent every BATCH_MS. A failed upload stops the batch and the next attempt is
+    made after an exponential backoff with jitter, so a gateway does not hammer an endpoint that is down and gateways
+    that lost the uplink at the same time do not all come back at once.
+    Only server errors, timeouts, throttling and transport errors are retried. A request the endpoint rejects (any
+    other 4xx) will be rejected again, so the barns of a rejected upload are sent one by one and the barns that are
+    rejected on their own are moved to the dead letter file of the spool instead of blocking it."""
+
+    BATCH = 200  # max number of spooled barns per batch
+    BYTE_BUDGET = 64 * 1024  # max size of the spooled barns merged into one upload
+    IDLE_MS = 60000  # time between checks when the spool is empty
+    BATCH_MS = 2000  # time between batches while there is a backlog
+    MIN_BACKOFF_MS = 5000
+    MAX_BACKOFF_MS = 600000
+    RETRYABLE_STATUS = {408, 425, 429}  # client errors that can succeed when tried again
+
+    # outcomes of an upload
+    DELIVERED = "delivered"
+    RETRY = "retry"
+    REJECTED = "rejected"
+
+    class Upload:
+        def __init__(self, endpoint: str):
+            self.endpoint = endpoint
+            self.barn = {}
+            self.seqs = []
+            self.records: list[tuple[int, bytes]] = []
+            self.size = 0
+
+        def add(self, seq: int, payload: bytes, barn: dict):
+            self.barn.update(barn)
+            self.seqs.append(seq)
+            self.records.append((seq, payload))
+            self.size += len(payload)
+
+    def __init__(self, event_time: int, bb: BlackBoard):
+        super().__init__(event_time, bb)
+        self.backoff_ms = 0
+
+    def get_lane(self) -> str:
+        return ITask.LANE_CLOUD
+
+    def get_coalesce_key(self) -> str | None:
+        return "spool-drain"
+
+    def execute(self, event_time):
+        spool = self.bb.spool
+        if spool is None:
+            return None
+
+        records = spool.read(SpoolDrainTask.BATCH)
+        if len(records) == 0:
+            self.time = event_time + SpoolDrainTask.IDLE_MS
+            return self
+
+        uploads = self._merge(records)
+        log.info("Uploading %d spooled harvests in %d uploads, %d in the spool", len(records), len(uploads), spool.pending())
+        for i, upload in enumerate(uploads):
+            outcome = self._upload(event_time, upload)
+            if outcome == SpoolDrainTask.REJECTED:
+                outcome = self._split_rejected(event_time, upload)
+            if outcome == SpoolDrainTask.RETRY:
+                for remaining in uploads[i + 1:]:
+                    for seq in remaining.seqs:
+                        spool.release(seq)
+                self.backoff_ms = min(max(self.backoff_ms * 2, SpoolDrainTask.MIN_BACKOFF_MS), SpoolDrainTask.MAX_BACKOFF_MS)
+                delay = self._jitter(self.backoff_ms)
+                log.info("Upload of spooled harvests failed, retrying in %d ms", delay)
+                self.time = event_time + delay
+                return self
+
+        self.backoff_ms = 0
+        self.time = event_time + (SpoolDrainTask.BATCH_MS if spool.pending() > 0 else SpoolDrainTask.IDLE_MS)
+        return self
+
+    def _jitter(self, backoff_ms: int) -> int:
+        # equal jitter, half of the backoff is fixed and the other half random
+        return int(backoff_ms / 2 + random.uniform(0, backoff_ms / 2))
+
+    def _merge(self, records: list[tuple[int, bytes]]) -> list["SpoolDrainTask.Upload"]:
+        """Merges the records into uploads per endpoint and source that are within the byte budget"""
+        uploads = []
+        open_uploads = {}
+        for seq, payload in records:
+            try:
+                endpoint, source, barn = parse_spool_record(payload)
+            except (ValueError, KeyError) as e:
+                log.error("Moving unreadable spool record %d to the dead letter file: %s", seq, e)
+                self.bb.spool.dead_letter(seq, payload)
+                continue
+
+            key = (endpoint, source)
+            upload = open_uploads.get(key)
+            if upload is None or (upload.size > 0 and upload.size + len(payload) > SpoolDrainTask.BYTE_BUDGET):
+                upload = SpoolDrainTask.Upload(endpoint)
+                open_uploads[key] = upload
+                uploads.append(upload)
+            upload.add(seq, payload, barn)
+        return uploads
+
+    def _upload(self, event_time: int, upload: "SpoolDrainTask.Upload") -> str:
+        transport = HarvestTransport(event_time, self.bb, upload.barn, None)
+        transport.post_url = upload.endpoint
+        transport.spool_seqs = upload.seqs
+        # the transport acks or releases the records
+        transport.execute(event_time)
+        status = transport.reply.status_code if transport.reply is not None else None
+        if status == 200:
+            return SpoolDrainTask.DELIVERED
+        if status is not None and 400 <= status < 500 and status not in SpoolDrainTask.RETRYABLE_STATUS:
+            return SpoolDrainTask.REJECTED
+        return SpoolDrainTask.RETRY
+
+    def _split_rejected(self, event_time: int, upload: "SpoolDrainTask.Upload") -> str:
+        """Sends the barns of a rejected upload one by one, the barns that are rejected on their own are moved to the
+        dead letter file. Returns RETRY if the endpoint failed in between, the barns that are left are sent later."""
+        if len(upload.records) == 1:
+            seq, payload = upload.records[0]
+            log.error("Spooled harvest %d was rejected by %s, moving it to the dead letter file", seq, upload.endpoint)
+            self.bb.spool.dead_letter(seq, payload)
+            return SpoolDrainTask.DELIVERED
+
+        log.warning("Upload of %d spooled harvests was rejected by %s, sending them one by one", len(upload.seqs), upload.endpoint)
+        for seq, payload in upload.records:
+            single = SpoolDrainTask.Upload(upload.endpoint)
+            single.add(seq, payload, parse_spool_record(payload)[2])
+            outcome = self._upload(event_time, single)
+            if outcome == SpoolDrainTask.REJECTED:
+                outcome = self._split_rejected(event_time, single)
+            if outcome == SpoolDrainTask.RETRY:
+                return outcome
+        return SpoolDrainTask.DELIVERED
@@ -42,6 +42,9 @@ class SrcfulAPICallTask(Task, ABC):
         """return 0 to stop retrying,
         otherwise return the number of milliseconds to wait before retrying and possible tasks to add to the scheduler"""
 
+    def get_lane(self) -> str:
+        return ITask.LANE_CLOUD
+
     def execute(self, event_time):
 
         # this is the function that will be executed in the thread
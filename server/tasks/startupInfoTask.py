@@ -21,14 +21,24 @@ class StartupInfoTask(SrcfulAPICallTask):
             
             inverter_model = None
             inverter_profile_version = None
+            devices = []
 
-            if len(self.bb.devices.lst) > 0:
-                inverter_model = self.bb.devices.lst[0].get_type()
-                inverter_profile_version = self.bb.devices.lst[0].get_profile().version
+            for device in self.bb.devices.lst:
+                profile = device.get_profile()
+                devices.append({
+                    "type": device.get_config().get("type"),
+                    "profile version": profile.version if profile is not None else None,
+                })
+
+            # the first device is reported as the inverter for backwards compatibility
+            if len(devices) > 0:
+                inverter_model = devices[0]["type"]
+                inverter_profile_version = devices[0]["profile version"]
 
             payload = {
                 "firmware version": self.bb.get_version(),
                 "inverter profile version": inverter_profile_version,
+                "devices": devices,
             }
 
             jwt = chip.build_jwt(payload, inverter_model, 5)
@@ -6,6 +6,7 @@ class Task(ITask):
     """Base class for tasks that hold a time and a blackboard object"""
 
     def __init__(self, event_time: int, bb: BlackBoard):
+        super().__init__()
         self.time = event_time
         self.bb = bb
 
@@ -1,7 +1,10 @@
+import asyncio
+import itertools
+import threading
 import time
 import logging
 import queue
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 import pytest
 
 from server import app
@@ -21,6 +24,9 @@ def bb():
     return BlackBoard()
 
 
+_creations = itertools.count()
+
+
 def create_normal_task(time):
 
     def adjust_time_side_effect(new_time):
@@ -29,6 +35,10 @@ def create_normal_task(time):
     task = MagicMock(spec=ITask, time=time)
     task.execute.return_value = None
     task.get_time.return_value = task.time
+    task.get_lane.return_value = ITask.LANE_LOCAL
+    task.get_time_budget.return_value = None
+    task.get_coalesce_key.return_value = None
+    task.get_creation.return_value = next(_creations)
     task.adjust_time.side_effect = adjust_time_side_effect
     task.__lt__.side_effect = lambda x: task.get_time() < x.get_time()
     return task
@@ -75,6 +85,15 @@ def test_main_loop_exiting(tasks, bb, stop_task, caplog):
     assert "StopIteration received" in caplog.text
 
 
+def test_main_loop_lane_workers(tasks, bb):
+    with patch.object(app, "TaskScheduler") as scheduler_class:
+        main_loop(tasks, bb, {ITask.LANE_DEVICE: 8})
+    local_workers, _, _, lanes = scheduler_class.call_args.args
+    assert local_workers == app.DEFAULT_LANE_WORKERS[ITask.LANE_LOCAL]
+    assert lanes == {**app.DEFAULT_LANE_WORKERS, ITask.LANE_DEVICE: 8}
+    scheduler_class.return_value.main_loop.assert_called_once()
+
+
 def test_main_loop_normal_task(tasks, bb, normal_task, stop_task, caplog):
     app.logger.setLevel(level=logging.INFO)
     
@@ -217,4 +236,297 @@ def test_main_loop_with_blocking_task(tasks, bb, short_task, long_task):
     assert short_task.execute_time > 0
 
     # assert that the short task was executed while the long task was sleeping
-    assert short_task.execute_time <= short_task_time + 500  # we alllow for some time of context switching
\ No newline at end of file
+    assert short_task.execute_time <= short_task_time + 500  # we alllow for some time of context switching
+
+def test_same_time_tasks_run_in_insertion_order(bb, stop_task):
+    order = []
+    event_time = bb.time_ms() + 200
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+
+    for i in range(5):
+        task = create_normal_task(event_time)
+        task.execute.side_effect = lambda x, i=i: order.append(i)
+        scheduler.add_task(task)
+
+    stop_task.adjust_time(event_time + 100)
+    scheduler.add_task(stop_task)
+    scheduler.main_loop()
+
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_cancel_task(bb, normal_task, stop_task):
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    handle = scheduler.add_task(normal_task)
+    scheduler.add_task(stop_task)
+
+    assert handle.pending
+    assert handle.cancel()
+    assert not handle.pending
+    assert not handle.cancel()
+
+    scheduler.main_loop()
+    assert not normal_task.execute.called
+
+
+def test_reschedule_task(bb, normal_task, stop_task):
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    handle = scheduler.add_task(normal_task)
+    scheduler.add_task(stop_task)
+
+    # move the task past the stop task so it never runs
+    assert handle.reschedule(stop_task.get_time() + 1000)
+    assert normal_task.get_time() == stop_task.get_time() + 1000
+
+    scheduler.main_loop()
+    assert not normal_task.execute.called
+
+
+def test_add_pending_task_does_not_duplicate(bb, normal_task):
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    handle = scheduler.add_task(normal_task)
+    assert scheduler.add_task(normal_task) is handle
+    assert len(scheduler.pending) == 1
+
+
+def test_cancelled_entries_are_compacted(bb):
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    handles = [scheduler.add_task(create_normal_task(bb.time_ms() + 1000 + i)) for i in range(100)]
+    for handle in handles[:90]:
+        handle.cancel()
+
+    assert len(scheduler.tasks) < 100
+    assert len(scheduler.pending) == 10
+
+
+class _SleepingAsyncTask(ITask):
+    def __init__(self, time, duration):
+        self.time = time
+        self.duration = duration
+        self.done = False
+
+    def get_time(self):
+        return self.time
+
+    def adjust_time(self, new_time):
+        self.time = new_time
+
+    async def execute(self, event_time):
+        await asyncio.sleep(self.duration)
+        self.done = True
+
+
+def test_async_tasks_do_not_hold_workers(bb, stop_task):
+    # 20 tasks waiting 0.5 s each would take 10 s on a single worker thread
+    event_time = bb.time_ms() + 100
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    async_tasks = [_SleepingAsyncTask(event_time, 0.5) for _ in range(20)]
+    for task in async_tasks:
+        scheduler.add_task(task)
+
+    stop_task.adjust_time(event_time + 1000)
+    scheduler.add_task(stop_task)
+
+    start = time.monotonic()
+    scheduler.main_loop()
+
+    assert all(task.done for task in async_tasks)
+    assert time.monotonic() - start < 3
+    assert scheduler.loop is None
+
+
+def test_async_task_returns_new_tasks(bb, normal_task, stop_task):
+    class _ChildTask(_SleepingAsyncTask):
+        async def execute(self, event_time):
+            return normal_task
+
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    scheduler.add_task(_ChildTask(bb.time_ms() + 100, 0))
+    stop_task.adjust_time(normal_task.get_time() + 200)
+    scheduler.add_task(stop_task)
+    scheduler.main_loop()
+
+    assert normal_task.execute.called
+
+
+def test_lanes(bb):
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb, {ITask.LANE_DEVICE: 2, ITask.LANE_CLOUD: 3})
+    state = scheduler.lane_state()
+    assert state[ITask.LANE_LOCAL] == {"workers": 1, "active": 0, "queued": 0}
+    assert state[ITask.LANE_DEVICE]["workers"] == 2
+    assert state[ITask.LANE_CLOUD]["workers"] == 3
+
+
+def test_stalled_lane_does_not_delay_other_lanes(bb, stop_task):
+    # a blocking cloud task must not delay a device task even if the cloud lane is saturated
+    event_time = bb.time_ms() + 100
+
+    cloud_task = create_normal_task(event_time)
+    cloud_task.get_lane.return_value = ITask.LANE_CLOUD
+    cloud_task.execute.side_effect = lambda x: time.sleep(1.5)
+
+    queued_cloud_task = create_normal_task(event_time)
+    queued_cloud_task.get_lane.return_value = ITask.LANE_CLOUD
+
+    device_task = create_normal_task(event_time + 100)
+    device_task.get_lane.return_value = ITask.LANE_DEVICE
+    device_task.execute.side_effect = lambda x: setattr(device_task, "execute_time", bb.time_ms())
+
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb, {ITask.LANE_DEVICE: 1, ITask.LANE_CLOUD: 1})
+    for task in [cloud_task, queued_cloud_task, device_task]:
+        scheduler.add_task(task)
+
+    def check_and_stop(x):
+        stop_task.lane_state = scheduler.lane_state()
+        raise StopIteration
+
+    stop_task.adjust_time(event_time + 500)
+    stop_task.execute.side_effect = check_and_stop
+    scheduler.add_task(stop_task)
+    scheduler.main_loop()
+
+    assert device_task.execute_time < event_time + 500
+    assert stop_task.lane_state[ITask.LANE_CLOUD]["queued"] == 1
+    assert not queued_cloud_task.execute.called
+
+
+def test_scheduler_metrics(bb, normal_task, fail_task, stop_task):
+    fail_task.adjust_time(normal_task.get_time())
+    stop_task.adjust_time(normal_task.get_time() + 100)
+
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    for task in [normal_task, fail_task, stop_task]:
+        scheduler.add_task(task)
+    scheduler.main_loop()
+
+    metrics = bb.scheduler_metrics.to_dict()
+    assert metrics["tasks"]["MagicMock"]["duration"]["count"] == 3
+    assert metrics["tasks"]["MagicMock"]["exceptions"] == 1
+    assert metrics["lanes"][ITask.LANE_LOCAL]["workers"] == 1
+    assert metrics["pending"] == 0
+
+
+def test_task_from_other_thread_is_dispatched_at_once(bb, stop_task):
+    # the scheduler is idle waiting for the stop task, a task added to the blackboard must not wait for it
+    stop_task.adjust_time(bb.time_ms() + 2000)
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    scheduler.add_task(stop_task)
+
+    added_task = create_normal_task(0)
+    added_task.execute.side_effect = lambda x: setattr(added_task, "execute_time", bb.time_ms())
+
+    def add_from_thread():
+        time.sleep(0.2)
+        added_task.get_time.return_value = bb.time_ms() + 100
+        added_task.add_time = bb.time_ms()
+        bb.add_task(added_task)
+
+    thread = threading.Thread(target=add_from_thread)
+    thread.start()
+    scheduler.main_loop()
+    thread.join()
+
+    assert added_task.execute_time - added_task.get_time() < 50
+
+
+def test_hung_task_is_abandoned(bb, stop_task):
+    event_time = bb.time_ms() + 100
+
+    replacement_task = create_normal_task(event_time + 400)
+
+    hung_task = create_normal_task(event_time)
+    hung_task.get_lane.return_value = ITask.LANE_DEVICE
+    hung_task.get_time_budget.return_value = 200
+    hung_task.execute.side_effect = lambda x: time.sleep(1.5)
+    hung_task.on_time_budget_exceeded.return_value = replacement_task
+
+    # the device lane has a single worker, this task can only run if the hung worker is replaced
+    next_task = create_normal_task(event_time + 300)
+    next_task.get_lane.return_value = ITask.LANE_DEVICE
+
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb, {ITask.LANE_DEVICE: 1})
+    for task in [hung_task, next_task]:
+        scheduler.add_task(task)
+    stop_task.adjust_time(event_time + 800)
+    scheduler.add_task(stop_task)
+    scheduler.main_loop()
+
+    assert hung_task.on_time_budget_exceeded.called
+    assert next_task.execute.called
+    assert replacement_task.execute.called
+    assert bb.scheduler_metrics.to_dict()["tasks"]["MagicMock"]["overruns"] == 1
+
+
+class _HangingAsyncTask(_SleepingAsyncTask):
+    def get_time_budget(self):
+        return 100
+
+    def on_time_budget_exceeded(self, event_time):
+        self.exceeded = True
+
+
+def test_hung_async_task_is_cancelled(bb, stop_task):
+    task = _HangingAsyncTask(bb.time_ms() + 100, 10)
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+    scheduler.add_task(task)
+    stop_task.adjust_time(bb.time_ms() + 500)
+    scheduler.add_task(stop_task)
+    scheduler.main_loop()
+
+    assert task.exceeded
+    assert not task.done
+    assert bb.scheduler_metrics.to_dict()["tasks"]["_HangingAsyncTask"]["overruns"] == 1
+
+
+def test_coalesce_tasks_with_same_key(bb, stop_task):
+    event_time = bb.time_ms() + 200
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+
+    first = create_normal_task(event_time)
+    first.get_coalesce_key.return_value = "save-state"
+    latest = create_normal_task(event_time + 100)
+    latest.get_coalesce_key.return_value = "save-state"
+    other = create_normal_task(event_time)
+    other.get_coalesce_key.return_value = "save-settings"
+
+    scheduler.add_task(first)
+    scheduler.add_task(other)
+    handle = scheduler.add_task(latest)
+
+    assert len(scheduler.pending) == 2
+    # the latest task keeps the earliest time so it can not be postponed forever
+    assert latest.get_time() == event_time
+
+    stop_task.adjust_time(event_time + 300)
+    scheduler.add_task(stop_task)
+    scheduler.main_loop()
+
+    assert not first.execute.called
+    assert latest.execute.called
+    assert other.execute.called
+    assert not handle.pending
+    assert scheduler.coalesced == {}
+
+
+def test_coalesce_keeps_the_latest_created_task(bb):
+    from server.tasks.saveStateTask import SaveStateTask
+    event_time = bb.time_ms() + 200
+    scheduler = app.TaskScheduler(1, queue.PriorityQueue(), bb)
+
+    old = SaveStateTask(event_time, bb, {"v": "old"})
+    new = SaveStateTask(event_time + 100, bb, {"v": "new"})
+    scheduler.add_task(new)
+    # the old task is retried after the new one was added, it does not replace the new one
+    old.adjust_time(event_time + 60000)
+    handle = scheduler.add_task(old)
+
+    assert handle.task is new
+    assert list(scheduler.pending.values()) == [handle]
+    assert new.get_time() == event_time + 100
+    assert scheduler.coalesced == {"save-state": handle}
+
+    # an older task that is due earlier moves the newer one to its time
+    old.adjust_time(event_time)
+    assert scheduler.add_task(old) is handle
+    assert new.get_time() == event_time
+    assert len(scheduler.pending) == 1
@@ -1,5 +1,5 @@
 from server.blackboard import BlackBoard
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from server.message import Message
 from server.inverters.ICom import ICom
 import pytest
@@ -138,3 +138,65 @@ def test_chip_death_count():
     assert bb.chip_death_count == 2
     bb.reset_chip_death_count()
     assert bb.chip_death_count == 0
+
+
+def test_add_task_notifies_listener():
+    bb = BlackBoard()
+    listener = MagicMock()
+    bb.set_task_listener(listener)
+    task = MagicMock()
+    bb.add_task(task)
+    assert listener.call_count == 1
+    assert bb.purge_tasks() == [task]
+    assert bb.purge_tasks() == []
+
+
+def test_save_state_tasks_are_coalesced():
+    bb = BlackBoard()
+    with patch.object(BlackBoard, "state", {}):
+        bb.add_error("error 1")
+        bb.add_error("error 2")
+    tasks = bb.purge_tasks()
+    assert len(tasks) == 2
+    assert tasks[0].get_coalesce_key() == tasks[1].get_coalesce_key() == "save-state"
+
+
+def test_devices_get_and_find():
+    bb = BlackBoard()
+    hw1 = MagicMock()
+    hw1.get_config.return_value = {"host": "1"}
+    hw2 = MagicMock()
+    hw2.get_config.return_value = {"host": "2"}
+    bb.devices.add(hw1)
+    bb.devices.add(hw2)
+
+    assert bb.devices.get() is hw1
+    assert bb.devices.get(1) is hw2
+    assert bb.devices.get(2) is None
+    assert bb.devices.find({"host": "2"}) is hw2
+    assert bb.devices.find({"host": "3"}) is None
+    assert bb.devices.get_by_id("2") is hw2
+    assert bb.devices.get_by_id("3") is None
+
+    bb.devices.remove_by_config({"host": "1"})
+    assert hw1.disconnect.called
+    assert bb.devices.lst == [hw2]
+
+
+def test_device_id_is_stable_when_reopened():
+    bb = BlackBoard()
+    hw1 = MagicMock()
+    hw1.get_config.return_value = {"connection": "TCP", "type": "huawei", "host": "10.0.0.1", "port": 502, "address": 1}
+    hw2 = MagicMock()
+    hw2.get_config.return_value = {"connection": "TCP", "type": "huawei", "host": "10.0.0.1", "port": 502, "address": 2}
+    bb.devices.add(hw1)
+    bb.devices.add(hw2)
+    assert bb.devices.device_id(hw1) == "TCP:10.0.0.1:502:1"
+
+    # a reopened device is added at the end of the list
+    reopened = MagicMock()
+    reopened.get_config.return_value = hw1.get_config.return_value
+    bb.devices.remove_by_config(hw1.get_config())
+    bb.devices.add(reopened)
+    assert bb.devices.get_by_id("TCP:10.0.0.1:502:1") is reopened
+    assert bb.devices.get_by_id("TCP:10.0.0.1:502:2") is hw2
@@ -0,0 +1,138 @@
+import queue
+import threading
+import time
+from unittest.mock import patch
+
+from server import app
+from server.blackboard import BlackBoard
+from server.clock import VirtualClock
+from server.tasks.harvestFactory import HarvestFactory
+from server.tasks.itask import ITask
+from server.tasks.task import Task
+
+
+def test_virtual_clock():
+    clock = VirtualClock(1000)
+    assert clock.time_ms() == 1000
+    assert clock.monotonic_ms() == 0
+
+    clock.advance(500)
+    assert clock.time_ms() == 1500
+    assert clock.monotonic_ms() == 500
+
+
+def test_virtual_clock_wait_advances_when_idle():
+    clock = VirtualClock(0)
+    condition = threading.Condition()
+    with condition:
+        clock.wait(condition, 60000, busy=False)
+    assert clock.time_ms() == 60000
+
+
+def test_blackboard_uses_clock():
+    clock = VirtualClock(1000)
+    bb = BlackBoard(clock=clock)
+    clock.advance(250)
+    assert bb.time_ms() == 1250
+    assert bb.elapsed_time == 250
+
+
+class _StopTask(Task):
+    def execute(self, event_time):
+        raise StopIteration
+
+
+class _FakeDevice:
+    """Device that fails to read during the outage and is closed until it is connected again"""
+
+    def __init__(self, bb: BlackBoard, outage: tuple[int, int]):
+        self.bb = bb
+        self.outage = outage
+        self.open = True
+
+    def is_open(self):
+        return self.open
+
+    def connect(self):
+        self.open = not self.outage[0] <= self.bb.time_ms() < self.outage[1]
+        return self.open
+
+    def disconnect(self):
+        self.open = False
+
+    def clone(self, host=None):
+        return _FakeDevice(self.bb, self.outage)
+
+    def get_config(self):
+        return {"connection": "FAKE", "port": 502}
+
+    def set_verbose_refresh_cycles(self, cycles):
+        return False
+
+    def get_bus_stats(self):
+        return None
+
+    def get_static_registers(self):
+        return {}
+
+    def read_harvest_data(self, force_verbose):
+        if self.outage[0] <= self.bb.time_ms() < self.outage[1]:
+            raise Exception("device unreachable")
+        return {"1": self.bb.time_ms()}
+
+
+class _RecordingTransport(Task):
+    uploads = []
+
+    def __init__(self, event_time, bb, barn, device):
+        super().__init__(event_time, bb)
+        self.barn = barn
+
+    def spool(self, source=""):
+        pass
+
+    def get_lane(self):
+        return ITask.LANE_CLOUD
+
+    def execute(self, event_time):
+        _RecordingTransport.uploads.append(self.barn)
+
+
+@patch("server.tasks.openDevicePerpetualTask.ModbusScanHandler.scan_ports", return_value=[])
+@patch.object(BlackBoard, "_save_state")
+def test_replay_hours_of_harvesting(save_state, scan_ports):
+    hour = 60 * 60 * 1000
+    start = 1_700_000_000_000
+    clock = VirtualClock(start)
+    bb = BlackBoard(clock=clock)
+
+    # the device is unreachable for 30 minutes in the second hour
+    device = _FakeDevice(bb, (start + hour + 15 * 60 * 1000, start + hour + 45 * 60 * 1000))
+
+    class _Factory(HarvestFactory):
+        def add_device(self, com):
+            from server.tasks.harvest import Harvest
+            self.bb.add_task(Harvest(self.bb.time_ms() + 1000, self.bb, com, _RecordingTransport))
+
+    _Factory(bb)
+    _RecordingTransport.uploads = []
+
+    tasks = queue.PriorityQueue()
+    tasks.put(_StopTask(start + 3 * hour, bb))
+    scheduler = app.TaskScheduler(1, tasks, bb, {ITask.LANE_DEVICE: 1, ITask.LANE_CLOUD: 1})
+    bb.devices.add(device)
+
+    real_start = time.monotonic()
+    scheduler.main_loop()
+
+    assert time.monotonic() - real_start < 30
+    assert bb.time_ms() == start + 3 * hour
+
+    samples = sorted(ts for barn in _RecordingTransport.uploads for ts in barn)
+    assert len(samples) > 3 * 60 * 60 * 0.8 - 30 * 60
+    # nothing was read during the outage and harvesting resumed after it
+    assert not any(start + hour + 15 * 60 * 1000 <= ts < start + hour + 45 * 60 * 1000 for ts in samples)
+    assert samples[-1] > start + 3 * hour - 60 * 1000
+    # no sample was uploaded twice
+    assert len(samples) == len(set(samples))
+    assert scan_ports.called
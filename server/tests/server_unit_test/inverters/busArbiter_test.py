@@ -0,0 +1,119 @@
+import threading
+import time
+from unittest.mock import MagicMock, patch
+import pytest
+import server.tests.config_defaults as cfg
+from server.inverters.busArbiter import BusArbiter
+from server.inverters.IComFactory import IComFactory
+from server.inverters.ModbusRTU import ModbusRTU
+from pymodbus.exceptions import ModbusIOException
+
+
+def test_frame_gap():
+    # 11 bits per character at 9600 baud with even parity
+    assert BusArbiter.frame_gap(9600, 8, "E", 1) == pytest.approx(3.5 * 11 / 9600)
+    assert BusArbiter.frame_gap(115200, 8, "N", 1) == BusArbiter.FAST_FRAME_GAP_S
+
+
+def test_requests_keep_the_frame_gap():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    arbiter = BusArbiter("/dev/ttyUSB0", MagicMock(), 9600, clock=lambda: now[0], sleep=sleep)
+    with arbiter.request():
+        now[0] += 0.1
+    with arbiter.request():
+        now[0] += 0.1
+    assert sleeps == [pytest.approx(arbiter.frame_gap_s)]
+    assert arbiter.requests == 2
+    assert arbiter.utilisation() == pytest.approx(0.2 / (0.2 + arbiter.frame_gap_s))
+
+
+def test_requests_are_served_by_priority_then_arrival():
+    arbiter = BusArbiter("/dev/ttyUSB0", MagicMock(), 115200)
+    order = []
+
+    def request(name, priority):
+        with arbiter.request(priority):
+            order.append(name)
+
+    threads = []
+    with arbiter.request():
+        for name, priority in [("read 1", BusArbiter.PRIORITY_READ), ("read 2", BusArbiter.PRIORITY_READ),
+                               ("write", BusArbiter.PRIORITY_WRITE)]:
+            thread = threading.Thread(target=request, args=(name, priority))
+            thread.start()
+            threads.append(thread)
+            while len(arbiter._waiting) < len(threads):
+                time.sleep(0.001)
+        assert arbiter.stats()["queued"] == 3
+    for thread in threads:
+        thread.join()
+    assert order == ["write", "read 1", "read 2"]
+
+
+def test_devices_on_one_port_share_the_bus():
+    devices = [
+        ModbusRTU(IComFactory.parse_connection_config_from_dict({**cfg.RTU_CONFIG, "port": "/dev/ttyBUS", "address": i})[1:])
+        for i in (1, 2)
+    ]
+    with patch("server.inverters.ModbusRTU.ModbusClient") as client_class:
+        for device in devices:
+            assert device.connect()
+    client_class.assert_called_once()
+    client = client_class.return_value
+    assert devices[0].client is devices[1].client
+
+    client.read_holding_registers.return_value.registers = [1]
+    devices[0].read_registers(3, 40000, 1)
+    devices[1].read_registers(3, 40000, 1)
+    assert [c.kwargs["slave"] for c in client.read_holding_registers.call_args_list] == [1, 2]
+    assert devices[0].get_bus_stats()["requests"] == 4  # two opens and two reads
+
+    devices[0].disconnect()
+    client.close.assert_not_called()
+    devices[1].disconnect()
+    client.close.assert_called_once()
+    assert ModbusRTU.BUSES.get("/dev/ttyBUS") is None
+
+
+def test_disconnect_closes_a_hung_bus():
+    devices = [
+        ModbusRTU(IComFactory.parse_connection_config_from_dict({**cfg.RTU_CONFIG, "port": "/dev/ttyHUNG", "address": i})[1:])
+        for i in (1, 2)
+    ]
+    with patch("server.inverters.ModbusRTU.ModbusClient") as client_class:
+        for device in devices:
+            assert device.connect()
+    client = client_class.return_value
+    reading = threading.Event()
+    closed = threading.Event()
+    client.close.side_effect = closed.set
+
+    def hang(*args, **kwargs):
+        # the read only ends when the port is closed
+        reading.set()
+        closed.wait(5)
+        return ModbusIOException("port closed")
+
+    client.read_holding_registers.side_effect = hang
+    reader = threading.Thread(target=devices[0].read_registers, args=(3, 40000, 1))
+    reader.start()
+    assert reading.wait(1)
+
+    # the watchdog abandons the hung read, the other device is still on the bus
+    disconnect = threading.Thread(target=devices[0].disconnect)
+    disconnect.start()
+    disconnect.join(1)
+    assert not disconnect.is_alive()
+    client.close.assert_called_once()
+    reader.join(1)
+    assert not reader.is_alive()
+
+    # the last device closes the port without waiting for the bus either
+    devices[1].disconnect()
+    assert ModbusRTU.BUSES.get("/dev/ttyHUNG") is None
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+from server.inverters.connectionRegistry import AsyncConnectionRegistry, ConnectionRegistry, FairLock
+
+
+def test_shared_connection_is_reference_counted():
+    registry = ConnectionRegistry()
+    create_client = MagicMock(side_effect=lambda: MagicMock())
+
+    first = registry.acquire(("gateway", 502), create_client)
+    second = registry.acquire(("gateway", 502), create_client)
+    other = registry.acquire(("other", 502), create_client)
+    assert first is second
+    assert first is not other
+    assert create_client.call_count == 2
+    assert first.references == 2
+
+    registry.release(first)
+    first.client.close.assert_not_called()
+    assert registry.get(("gateway", 502)) is first
+
+    registry.release(second)
+    first.client.close.assert_called_once()
+    assert registry.get(("gateway", 502)) is None
+
+    # a new device gets a new connection
+    assert registry.acquire(("gateway", 502), create_client) is not first
+
+
+def test_fair_lock_is_first_come_first_served():
+    lock = FairLock()
+    order = []
+
+    def worker(i):
+        with lock:
+            order.append(i)
+
+    lock.acquire()
+    threads = []
+    for i in range(5):
+        thread = threading.Thread(target=worker, args=(i,))
+        thread.start()
+        threads.append(thread)
+        # wait until the thread is queued on the lock
+        time.sleep(0.02)
+    lock.release()
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3, 4]
+
+
+def test_async_connection_is_locked_on_the_event_loop():
+    registry = AsyncConnectionRegistry()
+    order = []
+
+    async def worker(i):
+        connection = registry.acquire(("gateway", 502), MagicMock)
+        async with connection.lock:
+            order.append(i)
+            await asyncio.sleep(0.01)
+            order.append(i)
+        registry.release(connection)
+        return connection
+
+    async def run():
+        return await asyncio.gather(*(worker(i) for i in range(3)))
+
+    connections = asyncio.run(run())
+    assert connections[0] is connections[1] is connections[2]
+    assert order == [0, 0, 1, 1, 2, 2]
+    connections[0].client.close.assert_called_once()
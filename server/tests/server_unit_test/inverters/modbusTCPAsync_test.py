@@ -0,0 +1,106 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+import pytest
+import server.tests.config_defaults as cfg
+from server.inverters.IComFactory import IComFactory
+from server.inverters.ModbusTCPAsync import ModbusTCPAsync
+
+
+def _config(**kwargs) -> dict:
+    return {**cfg.TCP_CONFIG, "connection": ModbusTCPAsync.CONNECTION, **kwargs}
+
+
+class _FakeAsyncClient:
+    """Answers reads with the register addresses after delay seconds, a read of register 40000 hangs"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.connected = True
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def read_holding_registers(self, address, count, slave):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(3600 if address == 40000 else self.delay)
+        finally:
+            self.in_flight -= 1
+        resp = MagicMock()
+        resp.isError.return_value = False
+        resp.registers = list(range(address, address + count))
+        return resp
+
+    async def connect(self):
+        self.connected = True
+        return True
+
+    def close(self):
+        self.connected = False
+
+
+def test_create_from_config():
+    com = IComFactory.parse_and_create_com(_config())
+    assert isinstance(com, ModbusTCPAsync)
+    assert com.supports_async()
+    assert com.get_config() == _config()
+    assert com.clone().get_config() == _config()
+
+
+def test_read_harvest_data_async():
+    com = IComFactory.parse_and_create_com(_config(pipelined=True))
+    com.async_client = _FakeAsyncClient(0.05)
+
+    with patch.object(ModbusTCPAsync, "REQUEST_TIMEOUT", 0.2):
+        harvest = asyncio.run(com.read_harvest_data_async(True))
+
+    # the static block at 40000 timed out, the other blocks are read concurrently
+    assert 40000 not in harvest
+    assert all(value == register for register, value in harvest.items())
+    assert 40069 in harvest
+    assert com.async_client.in_flight == 0
+
+
+def test_devices_are_read_concurrently():
+    coms = [IComFactory.parse_and_create_com(_config()) for _ in range(10)]
+    for com in coms:
+        com.async_client = _FakeAsyncClient(0.1)
+
+    async def harvest_all():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*(com.read_harvest_data_async(False) for com in coms))
+        return loop.time() - start
+
+    assert asyncio.run(harvest_all()) < 0.5
+
+
+def test_read_harvest_data_async_terminated():
+    com = IComFactory.parse_and_create_com(_config())
+    com.async_client = _FakeAsyncClient(0)
+    com.disconnect()
+    assert com.async_client is None
+    with pytest.raises(Exception):
+        asyncio.run(com.read_harvest_data_async(False))
+
+
+def test_unit_ids_behind_one_gateway_share_a_connection():
+    coms = [IComFactory.parse_and_create_com(_config(host="gateway", address=i)) for i in (1, 2)]
+    client = _FakeAsyncClient(0.01)
+    client.connected = False
+
+    async def harvest_all():
+        with patch("server.inverters.ModbusTCPAsync.AsyncModbusTcpClient", return_value=client) as client_class:
+            await asyncio.gather(*(com.read_harvest_data_async(False) for com in coms))
+        return client_class.call_count
+
+    assert asyncio.run(harvest_all()) == 1
+    assert coms[0].async_client is coms[1].async_client is client
+    # the devices took turns on the connection
+    assert client.max_in_flight == 1
+
+    coms[0].disconnect()
+    assert client.connected
+    coms[1].disconnect()
+    assert not client.connected
+    assert ModbusTCPAsync.ASYNC_CONNECTIONS.get(("gateway", 502)) is None
@@ -0,0 +1,198 @@
+import socket
+import struct
+import threading
+from unittest.mock import MagicMock, patch
+import server.tests.config_defaults as cfg
+from server.inverters.IComFactory import IComFactory
+from server.inverters.ModbusTCP import ModbusTCP
+from server.inverters.readPlanner import ReadBlock
+from pymodbus.exceptions import ModbusIOException
+
+
+def _device(pipelined: bool) -> ModbusTCP:
+    config = dict(cfg.TCP_CONFIG)
+    if pipelined:
+        config[ModbusTCP.PIPELINED_KEY] = True
+    return ModbusTCP(IComFactory.parse_connection_config_from_dict(config)[1:])
+
+
+def _serve(sock, answer: int):
+    """A device that reads all requests before it replies, in reverse order, to at most answer requests"""
+    requests = []
+    while len(requests) < 3:
+        requests.append(ModbusTCP.READ_REQUEST.unpack(ModbusTCP._receive_exactly(sock, ModbusTCP.READ_REQUEST.size)))
+    for transaction_id, _, _, unit, operation, start, size in reversed(requests[:answer]):
+        pdu = struct.pack(">BB%dH" % size, operation, 2 * size, *range(start, start + size))
+        sock.sendall(ModbusTCP.MBAP_HEADER.pack(transaction_id, 0, len(pdu) + 1, unit) + pdu)
+
+
+def _blocks() -> list[ReadBlock]:
+    return [ReadBlock(3, 100, 2, False), ReadBlock(3, 200, 3, False), ReadBlock(4, 300, 1, False)]
+
+
+def test_pipelined_config():
+    assert ModbusTCP.PIPELINED_KEY not in _device(False).get_config()
+    device = _device(True)
+    assert device.get_config()[ModbusTCP.PIPELINED_KEY] is True
+    assert device.clone().get_config() == device.get_config()
+
+
+def test_pipelined_reads_match_replies_by_transaction_id():
+    device = _device(True)
+    ours, theirs = socket.socketpair()
+    device.client = MagicMock()
+    device.client.socket = ours
+    server = threading.Thread(target=_serve, args=(theirs, 3))
+    server.start()
+
+    assert device._read_blocks(_blocks()) == [[100, 101], [200, 201, 202], [300]]
+    server.join()
+    device.client.read_holding_registers.assert_not_called()
+    ours.close()
+    theirs.close()
+
+
+def test_pipelined_reads_fall_back():
+    device = _device(True)
+    ours, theirs = socket.socketpair()
+    device.client = MagicMock()
+    device.client.socket = ours
+    device.client.read_holding_registers.return_value.registers = [1, 2, 3]
+    device.client.read_input_registers.return_value.registers = [4]
+    server = threading.Thread(target=_serve, args=(theirs, 1))
+    server.start()
+
+    with patch.object(ModbusTCP, "PIPELINE_TIMEOUT", 0.2), patch.object(device, "_open", return_value=True):
+        # the device only answers one request, the reads are done one at a time instead
+        values = device._read_blocks(_blocks())
+    server.join()
+    assert values == [[1, 2, 3], [1, 2, 3], [4]]
+    # a timeout is not evidence that the device does not handle pipelined reads
+    assert device._pipeline_supported
+    assert device._pipeline_failures == 1
+    assert device._use_pipeline()
+    ours.close()
+    theirs.close()
+
+
+def test_pipelining_is_paused_after_repeated_failures():
+    device = _device(True)
+    device.client = MagicMock()
+    device.client.socket.recv.side_effect = TimeoutError("timed out")
+    device.client.read_holding_registers.return_value.registers = [1, 2, 3]
+    device.client.read_input_registers.return_value.registers = [4]
+
+    for _ in range(ModbusTCP.MAX_PIPELINE_FAILURES):
+        assert device._read_blocks(_blocks()) == [[1, 2, 3], [1, 2, 3], [4]]
+    assert device.client.socket.sendall.call_count == ModbusTCP.MAX_PIPELINE_FAILURES
+    assert not device._use_pipeline()
+
+    # not pipelined for the rest of the connection, tried again after a reconnect
+    device._read_blocks(_blocks())
+    assert device.client.socket.sendall.call_count == ModbusTCP.MAX_PIPELINE_FAILURES
+    with patch.object(device, "_create_client"):
+        device._open()
+    assert device._use_pipeline()
+
+
+def test_unexpected_reply_disables_pipelining():
+    device = _device(True)
+    ours, theirs = socket.socketpair()
+    device.client = MagicMock()
+    device.client.socket = ours
+    device.client.read_holding_registers.return_value.registers = [1, 2, 3]
+    device.client.read_input_registers.return_value.registers = [4]
+    theirs.sendall(ModbusTCP.MBAP_HEADER.pack(0xFFFF, 0, 3, 1) + bytes([3, 0]))
+
+    assert device._read_blocks(_blocks()) == [[1, 2, 3], [1, 2, 3], [4]]
+    assert not device._pipeline_supported
+    with patch.object(device, "_create_client"):
+        device._open()
+    assert not device._use_pipeline()
+    ours.close()
+    theirs.close()
+
+
+def test_unit_ids_behind_one_gateway_share_a_connection():
+    devices = [
+        ModbusTCP(IComFactory.parse_connection_config_from_dict({**cfg.TCP_CONFIG, "host": "gateway", "address": i})[1:])
+        for i in (1, 2)
+    ]
+    with patch("server.inverters.ModbusTCP.ModbusClient") as client_class:
+        for device in devices:
+            assert device.connect()
+    client_class.assert_called_once()
+    client = client_class.return_value
+    assert devices[0].client is devices[1].client
+
+    client.read_holding_registers.return_value.registers = [1]
+    devices[0].read_registers(3, 40000, 1)
+    devices[1].read_registers(3, 40000, 1)
+    assert [c.kwargs["slave"] for c in client.read_holding_registers.call_args_list] == [1, 2]
+
+    devices[0].disconnect()
+    assert not devices[0].is_open()
+    client.close.assert_not_called()
+    devices[1].disconnect()
+    client.close.assert_called_once()
+    assert ModbusTCP.CONNECTIONS.get(("gateway", 502)) is None
+
+
+def test_failed_read_reopens_the_shared_connection():
+    devices = [
+        ModbusTCP(IComFactory.parse_connection_config_from_dict({**cfg.TCP_CONFIG, "host": "wedged", "address": i})[1:])
+        for i in (1, 2)
+    ]
+    with patch("server.inverters.ModbusTCP.ModbusClient") as client_class:
+        for device in devices:
+            assert device.connect()
+    client = client_class.return_value
+    client.connect.reset_mock()
+
+    client.read_holding_registers.return_value = ModbusIOException("timeout")
+    assert devices[0].read_registers(3, 40000, 1) == []
+    # the socket is replaced for both devices instead of being kept by the reference of the other device
+    client.close.assert_called_once()
+    client.connect.assert_called_once()
+    assert devices[1].client is client
+
+    for device in devices:
+        device.disconnect()
+
+
+def test_disconnect_closes_a_hung_shared_connection():
+    devices = [
+        ModbusTCP(IComFactory.parse_connection_config_from_dict({**cfg.TCP_CONFIG, "host": "hung", "address": i})[1:])
+        for i in (1, 2)
+    ]
+    with patch("server.inverters.ModbusTCP.ModbusClient") as client_class:
+        for device in devices:
+            assert device.connect()
+    client = client_class.return_value
+    reading = threading.Event()
+    closed = threading.Event()
+    client.close.side_effect = closed.set
+
+    def hang(*args, **kwargs):
+        # the read only ends when the socket is closed
+        reading.set()
+        closed.wait(5)
+        return ModbusIOException("socket closed")
+
+    client.read_holding_registers.side_effect = hang
+    reader = threading.Thread(target=devices[0].read_registers, args=(3, 40000, 1))
+    reader.start()
+    assert reading.wait(1)
+
+    # the watchdog abandons the hung read, the other device still holds a reference to the connection
+    disconnect = threading.Thread(target=devices[0].disconnect)
+    disconnect.start()
+    disconnect.join(1)
+    assert not disconnect.is_alive()
+    client.close.assert_called_once()
+    reader.join(1)
+    assert not reader.is_alive()
+    assert ModbusTCP.CONNECTIONS.get(("hung", 502)) is not None
+
+    devices[1].disconnect()
+    assert ModbusTCP.CONNECTIONS.get(("hung", 502)) is None
@@ -2,7 +2,8 @@ from server.inverters.ModbusTCP import ModbusTCP
 from server.inverters.ModbusRTU import ModbusRTU
 from server.inverters.ModbusSolarman import ModbusSolarman
 from server.inverters.ModbusSunspec import ModbusSunspec
-from server.inverters.modbus import Modbus
+from server.inverters.modbus import Modbus, ExceptionResponseError
+from server.inverters.supported_inverters.profiles import InverterProfile, InverterProfiles
 import server.tests.config_defaults as cfg
 from server.inverters.IComFactory import IComFactory
 from unittest.mock import MagicMock, patch
@@ -96,4 +97,144 @@ def test_modbus_device_clone():
     
     for device in devices:
         assert device.get_config() == device.clone().get_config()
-        
\ No newline at end of file
+        
+
+def _registers(intervals) -> set:
+    return {r for block in intervals for r in range(block.start_register, block.start_register + block.offset)}
+
+
+def test_read_harvest_data_verbose_refresh_cycles():
+    tcp_conf = IComFactory.parse_connection_config_from_dict(cfg.TCP_CONFIG)
+    device = ModbusTCP(tcp_conf[1:])
+
+    def read_registers(operation, address, size):
+        return [1 for _ in range(size)]
+
+    device.read_registers = read_registers
+    verbose = _registers(device.profile.get_registers_verbose())
+    normal = _registers(device.profile.get_registers())
+
+    assert not device.set_verbose_refresh_cycles(0)
+    assert set(device.read_harvest_data(False)) == normal
+
+    cycles = 3
+    assert device.set_verbose_refresh_cycles(cycles)
+    spread = set()
+    for _ in range(cycles):
+        harvest = set(device.read_harvest_data(False))
+        # the normal registers are read every cycle
+        assert normal <= harvest
+        spread |= harvest
+    assert spread == verbose | normal
+
+    # forcing verbose still reads everything that is not static
+    static = _registers(block for block in device.profile.get_registers_verbose() if block.static)
+    assert set(device.read_harvest_data(True)) == verbose - static
+
+
+def test_read_harvest_data_static_registers_once_per_connection():
+    tcp_conf = IComFactory.parse_connection_config_from_dict(cfg.TCP_CONFIG)
+    device = ModbusTCP(tcp_conf[1:])
+    reads = []
+
+    def read_registers(operation, address, size):
+        reads.append(address)
+        return [1 for _ in range(size)]
+
+    device.read_registers = read_registers
+    static = [block.start_register for block in device.profile.get_registers_verbose() if block.static]
+    assert len(static) > 0
+
+    with patch.object(device, '_open', return_value=True):
+        device.connect()
+    harvest = device.read_harvest_data(True)
+    assert all(start in reads and start in harvest for start in static)
+
+    # cached for the rest of the connection
+    reads.clear()
+    harvest = device.read_harvest_data(True)
+    assert not any(start in reads or start in harvest for start in static)
+    assert all(device.get_static_registers()[start] == 1 for start in static)
+
+    # read and sent again after a reconnect
+    reads.clear()
+    with patch.object(device, '_open', return_value=True):
+        device.connect()
+    harvest = device.read_harvest_data(True)
+    assert all(start in reads and start in harvest for start in static)
+
+
+def test_read_harvest_data_merges_intervals():
+    tcp_conf = IComFactory.parse_connection_config_from_dict(cfg.TCP_CONFIG)
+    device = ModbusTCP(tcp_conf[1:])
+    reads = []
+
+    def read_registers(operation, address, size):
+        reads.append((operation, address, size))
+        return [address + i for i in range(size)]
+
+    device.read_registers = read_registers
+    harvest = device.read_harvest_data(True)
+
+    assert len(reads) < len(device.profile.get_registers_verbose())
+    assert all(size <= 125 for _, _, size in reads)
+    # every register gets its own value and the gap registers are dropped
+    assert set(harvest) == _registers(device.profile.get_registers_verbose())
+    assert all(value == register for register, value in harvest.items())
+
+
+def test_read_harvest_data_skips_failed_reads():
+    tcp_conf = IComFactory.parse_connection_config_from_dict(cfg.TCP_CONFIG)
+    device = ModbusTCP(tcp_conf[1:])
+
+    def read_registers(operation, address, size):
+        return [] if address == 40000 else [address + i for i in range(size)]
+
+    device.read_registers = read_registers
+    harvest = device.read_harvest_data(True)
+    assert 40000 not in harvest
+    assert 40069 in harvest
+    # the values of the failed block are left out, the others stay at their registers
+    assert all(value == register for register, value in harvest.items())
+
+
+def test_read_harvest_data_splits_rejected_reads():
+    tcp_conf = IComFactory.parse_connection_config_from_dict(cfg.TCP_CONFIG)
+    device = ModbusTCP(tcp_conf[1:])
+    starts = {block.start_register for block in device.profile.get_registers_verbose()}
+    reads = []
+
+    def read_registers(operation, address, size):
+        reads.append(address)
+        # the device only accepts reads that start at one of the intervals of the profile and have no gap
+        if address not in starts or any(address < s < address + size for s in starts):
+            raise ExceptionResponseError("illegal data address")
+        return [address + i for i in range(size)]
+
+    device.read_registers = read_registers
+    merged = device.read_planner.plan(device.profile.get_registers_verbose())
+    assert any(len(block.intervals) > 1 for block in merged)
+
+    first = device.read_harvest_data(True)
+    assert set(first) < _registers(device.profile.get_registers_verbose())
+
+    # the rejected reads are split into their intervals from the next harvest on
+    reads.clear()
+    harvest = device.read_harvest_data(True)
+    static = _registers(block for block in device.profile.get_registers_verbose() if block.static)
+    assert set(harvest) | static == _registers(device.profile.get_registers_verbose())
+    assert all(value == register for register, value in harvest.items())
+
+
+def test_profile_max_gap():
+    profile = InverterProfiles().get(cfg.TCP_CONFIG["type"])
+    assert profile.max_gap is None
+
+    definition = {
+        "name": "gapless", "version": "0.1", "verbose_always": False, "model_group": "test",
+        "display_name": "Gapless", "protocol": "modbus", "description": "", "max_gap": 0,
+        "registers_verbose": [], "registers": [],
+    }
+    with patch.object(InverterProfiles, "get", return_value=InverterProfile(definition)):
+        device = ModbusTCP(IComFactory.parse_connection_config_from_dict(cfg.TCP_CONFIG)[1:])
+    assert device.read_planner.max_gap == 0
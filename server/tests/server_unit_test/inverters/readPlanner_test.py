@@ -0,0 +1,82 @@
+from server.inverters.readPlanner import HarvestLayout, ReadPlanner
+from server.inverters.supported_inverters.profiles import RegisterInterval
+
+
+def _blocks(plan) -> list:
+    return [(block.operation, block.start_register, block.size) for block in plan]
+
+
+def test_merge_adjacent_and_small_gaps():
+    planner = ReadPlanner(max_gap=4)
+    intervals = [
+        RegisterInterval(3, 40000, 69),
+        RegisterInterval(3, 40069, 33),
+        RegisterInterval(3, 40106, 3),
+        RegisterInterval(3, 40121, 70),
+    ]
+    # 40102 to 40106 is within the gap, 40109 to 40121 is not
+    assert _blocks(planner.plan(intervals)) == [(3, 40000, 109), (3, 40121, 70)]
+
+
+def test_max_registers():
+    planner = ReadPlanner(max_gap=100)
+    intervals = [RegisterInterval(3, 0, 100), RegisterInterval(3, 100, 26), RegisterInterval(3, 126, 10)]
+    assert _blocks(planner.plan(intervals)) == [(3, 0, 100), (3, 100, 36)]
+
+
+def test_overlap_and_order():
+    planner = ReadPlanner()
+    intervals = [RegisterInterval(3, 32085, 1), RegisterInterval(3, 32000, 125), RegisterInterval(3, 32064, 2)]
+    plan = planner.plan(intervals)
+    assert _blocks(plan) == [(3, 32000, 125)]
+    assert len(plan[0].intervals) == 3
+
+
+def test_operations_and_static_are_not_merged():
+    planner = ReadPlanner()
+    intervals = [
+        RegisterInterval(3, 0, 10, static=True),
+        RegisterInterval(3, 10, 10),
+        RegisterInterval(4, 20, 10),
+    ]
+    assert _blocks(planner.plan(intervals)) == [(3, 0, 10), (3, 10, 10), (4, 20, 10)]
+
+
+def test_layout_scatter():
+    planner = ReadPlanner()
+    layout = planner.layout([RegisterInterval(3, 10, 2), RegisterInterval(3, 14, 1), RegisterInterval(4, 10, 1)])
+    assert layout.addresses == (10, 11, 14)
+
+    layout.clear()
+    layout.blocks[0].scatter([1, 2, 3, 4, 5], layout.buffer)
+    assert layout.harvest(False) == {10: 1, 11: 2, 14: 5}
+
+    # a block that was not read leaves its registers missing instead of shifting the others
+    layout.clear()
+    layout.blocks[1].scatter([7], layout.buffer)
+    assert layout.buffer == [7, HarvestLayout.MISSING, HarvestLayout.MISSING]
+    assert layout.harvest(False) == {10: 7}
+
+
+def test_plan_is_cached():
+    planner = ReadPlanner()
+    intervals = [RegisterInterval(3, 0, 10)]
+    assert planner.plan(intervals) is planner.plan([RegisterInterval(3, 0, 10)])
+
+
+def test_split_rejected_block():
+    planner = ReadPlanner(max_gap=4)
+    intervals = [RegisterInterval(3, 0, 10), RegisterInterval(3, 12, 2), RegisterInterval(3, 30, 1)]
+    layout = planner.layout(intervals)
+    assert _blocks(layout.blocks) == [(3, 0, 14), (3, 30, 1)]
+
+    assert planner.split(layout.blocks[0])
+    # a block of one interval can not be split
+    assert not planner.split(layout.blocks[1])
+
+    # the split is remembered for the layouts compiled later
+    split = planner.layout(intervals)
+    assert split is not layout
+    assert _blocks(split.blocks) == [(3, 0, 10), (3, 12, 2), (3, 30, 1)]
+    assert split.addresses == layout.addresses
+    assert planner.layout(intervals) is split
@@ -298,4 +298,88 @@ def test_update_from_backend(settings:Settings, com):
     }, ChangeSource.BACKEND)
     assert called
     assert settings.harvest.endpoints == ["https://backend.com"]
-    assert settings.devices.connections == [com.get_config()]
\ No newline at end of file
+    assert settings.devices.connections == [com.get_config()]
+def test_harvest_sample_period(settings:Settings):
+    assert settings.harvest.sample_period_ms == settings.harvest.DEFAULT_SAMPLE_PERIOD_MS
+    assert settings.harvest.SAMPLE_PERIOD_MS not in settings.harvest.to_dict()
+
+    settings.update_from_dict({
+        settings.SETTINGS: {
+            settings.harvest.HARVEST: {
+                settings.harvest.SAMPLE_PERIOD_MS: 5000
+            }
+        }
+    }, ChangeSource.BACKEND)
+    assert settings.harvest.sample_period_ms == 5000
+    assert settings.harvest.to_dict()[settings.harvest.SAMPLE_PERIOD_MS] == 5000
+
+def test_harvest_sample_period_invalid(settings:Settings):
+    for period_ms in [0, -1000, 1]:
+        settings.harvest.set_sample_period_ms(period_ms, ChangeSource.BACKEND)
+        assert settings.harvest.sample_period_ms == settings.harvest.MIN_SAMPLE_PERIOD_MS
+
+    for period_ms in ["1000", 1000.5, True]:
+        settings.harvest.set_sample_period_ms(period_ms, ChangeSource.BACKEND)
+        assert settings.harvest.sample_period_ms == settings.harvest.DEFAULT_SAMPLE_PERIOD_MS
+
+    settings.harvest.set_verbose_refresh_cycles(-1, ChangeSource.BACKEND)
+    assert settings.harvest.verbose_refresh_cycles == 0
+
+def test_harvest_delta_encoding(settings:Settings):
+    assert not settings.harvest.delta_encoding
+    assert settings.harvest.DELTA_ENCODING not in settings.harvest.to_dict()
+
+    settings.harvest.set_delta_encoding(True, ChangeSource.LOCAL)
+    assert settings.harvest.delta_encoding
+    assert settings.harvest.to_dict()[settings.harvest.DELTA_ENCODING] is True
+
+def test_harvest_flush_policy(settings:Settings):
+    defaults = (settings.harvest.DEFAULT_FLUSH_MAX_AGE_MS, settings.harvest.DEFAULT_FLUSH_MAX_BYTES)
+    assert settings.harvest.flush_policy("https://example.com") == defaults
+    assert settings.harvest.FLUSH not in settings.harvest.to_dict()
+
+    settings.harvest.set_flush_policy("https://example.com", 60000, 1024, ChangeSource.LOCAL)
+    assert settings.harvest.flush_policy("https://example.com") == (60000, 1024)
+    assert settings.harvest.flush_policy("https://test.com") == defaults
+    assert settings.harvest.to_dict()[settings.harvest.FLUSH] == {
+        "https://example.com": {settings.harvest.MAX_AGE_MS: 60000, settings.harvest.MAX_BYTES: 1024}
+    }
+
+def test_harvest_aligned_sampling(settings:Settings):
+    assert not settings.harvest.aligned_sampling
+    assert settings.harvest.ALIGNED_SAMPLING not in settings.harvest.to_dict()
+
+    settings.harvest.set_aligned_sampling(True, ChangeSource.LOCAL)
+    assert settings.harvest.aligned_sampling
+    assert settings.harvest.to_dict()[settings.harvest.ALIGNED_SAMPLING] is True
+
+def test_harvest_verbose_refresh_cycles(settings:Settings):
+    assert settings.harvest.verbose_refresh_cycles == settings.harvest.DEFAULT_VERBOSE_REFRESH_CYCLES
+    assert settings.harvest.VERBOSE_REFRESH_CYCLES not in settings.harvest.to_dict()
+
+    settings.harvest.set_verbose_refresh_cycles(0, ChangeSource.LOCAL)
+    assert settings.harvest.verbose_refresh_cycles == 0
+    assert settings.harvest.to_dict()[settings.harvest.VERBOSE_REFRESH_CYCLES] == 0
+
+def test_harvest_compression(settings:Settings):
+    assert settings.harvest.compression("https://example.com") == (None, settings.harvest.DEFAULT_COMPRESSION_LEVEL)
+    assert settings.harvest.COMPRESSION not in settings.harvest.to_dict()
+
+    settings.harvest.set_compression("https://example.com", "deflate", 9, ChangeSource.LOCAL)
+    assert settings.harvest.compression("https://example.com") == ("deflate", 9)
+    assert settings.harvest.compression("https://test.com") == (None, settings.harvest.DEFAULT_COMPRESSION_LEVEL)
+    assert settings.harvest.to_dict()[settings.harvest.COMPRESSION] == {
+        "https://example.com": {settings.harvest.ALGORITHM: "deflate", settings.harvest.LEVEL: 9}
+    }
+
+def test_harvest_compression_level_is_validated(settings:Settings):
+    default = settings.harvest.DEFAULT_COMPRESSION_LEVEL
+    for algorithm, level in [("deflate", 12), ("deflate", -2), ("zstd", 0), ("zstd", 23), ("deflate", "9"),
+                             ("zstd", True)]:
+        settings.harvest.set_compression("https://example.com", algorithm, level, ChangeSource.LOCAL)
+        assert settings.harvest.compression("https://example.com") == (algorithm, default)
+
+    settings.harvest.set_compression("https://example.com", "deflate", -1, ChangeSource.LOCAL)
+    assert settings.harvest.compression("https://example.com") == ("deflate", -1)
+    settings.harvest.set_compression("https://example.com", "zstd", 22, ChangeSource.LOCAL)
+    assert settings.harvest.compression("https://example.com") == ("zstd", 22)
@@ -0,0 +1,101 @@
+import os
+from unittest.mock import patch
+
+from server.spool import Spool
+
+
+def _spool(path, **kwargs):
+    return Spool(str(path), fsync=False, **kwargs)
+
+
+def test_appended_records_are_claimed(tmp_path):
+    spool = _spool(tmp_path)
+    seq = spool.append(b"one")
+    assert spool.read(10) == []
+
+    spool.release(seq)
+    assert spool.read(10) == [(seq, b"one")]
+    # read claims the records
+    assert spool.read(10) == []
+
+
+def test_ack_removes_records(tmp_path):
+    spool = _spool(tmp_path)
+    first = spool.append(b"one")
+    second = spool.append(b"two")
+    assert spool.pending() == 2
+
+    spool.ack(second)
+    assert spool.pending() == 1
+    spool.release(first)
+    assert spool.read(10) == [(first, b"one")]
+    spool.ack(first)
+    assert spool.pending() == 0
+
+
+def test_survives_restart(tmp_path):
+    spool = _spool(tmp_path)
+    first = spool.append(b"one")
+    second = spool.append(b"two")
+    spool.ack(first)
+    spool.close()
+
+    spool = _spool(tmp_path)
+    assert spool.pending() == 1
+    assert spool.read(10) == [(second, b"two")]
+    assert spool.append(b"three") == second + 1
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    spool = _spool(tmp_path)
+    spool.append(b"one")
+    spool.append(b"two")
+    spool.close()
+
+    path = os.path.join(tmp_path, sorted(f for f in os.listdir(tmp_path) if f.endswith(".seg"))[-1])
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+
+    spool = _spool(tmp_path)
+    assert [payload for _, payload in spool.read(10)] == [b"one"]
+    spool.release(spool.append(b"three"))
+    assert [payload for _, payload in spool.read(10)] == [b"three"]
+
+
+def test_delivered_segments_are_removed(tmp_path):
+    spool = _spool(tmp_path, segment_bytes=64)
+    seqs = [spool.append(bytes(40)) for _ in range(4)]
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".seg")]) == 4
+
+    for seq in seqs:
+        spool.ack(seq)
+    assert len([f for f in os.listdir(tmp_path) if f.endswith(".seg")]) == 1
+    assert spool.pending() == 0
+
+
+def test_bounded_size_drops_oldest(tmp_path):
+    spool = _spool(tmp_path, segment_bytes=64, max_bytes=200)
+    seqs = [spool.append(bytes(40)) for _ in range(10)]
+    for seq in seqs:
+        spool.release(seq)
+
+    records = spool.read(100)
+    assert len(records) < 10
+    assert records[-1][0] == seqs[-1]
+    assert sum(os.path.getsize(os.path.join(tmp_path, f)) for f in os.listdir(tmp_path) if f.endswith(".seg")) <= 200
+
+
+def test_dead_letter(tmp_path):
+    spool = _spool(tmp_path)
+    first = spool.append(b"one")
+    second = spool.append(b"two")
+
+    spool.dead_letter(first, b"one")
+    assert spool.pending() == 1
+    assert [payload for _, _, payload in Spool._walk(os.path.join(str(tmp_path), Spool.DEAD_LETTER_FILE))] == [b"one"]
+
+    # the dead letter file is rotated when it is full
+    with patch.object(Spool, "DEAD_LETTER_BYTES", 1):
+        spool.dead_letter(second, b"two")
+    assert spool.pending() == 0
+    assert os.path.exists(os.path.join(str(tmp_path), Spool.DEAD_LETTER_FILE + ".1"))
@@ -0,0 +1,68 @@
+import json
+from array import array
+
+from server.tasks.compactBarn import CompactBarn
+
+
+def test_same_json_as_dict():
+    harvests = {1000: {40000: 1, 40001: 65535}, 2000: {40000: 2, 40001: 0}, 3000: {"W": 1.5, "W_SF": -1}}
+    barn = CompactBarn()
+    for timestamp, harvest in harvests.items():
+        barn[timestamp] = harvest
+
+    assert len(barn) == 3
+    assert barn == harvests
+    assert json.dumps(dict(barn)) == json.dumps(harvests)
+
+
+def test_rows_share_the_address_index():
+    barn = CompactBarn()
+    barn[1000] = {1: 10, 2: 20}
+    barn[2000] = {1: 11, 2: 21}
+    barn[3000] = {5: 50}
+
+    assert len(barn._index) == 2
+    assert type(barn._rows[0]) is array
+    assert barn[3000] == {5: 50}
+
+
+def test_replace_and_delete():
+    barn = CompactBarn()
+    barn[1000] = {1: 10}
+    barn[1000] = {1: 11}
+    assert barn == {1000: {1: 11}}
+
+    del barn[1000]
+    assert len(barn) == 0
+    assert 1000 not in barn
+
+
+def test_delete_keeps_the_rows_of_later_times():
+    barn = CompactBarn()
+    for t in range(5):
+        barn[t * 1000] = {1: t}
+    del barn[1000]
+    barn[2000] = {1: 20}
+
+    assert list(barn) == [0, 2000, 3000, 4000]
+    assert [barn[t][1] for t in barn] == [0, 20, 3, 4]
+    assert barn.get("1000") is None
+
+
+def test_missing_timestamp():
+    barn = CompactBarn()
+    assert barn.get(17) is None
+
+
+def test_read_time():
+    barn = CompactBarn()
+    barn[1000] = {1: 10}
+    barn[2000] = {"W": 1.5}
+    barn.set_read_time(1000, 1005, 1100)
+    barn.set_read_time(2000, 2005, 2100)
+
+    assert barn[1000] == {1: 10, CompactBarn.READ_START: 1005, CompactBarn.READ_END: 1100}
+    assert barn[2000] == {"W": 1.5, CompactBarn.READ_START: 2005, CompactBarn.READ_END: 2100}
+
+    barn[1000] = {1: 11}
+    assert barn[1000] == {1: 11}
@@ -0,0 +1,80 @@
+from server.tasks.harvestCadence import HarvestCadence
+
+
+def test_next_time_compensates_read_duration():
+    cadence = HarvestCadence(1000)
+    assert cadence.on_success(0, 0, 300) == 1000
+    assert cadence.on_success(1000, 1010, 1900) == 2000
+
+
+def test_overrun_skips_to_next_slot():
+    cadence = HarvestCadence(1000)
+    assert cadence.on_success(0, 0, 1000) == 1000
+    assert cadence.on_success(1000, 1000, 3200) == 4000
+
+
+def test_error_backoff_is_separate_from_pacing():
+    cadence = HarvestCadence(1000)
+    assert cadence.on_error(100) == 1100
+    assert cadence.on_error(1100) == 3100
+    assert cadence.backoff_ms == 2000
+
+    assert cadence.on_success(3100, 3100, 3200) == 4100
+    assert cadence.backoff_ms == 0
+    assert cadence.on_error(4100) == 5100
+
+
+def test_backoff_is_capped():
+    cadence = HarvestCadence(1000)
+    while not cadence.at_max_backoff:
+        cadence.on_error(0)
+    assert cadence.backoff_ms == HarvestCadence.MAX_BACKOFF_MS
+    cadence.on_error(0)
+    assert cadence.backoff_ms == HarvestCadence.MAX_BACKOFF_MS
+
+
+def test_stats():
+    cadence = HarvestCadence(1000)
+    assert cadence.stats()["rate_hz"] == 0
+
+    for start in [0, 900, 2000, 2900, 4000]:
+        cadence.on_success(start, start, start + 10)
+
+    stats = cadence.stats()
+    assert stats["samples"] == 5
+    assert stats["rate_hz"] == 1
+    assert stats["jitter_ms"] == 100
+    assert stats["period_ms"] == 1000
+
+
+def test_stats_ignore_intervals_with_errors():
+    cadence = HarvestCadence(1000)
+    cadence.on_success(0, 0, 10)
+    cadence.on_error(1000)
+    cadence.on_success(2000, 2000, 2010)
+    cadence.on_success(3000, 3000, 3010)
+
+    assert cadence.stats()["rate_hz"] == 1
+    assert cadence.stats()["jitter_ms"] == 0
+
+
+def test_aligned_to_wall_clock():
+    cadence = HarvestCadence(10000, aligned=True)
+    assert cadence.on_success(1234, 1234, 1500) == 10000
+    assert cadence.on_success(10000, 10020, 10300) == 20000
+    # an overrun goes to the next boundary after the read
+    assert cadence.on_success(20000, 20000, 31000) == 40000
+
+    assert cadence.sample_time(10020) == 10000
+    assert cadence.sample_time(20000) == 20000
+
+
+def test_offset_and_read_statistics():
+    cadence = HarvestCadence(1000)
+    cadence.on_success(0, 10, 110)
+    cadence.on_success(1000, 1030, 1330)
+
+    stats = cadence.stats()
+    assert stats["offset_ms"] == 20
+    assert stats["offset_jitter_ms"] == 10
+    assert stats["read_ms"] == 200
@@ -0,0 +1,27 @@
+import json
+import pytest
+
+import server.tasks.harvestCompression as harvestCompression
+
+
+def test_deflate_round_trip():
+    data = json.dumps({str(t): {str(r): 1717 for r in range(100)} for t in range(10)}).encode("utf-8")
+    compressed = harvestCompression.compress(data, harvestCompression.DEFLATE, 6)
+    assert len(compressed) < len(data) / 10
+    assert harvestCompression.decompress(compressed, harvestCompression.DEFLATE) == data
+
+
+def test_header_fields():
+    assert harvestCompression.header_fields(harvestCompression.DEFLATE) == {"zip": "DEF"}
+    assert harvestCompression.header_fields(harvestCompression.ZSTD) == {"zip": "ZSTD"}
+
+
+def test_available():
+    assert harvestCompression.available(harvestCompression.DEFLATE)
+    assert harvestCompression.available(harvestCompression.ZSTD) == (harvestCompression.zstandard is not None)
+    assert not harvestCompression.available("lzma")
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        harvestCompression.compress(b"data", "lzma", 1)
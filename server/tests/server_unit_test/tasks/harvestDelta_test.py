@@ -0,0 +1,45 @@
+import json
+
+import server.tasks.harvestDelta as harvestDelta
+
+
+def test_only_changed_registers_after_keyframe():
+    barn = {
+        1000: {"1": 10, "2": 20, "3": 30},
+        2000: {"1": 10, "2": 21, "3": 30},
+        3000: {"1": 11, "2": 21, "3": 30},
+    }
+    assert harvestDelta.encode(barn) == {
+        1000: {"1": 10, "2": 20, "3": 30},
+        2000: {"2": 21},
+        3000: {"1": 11},
+    }
+
+
+def test_periodic_keyframes():
+    barn = {t: {"1": 10} for t in range(5)}
+    encoded = harvestDelta.encode(barn, 2)
+    assert encoded == {0: {"1": 10}, 1: {}, 2: {"1": 10}, 3: {}, 4: {"1": 10}}
+
+
+def test_missing_registers():
+    barn = {
+        1000: {"1": 10, "2": 20},
+        2000: {"1": 10},
+        3000: {"1": 10, "2": 20},
+    }
+    encoded = harvestDelta.encode(barn)
+    assert encoded[2000] == {"2": None}
+    assert encoded[3000] == {"2": 20}
+    assert harvestDelta.decode(encoded) == barn
+
+
+def test_round_trip_through_json():
+    barn = {1000 + t * 1000: {str(r): (r * t) % 7 for r in range(20) if (r + t) % 5 != 0} for t in range(25)}
+    encoded = json.loads(json.dumps(harvestDelta.encode(barn)))
+    decoded = harvestDelta.decode(encoded)
+    assert decoded == {str(t): harvest for t, harvest in barn.items()}
+
+
+def test_header_fields():
+    assert harvestDelta.header_fields() == {"barn": "delta/1", "keyframe_interval": harvestDelta.KEYFRAME_INTERVAL}
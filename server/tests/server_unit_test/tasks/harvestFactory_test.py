@@ -0,0 +1,40 @@
+from unittest.mock import MagicMock
+from server.blackboard import BlackBoard
+from server.tasks.harvest import Harvest, HarvestAsync
+from server.tasks.harvestFactory import HarvestFactory
+
+
+def test_harvest_per_device_is_staggered():
+    bb = BlackBoard()
+    HarvestFactory(bb)
+
+    devices = [MagicMock() for _ in range(3)]
+    for i, device in enumerate(devices):
+        device.is_open.return_value = True
+        device.get_config.return_value = {"host": str(i)}
+        bb.devices.add(device)
+
+    harvests = [t for t in bb.purge_tasks() if isinstance(t, Harvest)]
+    assert [h.device for h in harvests] == devices
+
+    times = [h.get_time() for h in harvests]
+    assert times[1] - times[0] >= HarvestFactory.STAGGER_MS
+    assert times[2] - times[1] >= HarvestFactory.STAGGER_MS
+
+
+def test_async_device_gets_async_harvest():
+    bb = BlackBoard()
+    HarvestFactory(bb)
+
+    device = MagicMock()
+    device.is_open.return_value = True
+    device.supports_async.return_value = True
+    bb.devices.add(device)
+    other = MagicMock()
+    other.is_open.return_value = True
+    other.get_config.return_value = {"host": "other"}
+    bb.devices.add(other)
+
+    harvests = {h.device: h for h in bb.purge_tasks() if isinstance(h, Harvest)}
+    assert isinstance(harvests[device], HarvestAsync)
+    assert not isinstance(harvests[other], HarvestAsync)
@@ -0,0 +1,48 @@
+from server.tasks.harvestFlush import EndpointBarn
+
+
+def test_flush_on_age():
+    barn = EndpointBarn("http://localhost")
+    assert not barn.should_flush(100000, 10000, 1000000)
+
+    barn.add(1000, {1: 1})
+    assert not barn.should_flush(10999, 10000, 1000000)
+    assert barn.should_flush(11000, 10000, 1000000)
+
+
+def test_flush_on_size():
+    barn = EndpointBarn("http://localhost")
+    barn.add(1000, {register: 0 for register in range(10)})
+    assert barn.bytes == EndpointBarn.BYTES_PER_HARVEST + 10 * EndpointBarn.BYTES_PER_REGISTER
+    assert not barn.should_flush(1000, 10000, barn.bytes + 1)
+    assert barn.should_flush(1000, 10000, barn.bytes)
+
+
+def test_take_empties_the_barn():
+    barn = EndpointBarn("http://localhost")
+    barn.add(1000, {1: 1})
+    assert barn.take() == {1000: {1: 1}}
+    assert len(barn.barn) == 0
+    assert barn.bytes == 0
+
+
+def test_flush_age_follows_latency():
+    barn = EndpointBarn("http://localhost")
+    assert barn.flush_age_ms(10000) == 10000
+
+    barn.add_latency(200)
+    assert barn.flush_age_ms(10000) == 2000
+
+    # smoothed and bounded by the max age
+    barn.add_latency(5200)
+    assert barn.latency_ms == 1200
+    assert barn.flush_age_ms(10000) == 10000
+
+
+def test_flush_age_has_a_lower_bound():
+    barn = EndpointBarn("http://localhost")
+    barn.add_latency(5)
+    assert barn.flush_age_ms(10000) == EndpointBarn.MIN_AGE_MS
+
+    # a max age below the bound is kept
+    assert barn.flush_age_ms(500) == 500
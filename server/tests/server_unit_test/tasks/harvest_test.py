@@ -1,7 +1,13 @@
+import asyncio
+import base64
+import inspect
+import json
+import threading
 import server.tasks.harvest as harvest
 import server.tasks.harvestTransport as harvestTransport
+import server.tasks.harvestDelta as harvestDelta
 import server.tasks.openDevicePerpetualTask as oit
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 import pytest
 from server.inverters.supported_inverters.profiles import InverterProfile
 
@@ -38,16 +44,24 @@ def test_execute_harvest():
     t = harvest.Harvest(0, BlackBoard(), mock_inverter,  harvestTransport.DefaultHarvestTransportFactory())
     ret = t.execute(17)
     assert ret is t
-    assert t.barn[17] == registers
-    assert len(t.barn) == 1
+    assert _barn(t)[17] == registers
+    assert len(_barn(t)) == 1
     assert t.time > 17
 
+def _endpoint_barn(t):
+    return next(iter(t.barns.values()))
+
+
+def _barn(t):
+    return _endpoint_barn(t).barn
+
+
 def test_execute_harvest_x10():
-    # in this test we check that we get the desired behavior when we execute a harvest task 10 times
-    # the first 9 times we should get the same task back
-    # the 10th time we should get a list of 2 tasks back
+    # in this test we check that we get the desired behavior when we execute a harvest task every second
+    # the first 10 times we should get the same task back
+    # the 11th time the oldest harvest is 10 seconds old and we should get a list of 2 tasks back
     mock_inverter = Mock()
-    registers = [{"1": 1717 + x} for x in range(10)]
+    registers = [{"1": 1717 + x} for x in range(11)]
     bb = BlackBoard()
     bb.settings.harvest.clear_endpoints(ChangeSource.LOCAL)
     bb.settings.harvest.add_endpoint("http://dret.com:8080", ChangeSource.LOCAL)
@@ -55,128 +69,231 @@ def test_execute_harvest_x10():
     mock_inverter.connect.return_value = True
 
 
-    for i in range(9):
+    for i in range(10):
         mock_inverter.read_harvest_data.return_value = registers[i]
-        ret = t.execute(i)
+        ret = t.execute(i * 1000)
         assert ret is t
-        assert t.barn[i] == registers[i]
-        assert len(t.barn) == i + 1
+        assert _barn(t)[i * 1000] == registers[i]
+        assert len(_barn(t)) == i + 1
 
-    mock_inverter.read_harvest_data.return_value = registers[9]
-    ret = t.execute(17)
-    assert len(t.barn) == 0
+    mock_inverter.read_harvest_data.return_value = registers[10]
+    ret = t.execute(10000)
+    assert len(_barn(t)) == 0
     assert ret is not t
     assert len(ret) == 2
     assert ret[0] is t
     assert ret[1] is not t
-    assert ret[1].barn == {
-        0: registers[0],
-        1: registers[1],
-        2: registers[2],
-        3: registers[3],
-        4: registers[4],
-        5: registers[5],
-        6: registers[6],
-        7: registers[7],
-        8: registers[8],
-        17: registers[9],
-    }
+    assert ret[1].barn == {i * 1000: registers[i] for i in range(11)}
 
     # check that the transport has the correct post_url according to the settings
     assert ret[1].post_url == bb.settings.harvest.endpoints[0]
 
 
-def test_adaptive_backoff():
+def test_execute_harvest_flush_per_endpoint():
     mock_inverter = Mock()
-    mock_inverter.connect.return_value = True
-    
+    mock_inverter.read_harvest_data.return_value = {"1": 1717, "2": 1718}
+    bb = BlackBoard()
+    bb.settings.harvest.clear_endpoints(ChangeSource.LOCAL)
+    bb.settings.harvest.add_endpoint("http://fast", ChangeSource.LOCAL)
+    bb.settings.harvest.add_endpoint("http://small", ChangeSource.LOCAL)
+    bb.settings.harvest.set_flush_policy("http://fast", 2000, 1000000, ChangeSource.LOCAL)
+    bb.settings.harvest.set_flush_policy("http://small", 60000, 100, ChangeSource.LOCAL)
+    t = harvest.Harvest(0, bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+
+    # 2 harvests are 104 estimated bytes
+    assert t.execute(0) is t
+    ret = t.execute(1000)
+    assert [transport.post_url for transport in ret[1:]] == ["http://small"]
+
+    ret = t.execute(2000)
+    assert [transport.post_url for transport in ret[1:]] == ["http://fast"]
+    assert ret[1].barn == {0: {"1": 1717, "2": 1718}, 1000: {"1": 1717, "2": 1718}, 2000: {"1": 1717, "2": 1718}}
+
+
+def test_execute_harvest_flush_adapts_to_upload_latency():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
+    bb = BlackBoard()
+    t = harvest.Harvest(0, bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+
+    t.execute(0)
+    ret = t.execute(1000)
+    assert ret is t
+
+    # a fast upload makes the barns smaller
+    _endpoint_barn(t).add_latency(100)
+    ret = t.execute(2000)
+    assert len(ret) == 2
+    assert len(ret[1].barn) == 3
+
+
+def _create_mock_bb():
     mock_bb = Mock()
     mock_bb.time_ms.return_value = 1000
+    mock_bb.settings = Settings()
+    mock_bb.spool = None
+    mock_bb.settings.harvest.add_endpoint("http://localhost:8080", ChangeSource.LOCAL)
+    return mock_bb
+
+def test_execute_harvest_no_transport():
+    mock_inverter = Mock()
+    mock_inverter.is_terminated.return_value = False
+    registers = [{"1": 1717 + x} for x in range(11)]
+
+    mock_bb = _create_mock_bb()
 
     t = harvest.Harvest(0, mock_bb, mock_inverter,  harvestTransport.DefaultHarvestTransportFactory())
-    t.execute(17)
 
-    assert t.backoff_time == 1966
+    for i in range(len(registers)):
+        mock_inverter.read_harvest_data.return_value = registers[i]
+        t = t.execute(i * 1000)
 
-    # Mock one failed poll -> We back off by 2 seconds instead of 1
-    t.device.read_harvest_data.side_effect = Exception("mocked exception")
-    t.execute(17)
+    # we should now have issued a transport and the barn should be empty
+    assert len(t) == 2
 
-    assert t.backoff_time == 3932
+    transport = t[0] if type(t[0]) is harvestTransport.HarvestTransport else t[1]
+    t = t[0] if type(t[0]) is harvest.Harvest else t[1]
 
-    # Save the initial minbackoff_time to compare with the actual minbackoff_time later on
-    backoff_time = t.backoff_time
+    assert type(transport) is harvestTransport.HarvestTransport
 
-    # Number of times we want to reach max backoff time, could be anything
-    num_of_lost_connections = 900
+    assert len(_barn(t)) == 0
+    assert len(transport.barn) == 11
+  
 
-    # Now we fail until we reach max backoff time
-    for _i in range(num_of_lost_connections):
-        t.execute(17)
-        backoff_time *= 2
+def test_execute_harvest_follows_sample_period():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
 
-        if backoff_time > 256000:
-            backoff_time = 256000
+    mock_bb = _create_mock_bb()
 
-        assert t.backoff_time == backoff_time
-        assert t.backoff_time <= 256000
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
 
+    # the read ends at 1000, the next sample is on the timeline and not 1000 ms after the read
+    ret = t.execute(17)
+    assert ret is t
+    assert t.time == 1000
+    assert t.cadence.backoff_ms == 0
+
+    mock_bb.settings.harvest.set_sample_period_ms(5000, ChangeSource.LOCAL)
+    t.execute(1000)
+    assert t.time == 6000
 
-def test_adaptive_poll():
+
+def test_execute_harvest_verbose_refresh():
     mock_inverter = Mock()
-    mock_inverter.connect.return_value = True
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
+    mock_inverter.set_verbose_refresh_cycles.return_value = True
 
-    mock_bb = Mock()
-    mock_bb.time_ms.return_value = 1000
+    mock_bb = _create_mock_bb()
+    mock_bb.settings.harvest.set_verbose_refresh_cycles(5, ChangeSource.LOCAL)
 
     t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+
+    # only the first harvest reads all verbose registers, the device spreads them over the following harvests
     t.execute(17)
+    mock_inverter.set_verbose_refresh_cycles.assert_called_with(5)
+    mock_inverter.read_harvest_data.assert_called_with(force_verbose=True)
+    t.execute(1000)
+    mock_inverter.read_harvest_data.assert_called_with(force_verbose=False)
 
-    assert t.backoff_time == 1966
 
-    t.device.read_harvest_data.side_effect = Exception("mocked exception")
-    t.backoff_time = t.max_backoff_time
-    t.execute(17)
+def test_execute_harvest_async():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data_async = AsyncMock(return_value={"1": 1717})
+
+    mock_bb = _create_mock_bb()
+
+    t = harvest.HarvestAsync(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+    assert inspect.iscoroutinefunction(t.execute)
+
+    ret = asyncio.run(t.execute(17))
+    assert ret is t
+    assert t.time == 1000
+    assert 17 in t.barns[next(iter(t.barns))].barn
+    mock_inverter.read_harvest_data.assert_not_called()
+
+    mock_inverter.read_harvest_data_async.side_effect = Exception("mocked exception")
+    asyncio.run(t.execute(1000))
+    assert t.cadence.backoff_ms == harvest.HarvestCadence.MIN_BACKOFF_MS
+
+
+def test_execute_harvest_async_spools_off_the_event_loop():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data_async = AsyncMock(return_value={"1": 1717})
+    mock_inverter.is_open.return_value = False
+    transport = Mock()
+    threads = []
+    transport.spool.side_effect = lambda source: threads.append(threading.get_ident())
+
+    mock_bb = _create_mock_bb()
+    t = harvest.HarvestAsync(0, mock_bb, mock_inverter, Mock(return_value=transport))
+    next(iter(t.barns.values())).add(17, {"1": 1717})
 
-    assert t.backoff_time == 256000
+    async def execute():
+        return threading.get_ident(), await t.execute(1000)
 
-    t.device.read_harvest_data.side_effect = None
+    loop_thread, ret = asyncio.run(execute())
+    assert ret == [transport]
+    assert len(threads) == 1
+    assert threads[0] != loop_thread
+    assert t._unspooled == []
+
+
+def test_execute_harvest_reports_bus():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
+    mock_inverter.get_bus_stats.return_value = {"port": "/dev/ttyUSB0", "utilisation": 0.5}
+
+    bb = BlackBoard()
+    t = harvest.Harvest(0, bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
     t.execute(17)
+    assert bb.scheduler_metrics.to_dict()["buses"] == {"/dev/ttyUSB0": {"port": "/dev/ttyUSB0", "utilisation": 0.5}}
 
-    assert t.backoff_time == 230400.0
 
+def test_execute_harvest_aligned():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
 
-def _create_mock_bb():
-    mock_bb = Mock()
-    mock_bb.time_ms.return_value = 1000
-    mock_bb.settings = Settings()
-    mock_bb.settings.harvest.add_endpoint("http://localhost:8080", ChangeSource.LOCAL)
-    return mock_bb
+    mock_bb = _create_mock_bb()
+    mock_bb.time_ms.side_effect = [12345, 12400]
+    mock_bb.settings.harvest.set_sample_period_ms(10000, ChangeSource.LOCAL)
+    mock_bb.settings.harvest.set_aligned_sampling(True, ChangeSource.LOCAL)
 
-def test_execute_harvest_no_transport():
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+    t.execute(12340)
+
+    # the harvest is stored under the boundary with the actual read times
+    assert _barn(t)[10000] == {"1": 1717, "read_start": 12345, "read_end": 12400}
+    assert t.time == 20000
+
+
+def test_execute_harvest_overrun_skips_missed_periods():
     mock_inverter = Mock()
-    mock_inverter.is_terminated.return_value = False
-    registers = [{"1": 1717 + x} for x in range(10)]
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
 
     mock_bb = _create_mock_bb()
+    mock_bb.time_ms.return_value = 3500
 
-    t = harvest.Harvest(0, mock_bb, mock_inverter,  harvestTransport.DefaultHarvestTransportFactory())
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
 
-    for i in range(len(registers)):
-        mock_inverter.read_harvest_data.return_value = registers[i]
-        t = t.execute(i)
+    t.execute(17)
+    assert t.time == 4000
 
-    # we should now have issued a transport and the barn should be empty
-    assert len(t) == 2
 
-    transport = t[0] if type(t[0]) is harvestTransport.HarvestTransport else t[1]
-    t = t[0] if type(t[0]) is harvest.Harvest else t[1]
+def test_execute_harvest_reports_cadence():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
 
-    assert type(transport) is harvestTransport.HarvestTransport
+    mock_bb = _create_mock_bb()
+
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+    t.execute(17)
+
+    device, stats = mock_bb.scheduler_metrics.set_harvest_cadence.call_args.args
+    assert device == str(mock_inverter.get_config())
+    assert stats["samples"] == 1
+    assert stats["period_ms"] == 1000
 
-    assert len(t.barn) == 0
-    assert len(transport.barn) == 10
-  
 
 def test_execute_harvest_incremental_backoff_increasing():
     mock_inverter = Mock()
@@ -188,14 +305,14 @@ def test_execute_harvest_incremental_backoff_increasing():
 
     t = harvest.Harvest(0, mock_bb, mock_inverter,  harvestTransport.DefaultHarvestTransportFactory())
 
-    while t.backoff_time < t.max_backoff_time:
-        old_time = t.backoff_time
+    while not t.cadence.at_max_backoff:
+        old_time = t.cadence.backoff_ms
         ret = t.execute(17)
         assert ret is t
-        assert ret.backoff_time > old_time
-        assert ret.time == 17 + ret.backoff_time
+        assert t.cadence.backoff_ms > old_time
+        assert ret.time == 1000 + t.cadence.backoff_ms
 
-    assert ret.backoff_time == t.max_backoff_time
+    assert t.cadence.backoff_ms == t.cadence.max_backoff_ms
 
 
 def test_execute_harvest_incremental_backoff_reset():
@@ -207,14 +324,17 @@ def test_execute_harvest_incremental_backoff_reset():
 
     t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
 
-    while t.backoff_time < t.max_backoff_time:
+    while not t.cadence.at_max_backoff:
         ret = t.execute(17)
 
+    # the backoff does not slow down the pacing once the device answers again
+    scheduled_time = t.time
     mock_inverter.read_harvest_data.side_effect = None
     mock_inverter.read_harvest_data.return_value = {"1": 1717}
     ret = t.execute(17)
     assert ret is t
-    assert ret.time == 17 + ret.backoff_time
+    assert t.cadence.backoff_ms == 0
+    assert ret.time == scheduled_time + 1000
 
 
 def test_execute_harvest_incremental_backoff_terminate_on_max():
@@ -226,7 +346,7 @@ def test_execute_harvest_incremental_backoff_terminate_on_max():
 
     t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
 
-    while t.backoff_time < t.max_backoff_time:
+    while not t.cadence.at_max_backoff:
         ret = t.execute(17)
 
     # we are now at max backoff time and the inverter should be terminated
@@ -248,23 +368,60 @@ def test_execute_harvest_incremental_backoff_terminate_on_max():
     assert t.execute(17) == []
 
     # Test that the execute method returns a HarvestTransport object when the has some data
-    t.barn[17] = {"1": 1717}
+    _endpoint_barn(t).add(17, {"1": 1717})
     ret = t.execute(17)
     assert type(ret[0]) is harvestTransport.HarvestTransport
 
+
+def test_execute_harvest_static_registers_in_every_barn():
+    mock_inverter = Mock()
+    mock_inverter.is_terminated.return_value = False
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
+    mock_inverter.get_static_registers.return_value = {"30000": 42}
+
+    mock_bb = _create_mock_bb()
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+
+    t.execute(1000)
+    t.execute(2000)
+    barn = t.barns["http://localhost:8080"]
+    # the static registers are added to the first harvest of the barn only
+    assert barn.barn[1000] == {"30000": 42, "1": 1717}
+    assert barn.barn[2000] == {"1": 1717}
+
+    barn.take()
+    t.execute(3000)
+    assert barn.barn[3000] == {"30000": 42, "1": 1717}
+
+
 def test_max_backoftime_leq_than_max():
-    registers = [{"1": 1717 + x} for x in range(10)]
     mock_inverter = Mock()
-    mock_inverter.read_harvest_data.return_value = registers[0]
+    mock_inverter.read_harvest_data.side_effect = Exception("read failed")
     mock_inverter.is_terminated.return_value = False
-    
+
     mock_bb = _create_mock_bb()
     mock_bb.time_ms.return_value = 999999999999999999
 
     t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
 
-    t.execute(17)  # this will cause a really long elapsed time
-    assert t.backoff_time <= t.max_backoff_time
+    for i in range(20):
+        t.execute(17)  # this will cause a really long elapsed time
+        assert t.cadence.backoff_ms <= t.cadence.max_backoff_ms
+
+
+def test_execute_harvest_zero_sample_period():
+    mock_inverter = Mock()
+    mock_inverter.read_harvest_data.return_value = {"1": 1717}
+    mock_inverter.is_terminated.return_value = False
+
+    mock_bb = _create_mock_bb()
+    mock_bb.settings.harvest.set_sample_period_ms(0, ChangeSource.BACKEND)
+
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+    t = t.execute(17)
+
+    assert t.time > 17
+    assert t.cadence.period_ms == mock_bb.settings.harvest.MIN_SAMPLE_PERIOD_MS
 
 
 @pytest.fixture
@@ -290,12 +447,117 @@ def test_data_harvest_transport_jwt(mock_chip_class):
     mock_chip_instance = mock_chip_class.return_value.__enter__.return_value
     mock_chip_instance.build_jwt.return_value = {str(barn), inverter_type}
 
-    instance = harvestTransport.HarvestTransport(0, {}, barn, inverter_type)
+    instance = harvestTransport.HarvestTransport(0, BlackBoard(), barn, inverter_type)
     jwt = instance._data()
 
     mock_chip_instance.build_jwt.assert_called_once_with(instance.barn, "", 5)
     assert jwt == {str(barn), inverter_type}
 
+
+@patch("server.crypto.crypto.Chip", autospec=True)
+def test_data_harvest_transport_jwt_delta(mock_chip_class):
+    barn = {1000: {"1": 1717, "2": 1}, 2000: {"1": 1717, "2": 2}}
+
+    mock_chip_instance = mock_chip_class.return_value.__enter__.return_value
+    bb = BlackBoard()
+    bb.settings.harvest.set_delta_encoding(True, ChangeSource.LOCAL)
+
+    instance = harvestTransport.HarvestTransport(0, bb, barn, "test")
+    instance._data()
+
+    mock_chip_instance.build_jwt.assert_called_once_with(
+        {1000: {"1": 1717, "2": 1}, 2000: {"2": 2}}, "", 5, harvestDelta.header_fields())
+
+@patch("server.crypto.crypto.Chip", autospec=True)
+def test_data_harvest_transport_jwt_compressed(mock_chip_class):
+    import server.tasks.harvestCompression as harvestCompression
+    barn = {1000: {"1": 1717, "2": 1}}
+
+    mock_chip_instance = mock_chip_class.return_value.__enter__.return_value
+    bb = BlackBoard()
+    bb.settings.harvest.set_compression("http://localhost/data", harvestCompression.DEFLATE, 9, ChangeSource.LOCAL)
+
+    instance = harvestTransport.HarvestTransport(0, bb, barn, "test")
+    instance.post_url = "http://localhost/data"
+    instance._data()
+
+    payload, name, retries, header_fields = mock_chip_instance.build_jwt.call_args.args
+    assert header_fields == {"zip": "DEF"}
+    assert json.loads(harvestCompression.decompress(payload, harvestCompression.DEFLATE)) == {"1000": {"1": 1717, "2": 1}}
+
+
+@patch("server.crypto.crypto.Chip", autospec=True)
+def test_data_harvest_transport_encoding_error_is_not_retried(mock_chip_class):
+    import server.tasks.harvestCompression as harvestCompression
+    mock_chip_instance = mock_chip_class.return_value.__enter__.return_value
+    bb = BlackBoard()
+    bb.settings.harvest.set_compression("http://localhost/data", harvestCompression.DEFLATE, 9, ChangeSource.LOCAL)
+
+    instance = harvestTransport.HarvestTransport(0, bb, {1000: {"1": 1717}}, "test")
+    instance.post_url = "http://localhost/data"
+    with patch.object(harvestCompression, "compress", side_effect=ValueError("bad level")):
+        with pytest.raises(ValueError):
+            instance._data()
+    mock_chip_instance.build_jwt.assert_not_called()
+    assert bb.chip_death_count == 0
+
+
+def _base64_url_decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@patch("server.crypto.crypto.Chip", autospec=True)
+def test_timed_signature_header_follows_encoding(mock_chip_class):
+    import server.tasks.harvestCompression as harvestCompression
+    mock_chip_instance = mock_chip_class.return_value.__enter__.return_value
+    mock_chip_instance.build_header.return_value = {"alg": "ES256"}
+    mock_chip_instance.get_signature.return_value = b"signature"
+
+    bb = BlackBoard()
+    profile = Mock()
+    profile.name = "huawei"
+    harvestTransport.HarvestTransportTimedSignature._headers.clear()
+    instance = harvestTransport.HarvestTransportTimedSignature(0, bb, {1000: {"1": 1717}}, profile)
+    instance.post_url = "http://localhost/data"
+
+    header, payload, _ = instance._data().split(".")
+    assert "zip" not in json.loads(_base64_url_decode(header))
+    assert json.loads(_base64_url_decode(payload)) == {"1000": {"1": 1717}}
+
+    bb.settings.harvest.set_compression("http://localhost/data", harvestCompression.DEFLATE, 9, ChangeSource.LOCAL)
+    header, payload, _ = instance._data().split(".")
+    assert json.loads(_base64_url_decode(header))["zip"] == "DEF"
+    assert mock_chip_instance.get_signature.call_count == 2
+    harvestTransport.HarvestTransportTimedSignature._headers.clear()
+
+
+@patch("server.crypto.crypto.Chip", autospec=True)
+def test_timed_signature_header_per_encoding(mock_chip_class):
+    import server.tasks.harvestCompression as harvestCompression
+    mock_chip_instance = mock_chip_class.return_value.__enter__.return_value
+    mock_chip_instance.build_header.side_effect = lambda model: {"alg": "ES256"}
+    mock_chip_instance.get_signature.side_effect = lambda data: data.encode("utf-8")
+
+    bb = BlackBoard()
+    bb.settings.harvest.set_compression("http://compressed/data", harvestCompression.DEFLATE, 9, ChangeSource.LOCAL)
+    profile = Mock()
+    profile.name = "huawei"
+    harvestTransport.HarvestTransportTimedSignature._headers.clear()
+
+    for _ in range(3):
+        for endpoint in ["http://plain/data", "http://compressed/data"]:
+            instance = harvestTransport.HarvestTransportTimedSignature(0, bb, {1000: {"1": 1717}}, profile)
+            instance.post_url = endpoint
+            header, _, signature = instance._data().split(".")
+            # the signature is the signed header
+            assert _base64_url_decode(signature).decode("utf-8") == header
+            assert ("zip" in json.loads(_base64_url_decode(header))) == (endpoint == "http://compressed/data")
+
+    # alternating endpoints do not renew the headers
+    assert mock_chip_instance.get_signature.call_count == 2
+    harvestTransport.HarvestTransportTimedSignature._headers.clear()
+
+
 def test_on_200():
     # just make the call for now
     response = Mock()
@@ -310,3 +572,38 @@ def test_on_error():
     instance = harvestTransport.HarvestTransport(0, {}, {}, "huawei")
     instance._on_error(response)
 
+
+
+def test_harvest_time_budget_exceeded():
+    mock_inverter = Mock()
+    mock_bb = _create_mock_bb()
+
+    t = harvest.Harvest(0, mock_bb, mock_inverter, harvestTransport.DefaultHarvestTransportFactory())
+    _endpoint_barn(t).add(17, {"1": 1717})
+    assert t.get_time_budget() == harvest.Harvest.TIME_BUDGET_MS
+
+    ret = t.on_time_budget_exceeded(1000)
+    assert mock_inverter.disconnect.call_count == 1
+    assert type(ret[0]) is oit.DevicePerpetualTask
+    assert ret[0].get_time() == 31000
+    assert type(ret[1]) is harvestTransport.HarvestTransport
+    assert len(_barn(t)) == 0
+
+
+def test_harvest_transport_spools_barn(tmp_path):
+    from server.spool import Spool
+    bb = BlackBoard()
+    bb.spool = Spool(str(tmp_path), fsync=False)
+
+    transport = harvestTransport.HarvestTransport(0, bb, {17: {"1": 1717}}, "huawei")
+    transport.post_url = "http://localhost/data"
+    transport.spool("device")
+    assert bb.spool.pending() == 1
+
+    transport._on_error(Mock())
+    seq, payload = bb.spool.read(1)[0]
+    assert [seq] == transport.spool_seqs
+    assert harvestTransport.parse_spool_record(payload) == ("http://localhost/data", "device", {"17": {"1": 1717}})
+
+    transport._on_200(Mock())
+    assert bb.spool.pending() == 0
@@ -53,10 +53,13 @@ def test_execute_new_inverter_added():
     bb = BlackBoard()
     inverter = MagicMock()
     inverter.connect.return_value = False
+    inverter.get_config.return_value = {"host": "192.168.1.2"}
     task = DevicePerpetualTask(0, bb, inverter)
     
+    # the same device has been opened by another task
     inverter2 = MagicMock()
     inverter2.is_open.return_value = True
+    inverter2.get_config.return_value = {"host": "192.168.1.2"}
     
     bb.devices.add(inverter2)
 
@@ -56,11 +56,13 @@ def test_execute_old_inverter_terminated():
     bb = BlackBoard()
     inverter = MagicMock()
     inverter.connect.return_value = True
-    task = OpenDeviceTask(0, bb, inverter)
-    task.execute(0)
+    inverter.is_open.return_value = False
+    inverter.get_config.return_value = {"host": "192.168.1.2"}
+    bb.devices.lst.append(inverter)
 
     inverter2 = MagicMock()
     inverter2.connect.return_value = True
+    inverter2.get_config.return_value = {"host": "192.168.1.2"}
     task = OpenDeviceTask(0, bb, inverter2)
     task.execute(0)
 
@@ -69,6 +71,24 @@ def test_execute_old_inverter_terminated():
     assert inverter2 in bb.devices.lst
     assert inverter2.connect.called
 
+
+def test_execute_other_inverter_keeps_running():
+    bb = BlackBoard()
+    inverter = MagicMock()
+    inverter.connect.return_value = True
+    inverter.get_config.return_value = {"host": "192.168.1.2"}
+    task = OpenDeviceTask(0, bb, inverter)
+    task.execute(0)
+
+    inverter2 = MagicMock()
+    inverter2.connect.return_value = True
+    inverter2.get_config.return_value = {"host": "192.168.1.3"}
+    task = OpenDeviceTask(0, bb, inverter2)
+    task.execute(0)
+
+    assert not inverter.disconnect.called
+    assert bb.devices.lst == [inverter, inverter2]
+
 def test_retry_on_exception():
     bb = BlackBoard()
     inverter = MagicMock()
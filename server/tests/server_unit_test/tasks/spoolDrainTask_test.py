@@ -0,0 +1,119 @@
+from unittest.mock import Mock, patch
+
+from server.blackboard import BlackBoard
+from server.spool import Spool
+from server.tasks.spoolDrainTask import SpoolDrainTask
+from server.tasks.harvestTransport import spool_record
+
+
+def _bb(tmp_path):
+    bb = BlackBoard()
+    bb.spool = Spool(str(tmp_path), fsync=False)
+    return bb
+
+
+def _add_records(bb, count, source="device"):
+    for i in range(count):
+        seq = bb.spool.append(spool_record("http://localhost/data", {1000 * (i + 1): {"1": i}}, source))
+        bb.spool.release(seq)
+
+
+def _response(status_code):
+    response = Mock()
+    response.status_code = status_code
+    return response
+
+
+def test_no_spool():
+    assert SpoolDrainTask(0, BlackBoard()).execute(0) is None
+
+
+def test_empty_spool(tmp_path):
+    task = SpoolDrainTask(0, _bb(tmp_path))
+    assert task.execute(17) is task
+    assert task.time == 17 + SpoolDrainTask.IDLE_MS
+
+
+@patch("server.tasks.harvestTransport.HarvestTransport._data", return_value="jwt")
+@patch("server.tasks.srcfulAPICallTask.requests.post")
+def test_barns_are_merged(mock_post, mock_data, tmp_path):
+    bb = _bb(tmp_path)
+    _add_records(bb, 3)
+    _add_records(bb, 2, source="other")
+    mock_post.return_value = _response(200)
+
+    task = SpoolDrainTask(0, bb)
+    assert task.execute(17) is task
+    assert mock_post.call_count == 2
+    assert mock_post.call_args.args[0] == "http://localhost/data"
+    assert bb.spool.pending() == 0
+    assert task.time == 17 + SpoolDrainTask.IDLE_MS
+
+
+def test_merge_respects_byte_budget(tmp_path):
+    bb = _bb(tmp_path)
+    _add_records(bb, 5)
+    records = bb.spool.read(10)
+
+    with patch.object(SpoolDrainTask, "BYTE_BUDGET", len(records[0][1]) + len(records[1][1])):
+        uploads = SpoolDrainTask(0, bb)._merge(records)
+    assert [len(upload.seqs) for upload in uploads] == [2, 2, 1]
+    assert uploads[0].barn == {"1000": {"1": 0}, "2000": {"1": 1}}
+
+
+@patch("server.tasks.harvestTransport.HarvestTransport._data", return_value="jwt")
+@patch("server.tasks.srcfulAPICallTask.requests.post")
+def test_failure_backs_off_with_jitter(mock_post, mock_data, tmp_path):
+    bb = _bb(tmp_path)
+    _add_records(bb, 3)
+    _add_records(bb, 1, source="other")
+    mock_post.side_effect = [_response(200), _response(500)]
+
+    task = SpoolDrainTask(0, bb)
+    task.execute(17)
+    assert mock_post.call_count == 2
+    assert bb.spool.pending() == 1
+    assert task.backoff_ms == SpoolDrainTask.MIN_BACKOFF_MS
+    assert 17 + SpoolDrainTask.MIN_BACKOFF_MS / 2 <= task.time <= 17 + SpoolDrainTask.MIN_BACKOFF_MS
+
+    mock_post.side_effect = None
+    mock_post.return_value = _response(500)
+    task.execute(17)
+    assert task.backoff_ms == 2 * SpoolDrainTask.MIN_BACKOFF_MS
+
+    # the backlog is drained once the endpoint is back
+    mock_post.return_value = _response(200)
+    task.execute(17)
+    assert task.backoff_ms == 0
+    assert bb.spool.pending() == 0
+
+
+@patch("server.tasks.harvestTransport.HarvestTransport._data", return_value="jwt")
+@patch("server.tasks.srcfulAPICallTask.requests.post")
+def test_rejected_barn_is_dead_lettered(mock_post, mock_data, tmp_path):
+    bb = _bb(tmp_path)
+    _add_records(bb, 3)
+    # the merged upload is rejected, then the barns are sent one by one and only the second is rejected
+    mock_post.side_effect = [_response(400), _response(200), _response(400), _response(200)]
+
+    task = SpoolDrainTask(0, bb)
+    task.execute(17)
+    assert mock_post.call_count == 4
+    assert bb.spool.pending() == 0
+    assert task.backoff_ms == 0
+    assert (tmp_path / Spool.DEAD_LETTER_FILE).stat().st_size > 0
+
+
+@patch("server.tasks.harvestTransport.HarvestTransport._data", return_value="jwt")
+@patch("server.tasks.srcfulAPICallTask.requests.post")
+def test_throttling_is_retried(mock_post, mock_data, tmp_path):
+    bb = _bb(tmp_path)
+    _add_records(bb, 2)
+    mock_post.return_value = _response(429)
+
+    task = SpoolDrainTask(0, bb)
+    task.execute(17)
+    assert mock_post.call_count == 1
+    assert bb.spool.pending() == 2
+    assert task.backoff_ms == SpoolDrainTask.MIN_BACKOFF_MS
+    assert not (tmp_path / Spool.DEAD_LETTER_FILE).exists()
@@ -30,4 +30,30 @@ def test_inverter(request_data):
     status_code, response = handler.do_get(request_data)
     assert status_code == 200
     response = json.loads(response)
-    assert response == {"test": "test", "status": "open"}
+    assert response == {"test": "test", "id": "", "status": "open"}
+
+
+def test_inverter_by_id(request_data):
+    class OtherDER:
+        def get_config(self):
+            return {"connection": "TCP", "type": "huawei", "host": "10.0.0.2", "port": 502, "address": 1}
+
+        def is_open(self):
+            return False
+
+    request_data.bb.devices.lst.append(OtherDER())
+    request_data.query_params["device"] = "TCP:10.0.0.2:502:1"
+    status_code, response = Handler().do_get(request_data)
+    assert status_code == 200
+    assert json.loads(response)["id"] == "TCP:10.0.0.2:502:1"
+    assert json.loads(response)["status"] == "closed"
+
+    request_data.query_params["device"] = "TCP:10.0.0.3:502:1"
+    status_code, response = Handler().do_get(request_data)
+    assert status_code == 400
+
+
+def test_inverter_no_inverter():
+    status_code, response = Handler().do_get(RequestData(BlackBoard(), {}, {}, {}))
+    assert status_code == 200
+    assert json.loads(response) == {"status": "No inverter"}
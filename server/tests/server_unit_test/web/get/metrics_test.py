@@ -0,0 +1,38 @@
+import pytest
+import json
+from server.web.handler.requestData import RequestData
+from server.web.handler.get.metrics import Handler
+from server.blackboard import BlackBoard
+
+
+@pytest.fixture
+def request_data():
+    return RequestData(BlackBoard(), {}, {}, {})
+
+
+def test_metrics_empty(request_data):
+    status_code, response = Handler().do_get(request_data)
+    assert status_code == 200
+    assert json.loads(response) == {"tasks": {}, "cadence": {}, "buses": {}}
+
+
+def test_metrics(request_data):
+    metrics = request_data.bb.scheduler_metrics
+    metrics.set_state_provider(lambda: {"pending": 3})
+    metrics.add_execution("Harvest", 7, 120, False)
+    metrics.add_execution("Harvest", 1, 80, True)
+
+    status_code, response = Handler().do_get(request_data)
+    assert status_code == 200
+    response = json.loads(response)
+    assert response["pending"] == 3
+
+    harvest = response["tasks"]["Harvest"]
+    assert harvest["exceptions"] == 1
+    assert harvest["duration"]["count"] == 2
+    assert harvest["duration"]["mean"] == 100
+    assert harvest["duration"]["max"] == 120
+    assert harvest["duration"]["buckets"]["100"] == 1
+    assert harvest["duration"]["buckets"]["250"] == 1
+    assert harvest["lateness"]["buckets"]["1"] == 1
+    assert harvest["lateness"]["buckets"]["10"] == 1
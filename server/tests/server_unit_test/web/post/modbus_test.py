@@ -83,4 +83,22 @@ def test_malformed_commands():
     # Pause command without 'duration' field
     post_data_no_duration = {'commands': [{'type': 'pause'}]}
     response_code, response_body = handler.do_post(requestData(post_data_no_duration))
-    assert response_code == 500
\ No newline at end of file
+    assert response_code == 500
+
+def test_do_post_to_device():
+    inverter = Mock()
+    inverter.get_config.return_value = {"connection": "TCP", "host": "10.0.0.1", "port": 502, "address": 1}
+    inverter2 = Mock()
+    inverter2.get_config.return_value = {"connection": "TCP", "host": "10.0.0.1", "port": 502, "address": 2}
+    bb = BlackBoard()
+    bb.devices.add(inverter)
+    bb.devices.add(inverter2)
+
+    post_data = {'commands': [{'type': 'write', 'startingAddress': '10', 'values': ['1']}]}
+
+    response_code, response_body = Handler().do_post(RequestData(bb, {}, {"device": "TCP:10.0.0.1:502:2"}, post_data))
+    assert response_code == 200
+    assert bb.purge_tasks()[0].inverter is inverter2
+
+    response_code, response_body = Handler().do_post(RequestData(bb, {}, {"device": "TCP:10.0.0.1:502:3"}, post_data))
+    assert response_code == 400
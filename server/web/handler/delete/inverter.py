@@ -7,6 +7,7 @@ class Handler(DeleteHandler):
     def schema(self) -> dict:
         return self.create_schema(
             "Delete and remove the inverter, currently this does not affect the bootstrapping process",
+            optional={"device": "string, id of the device, url query parameter (default the first device)"},
             returns={
                 "isTerminated": "bool, True if the inverter is terminated",
                 "isOpen": "bool, True if the inverter is open",
@@ -14,14 +15,16 @@ class Handler(DeleteHandler):
         )
 
     def do_delete(self, data: RequestData):
-        if len(data.bb.ders.lst) > 0:
-            inverter = data.bb.ders.lst[0]
-            inverter.terminate()
-            data.bb.ders.remove(inverter)
+        inverter = self.get_device(data)
+        if inverter is None and "device" in data.query_params:
+            return 400, json.dumps({"error": "unknown device"})
+        if inverter is not None:
+            inverter.disconnect()
+            data.bb.devices.remove(inverter)
 
             data = {
-                "isTerminated": inverter.isTerminated(),
-                "isOpen": inverter.isOpen(),
+                "isTerminated": True,
+                "isOpen": inverter.is_open(),
             }
 
             return 200, json.dumps(data)
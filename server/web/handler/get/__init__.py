@@ -14,3 +14,4 @@ from . import notification
 from . import settings
 from . import state
 
+from . import metrics
@@ -9,11 +9,13 @@ class Handler(GetHandler):
         return {
             "type": "get",
             "description": "Returns the configuration of the running inverter, details depend on the inverter type.",
+            "optional": {"device": "string, id of the device e.g. TCP:192.168.1.10:502:1 (default the first device)"},
             "returns": {
                 "connection": "string, connection type (TCP, RTU)",
                 "type": "string, inverter type (solaredge, huawei, ...)",
                 "host": "string, inverter TCP ip address",
                 "port": "int, inverter TCP port",
+                "id": "string, id of the device",
                 "status": "string, open, closed or No inverter",
             },
         }
@@ -21,9 +23,12 @@ class Handler(GetHandler):
     def do_get(self, data: RequestData):
         config = {"status": "No inverter"}
 
-        if len(data.bb.devices.lst) > 0:
-            der = data.bb.devices.lst[0]
+        der = self.get_device(data)
+        if der is None and "device" in data.query_params:
+            return 400, json.dumps({"error": "unknown device"})
+        if der is not None:
             config = der.get_config()
+            config["id"] = data.bb.devices.device_id(der)
 
             if der.is_open():
                 config["status"] = "open"
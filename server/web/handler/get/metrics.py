@@ -0,0 +1,22 @@
+import json
+from ..handler import GetHandler
+from ..requestData import RequestData
+
+
+class Handler(GetHandler):
+    def schema(self):
+        return {
+            "type": "get",
+            "description": "Returns task scheduler metrics, all times are in milliseconds",
+            "returns": {
+                "tasks": "object, per task class histograms of lateness (start time - scheduled time) and execution duration, and the number of exceptions",
+                "lanes": "object, per lane worker budget, active workers and number of due tasks waiting for a worker",
+                "pending": "int, number of tasks waiting for their scheduled time",
+                "queued": "int, number of due tasks waiting for a worker",
+                "active_workers": "int, number of tasks executing on worker threads",
+                "active_coroutines": "int, number of tasks executing on the event loop",
+            },
+        }
+
+    def do_get(self, data: RequestData):
+        return 200, json.dumps(data.bb.scheduler_metrics.to_dict())
@@ -20,6 +20,7 @@ class RegisterHandler(GetHandler):
                 "size": "int, size of the register to read (default 1)",
                 "type": "string, data type of the register to read (default none)",
                 "endianess": "string, endianess of the register to read little or big, (default little)",
+                "device": "string, id of the device to read from (default the first device)",
             },
             "returns": {
                 "register": "int, address of the register read",
@@ -32,7 +33,10 @@ class RegisterHandler(GetHandler):
     def do_get(self, request_data: RequestData):
         if "address" not in request_data.post_params:
             return 400, json.dumps({"error": "missing address"})
-        if len(request_data.bb.devices.lst) == 0:
+        device = self.get_device(request_data)
+        if device is None:
+            if "device" in request_data.query_params:
+                return 400, json.dumps({"error": "unknown device"})
             return 400, json.dumps({"error": "inverter not initialized"})
 
         raw = bytearray()
@@ -48,7 +52,7 @@ class RegisterHandler(GetHandler):
             )
             raw, value = RegisterValue(
                 address, size, self.get_register_type(), datatype, endianness
-            ).read_value(request_data.bb.devices.lst[0])
+            ).read_value(device)
 
             ret = {
                 "register": address,
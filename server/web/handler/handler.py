@@ -19,6 +19,13 @@ class Handler:
         '''Override to implement the handler'''
         raise NotImplementedError("do not implemented")
 
+    def get_device(self, data: RequestData):
+        '''The device with the id in the device query parameter, the first device when the parameter is not given.
+        None if there is no such device'''
+        if "device" not in data.query_params:
+            return data.bb.devices.get()
+        return data.bb.devices.get_by_id(data.query_params["device"])
+
 
 class PostHandler(Handler):
     '''Base class for post handlers'''
@@ -23,6 +23,9 @@ class Handler(PostHandler):
                     "duration": "(int, required for pause commands) - duration in milliseconds to pause the operation.",
                 }
             },
+            "optional": {
+                "device": "string, id of the device to write to, url query parameter (default the first device)",
+            },
             "returns": {
                 "status": "string, ok or error",
                 "message": "string, error message or success confirmation",
@@ -54,7 +57,10 @@ class Handler(PostHandler):
                 {"status": "bad request", "message": "Missing commands in request"}
             )
 
-        if len(data.bb.devices.lst) == 0:
+        device = self.get_device(data)
+        if device is None and "device" in data.query_params:
+            return 400, json.dumps({"status": "error", "message": "Unknown device"})
+        if device is None:
             return 400, json.dumps(
                 {"status": "error", "message": "No Modbus device initialized"}
             )
@@ -81,7 +87,7 @@ class Handler(PostHandler):
                     return 500, json.dumps({"status": "error", "message": error})
 
             # Add ModbusTask to task queue
-            data.bb.add_task(ModbusWriteTask(data.bb.time_ms() + 100, data.bb, data.bb.devices.lst[0], command_objects))
+            data.bb.add_task(ModbusWriteTask(data.bb.time_ms() + 100, data.bb, device, command_objects))
 
             return 200, json.dumps({"status": "ok"})
         except Exception as e:
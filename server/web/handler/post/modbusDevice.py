@@ -15,7 +15,7 @@ class Handler(PostHandler):
         return self.create_schema(
             "Open an inverter and start harvesting the data",
             required={
-                "connection": "string, type of modbus connection (e.g., 'TCP', 'RTU', 'SOLARMAN', 'SUNSPEC')",
+                "connection": "string, type of modbus connection (e.g., 'TCP', 'TCP_ASYNC', 'RTU', 'SOLARMAN', 'SUNSPEC')",
             },
             optional={
                 "ip": "string, IP address of the inverter (for TCP, SOLARMAN, SUNSPEC)",
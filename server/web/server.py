@@ -35,6 +35,7 @@ class Endpoints:
             "notification/{id}": handler.get.notification.MessageHandler(),
             "settings": handler.get.settings.Handler(),
             "state": handler.get.state.Handler(),
+            "metrics": handler.get.metrics.Handler(),
         }
 
         self.api_post_dict = {